@@ -2,10 +2,203 @@ import os
 from PyQt5 import QtWidgets, uic
 from PyQt5.QtWidgets import QFileDialog ,QApplication 
 from PyQt5.QtCore import QTimer  # Added for progress updates
-from qgis.core import QgsProject, QgsVectorLayer
+from qgis.core import QgsApplication, QgsFeatureRequest, QgsProject, QgsRectangle, QgsTask, QgsVectorLayer
 from .progressBar import create_progress_bar_manager 
+from .style_registry import get_style_registry
+from .working_copy import WorkingCopyCache
+from .profiling import span
+
+
+def open_vector_layer(layer_path, layer_name):
+    """
+    Open and validate a vector layer; safe to call outside the main thread
+
+    :param layer_path: Path to the data source
+    :param layer_name: Name given to the layer
+    :return: The valid QgsVectorLayer, or None
+    """
+    layer = QgsVectorLayer(layer_path, layer_name, 'ogr')
+    if not layer.isValid():
+        return None
+
+    # Let the provider read the header and extent now rather than on first use
+    layer.extent()
+    layer.featureCount()
+    return layer
+
+
+def find_file(folder_path, filename):
+    """
+    Case-insensitive lookup of a file in a folder
+
+    :param folder_path: Folder to search
+    :param filename: File name to find
+    :return: Full path, or None
+    """
+    for candidate in os.listdir(folder_path):
+        if candidate.lower() == filename.lower():
+            return os.path.join(folder_path, candidate)
+    return None
+
+
+def compute_corridor_extent(folder_paths, buffer_distance):
+    """
+    Extent of the cable routes (Arc_itineraire) of the given folders, buffered
+
+    Only the shapefile headers are read, so this is cheap enough for the main thread.
+
+    :param folder_paths: Folders containing Arc_itineraire.shp
+    :param buffer_distance: Distance added around the routes, in layer units
+    :return: QgsRectangle, or None if no route layer was found
+    """
+    extent = None
+    for folder_path in folder_paths:
+        if not folder_path or not os.path.isdir(folder_path):
+            continue
+        route_path = find_file(folder_path, "Arc_itineraire.shp")
+        if route_path is None:
+            continue
+        route_layer = QgsVectorLayer(route_path, "corridor", 'ogr')
+        if not route_layer.isValid():
+            continue
+        if extent is None:
+            extent = QgsRectangle(route_layer.extent())
+        else:
+            extent.combineExtentWith(route_layer.extent())
+
+    return extent.buffered(buffer_distance) if extent is not None else None
+
+
+def restrict_to_extent(layer, filter_rect):
+    """
+    Materialize the features of a layer that intersect an extent into a memory layer
+
+    :param layer: Source QgsVectorLayer
+    :param filter_rect: QgsRectangle to keep
+    :return: Memory QgsVectorLayer with the same name, fields and CRS
+    """
+    before = layer.featureCount()
+    subset = layer.materialize(QgsFeatureRequest().setFilterRect(filter_rect))
+    subset.setName(layer.name())
+    # Memory layer sources differ every session; keep a stable identity for render fingerprints
+    subset.setCustomProperty("mismatch_identifier/source", f"{layer.source()}|{filter_rect.toString()}")
+    print(f"{layer.name()}: {before} features, {subset.featureCount()} within the cable corridor")
+    return subset
+
+
+def open_required_layer(layer_path, layer_name, working_copies=None, filter_rect=None):
+    """
+    Open one input layer, from its indexed working copy if any, restricted to an extent if given
+
+    :param layer_path: Path to the shapefile
+    :param layer_name: Name given to the layer
+    :param working_copies: Optional WorkingCopyCache
+    :param filter_rect: Optional QgsRectangle; only features intersecting it are kept
+    :return: QgsVectorLayer, or None if the layer could not be opened
+    """
+    with span("load_layer", "load", layer=layer_name):
+        layer = None
+        if working_copies is not None:
+            # Indexed copy; conversion only happens when the source changed
+            layer = open_vector_layer(working_copies.prepare(layer_path), layer_name)
+        if layer is None:
+            layer = open_vector_layer(layer_path, layer_name)
+        if layer is None:
+            return None
+
+    if filter_rect is not None:
+        with span("restrict_to_corridor", "load", layer=layer_name):
+            layer = restrict_to_extent(layer, filter_rect)
+    return layer
+
+
+def list_required_layers(folder_path, required_files, is_first_folder=True):
+    """
+    Required shapefiles present in a folder
+
+    :param folder_path: Folder to search
+    :param required_files: File names to load, in group order
+    :param is_first_folder: True for the Avant folder (routes become Arc_itineraire_AV)
+    :return: list of (layer_path, layer_name, order, is_route)
+    """
+    required_order = {f.lower(): index for index, f in enumerate(required_files)}
+    layers = []
+
+    for filename in os.listdir(folder_path):
+        # Check if the file is in the required files list
+        if filename.lower() not in required_order:
+            continue
+
+        layer_name = filename
+        is_route = filename.lower() == "arc_itineraire.shp"
+        # Custom renaming logic
+        if is_route:
+            # Rename Arc_itineraire based on folder
+            layer_name = f"Arc_itineraire_{'AV' if is_first_folder else 'AP'}"
+
+        layers.append((os.path.join(folder_path, filename), layer_name, required_order[filename.lower()], is_route))
+
+    return layers
+
+
+class LayerLoadTask(QgsTask):
+    def __init__(self, layer_path, layer_name, group_name, order, on_finished, working_copies=None,
+                 filter_rect=None):
+        """
+        Background task opening one shapefile
+
+        :param layer_path: Path to the shapefile
+        :param layer_name: Name given to the layer
+        :param group_name: Layer tree group the layer goes into
+        :param order: Position of the layer in its group
+        :param on_finished: Called on the main thread as on_finished(task, result)
+        :param working_copies: Optional WorkingCopyCache providing an indexed copy to load
+        :param filter_rect: Optional QgsRectangle; only features intersecting it are kept
+        """
+        super(LayerLoadTask, self).__init__(f"Loading {layer_name}", QgsTask.CanCancel)
+        self.layer_path = layer_path
+        self.layer_name = layer_name
+        self.group_name = group_name
+        self.order = order
+        self.on_finished = on_finished
+        self.working_copies = working_copies
+        self.filter_rect = filter_rect
+        self.layer = None
+        self.error = None
+
+    def run(self):
+        """Runs in a worker thread: only open and validate the layer here."""
+        if self.isCanceled():
+            return False
+
+        layer = open_required_layer(self.layer_path, self.layer_name, self.working_copies, self.filter_rect)
+        if layer is None:
+            self.error = f"Failed to load layer: {os.path.basename(self.layer_path)}"
+            return False
+
+        if self.isCanceled():
+            return False
+
+        # The project lives on the main thread, hand the layer over to it
+        layer.moveToThread(QgsApplication.instance().thread())
+        self.layer = layer
+        return True
+
+    def finished(self, result):
+        """Runs on the main thread once run() returned or the task was cancelled."""
+        self.on_finished(self, result)
+
 
 class FileLoader(QtWidgets.QDialog):
+    # Shapefiles loaded from each folder, in the order they appear in their group
+    REQUIRED_FILES = [
+        "BD_PARCELLAIRE_batiment.shp",
+        "BD_PARCELLAIRE_parcelle.shp",
+        "Cadastre,_Polygone.shp",
+        "Cadastre,_Polyligne.shp",
+        "Arc_itineraire.shp"
+    ]
+
     def __init__(self, parent=None):
         super(FileLoader, self).__init__(parent)
         uic.loadUi('Mismatch_Identifier_Plugin_dialog_base.ui', self)
@@ -15,10 +208,22 @@ class FileLoader(QtWidgets.QDialog):
         self.folder1_path = ""
         self.folder2_path = ""
         self.style_folder_path = ""
+        # Optional indexed working copies of the inputs: None, "gpkg" or "qix"
+        self.working_copy_mode = None
+        self.working_copy_folder = "Working_Copies"
+        # Load reference layers only within the cable corridor (routes extent + buffer, meters)
+        self.corridor_mode = False
+        self.corridor_buffer = 5
         progress_bar = parent.findChild(QtWidgets.QProgressBar, 'progressBar_1')
         self.progress_manager = create_progress_bar_manager(progress_bar)
-        
-        
+
+        # Load tasks still running; references keep them alive until finished
+        self._load_tasks = []
+        self._load_errors = []
+        self._working_copies = None
+        self._corridor = None
+
+
 
     def open_file_dialog(self, line_edit, folder_type):
         """Open a file dialog to select a folder and set it in the specified QLineEdit."""
@@ -34,27 +239,22 @@ class FileLoader(QtWidgets.QDialog):
             line_edit.setText(folder_path)
             setattr(self, folder_type, folder_path)
 
+    def is_loading(self):
+        """Return True while layer load tasks are running."""
+        return bool(self._load_tasks)
+
     def load_layers(self):
-        """Loads specific shapefiles from the folders and applies the styles from the style folder."""
+        """Loads specific shapefiles from the folders in background tasks and applies the styles from the style folder."""
+        if self.is_loading():
+            QtWidgets.QMessageBox.information(self, "Loading", "Layers are already being loaded.")
+            return
+
         # Reset progress bar
         self.progress_manager.reset()
-        
-        
-        # Get list of files to load
-        required_files = [
-            "BD_PARCELLAIRE_batiment.shp",
-            "BD_PARCELLAIRE_parcelle.shp",
-            "Cadastre,_Polygone.shp",
-            "Cadastre,_Polyligne.shp",
-            "Arc_itineraire.shp"
-        ]
-
-        total_files = len(required_files) * 2  # Layers from two folders
-        
-        # Set the total number of files for progress tracking
-        self.progress_manager.set_total(total_files)
-        
-        
+        self._load_errors = []
+
+        required_files = self.REQUIRED_FILES
+
         # Get the project's layer tree root
         root = QgsProject.instance().layerTreeRoot()
 
@@ -67,126 +267,129 @@ class FileLoader(QtWidgets.QDialog):
         avant_ai_group = root.addGroup("Avant AI")
         apres_ai_group = root.addGroup("Apres AI")
 
-        # Track loaded files
-        loaded_files = 0
+        self._working_copies = None
+        if self.working_copy_mode:
+            self._working_copies = WorkingCopyCache(self.working_copy_folder, self.working_copy_mode)
 
-        # Load from first folder
-        loaded_files += self.load_shapefiles(
-            self.folder1_path, 
-            self.style_folder_path, 
-            required_files, 
+        self._corridor = None
+        if self.corridor_mode:
+            self._corridor = compute_corridor_extent([self.folder1_path, self.folder2_path], self.corridor_buffer)
+            if self._corridor is None:
+                print("No Arc_itineraire layer found, loading reference layers in full")
+            else:
+                print(f"Cable corridor extent: {self._corridor.toString()}")
+
+        # Queue the layers of both folders; they are opened concurrently
+        tasks = self.load_shapefiles(
+            self.folder1_path,
+            required_files,
             group_name="Avant AI",
             is_first_folder=True,
-            total_files=total_files,
-            loaded_files=loaded_files
         )
-
-        # Load from second folder
-        loaded_files += self.load_shapefiles(
-            self.folder2_path, 
-            self.style_folder_path, 
-            required_files, 
+        tasks += self.load_shapefiles(
+            self.folder2_path,
+            required_files,
             group_name="Apres AI",
             is_first_folder=False,
-            total_files=total_files,
-            loaded_files=loaded_files
         )
 
-        # Ensure progress bar reaches 100%
-        self.progress_manager.complete()
-        
+        if not tasks:
+            self.progress_manager.complete()
+            self._report_load_errors()
+            return
 
-        
+        # Progress advances by one file as each task finishes
+        self.progress_manager.set_total(len(tasks))
+        self._load_tasks = tasks
+        task_manager = QgsApplication.taskManager()
+        for task in tasks:
+            task_manager.addTask(task)
 
-    def load_shapefiles(self, folder_path, style_folder_path, required_files, group_name, is_first_folder=True, total_files=1, loaded_files=0):
-        """Loads specific shapefiles from a folder and applies the styles from the style folder."""
-        folder_path = os.path.normpath(folder_path)
-        
+    def cancel_loading(self):
+        """Cancel the layer load tasks that have not finished yet."""
+        for task in list(self._load_tasks):
+            task.cancel()
+
+    def load_shapefiles(self, folder_path, required_files, group_name, is_first_folder=True):
+        """Creates the load tasks for the required shapefiles of a folder."""
         if not folder_path:
-            return 0  # Skip if folder path is empty
-        
+            return []  # Skip if folder path is empty
+
+        folder_path = os.path.normpath(folder_path)
+
         if not os.path.exists(folder_path):
-            QtWidgets.QMessageBox.warning(self, "Error", f"Folder not found: {folder_path}")
-            return 0
+            self._load_errors.append(f"Folder not found: {folder_path}")
+            return []
+
+        tasks = []
+
+        for layer_path, layer_name, order, is_route in list_required_layers(folder_path, required_files, is_first_folder):
+            tasks.append(LayerLoadTask(
+                layer_path,
+                layer_name,
+                group_name,
+                order,
+                self._on_layer_task_finished,
+                self._working_copies,
+                # Reference layers are restricted to the corridor, cable routes are loaded in full
+                None if is_route else self._corridor,
+            ))
 
-        # Get the project and layer tree root
-        project = QgsProject.instance()
-        root = project.layerTreeRoot()
+        return tasks
 
-        files_loaded_in_this_folder = 0
+    def _on_layer_task_finished(self, task, result):
+        """Main thread: add a loaded layer to its group and style it."""
+        if task in self._load_tasks:
+            self._load_tasks.remove(task)
 
-        for filename in os.listdir(folder_path):
-            # Check if the file is in the required files list
-            if filename.lower() in [f.lower() for f in required_files]:
-                layer_path = os.path.join(folder_path, filename)
-                layer = QgsVectorLayer(layer_path, filename, 'ogr')
+        if result and task.layer is not None:
+            layer = task.layer
+            project = QgsProject.instance()
 
-                if layer.isValid():
-                    # Custom renaming logic
-                    if filename.lower() == "arc_itineraire.shp":
-                        # Rename Arc_itineraire based on folder
-                        new_layer_name = f"Arc_itineraire_{'AV' if is_first_folder else 'AP'}"
-                        layer.setName(new_layer_name)
+            # Add layer to project
+            project.addMapLayer(layer, False)
 
-                    # Add layer to project
-                    project.addMapLayer(layer, False)
-                    
-                    # Find the group and add the layer
-                    group = root.findGroup(group_name)
-                    if group:
-                        group.addLayer(layer)
-                    
-                    print(f"Loaded layer: {layer.name()} in group: {group_name}")
+            # Find the group and add the layer at its position in the file list
+            group = project.layerTreeRoot().findGroup(task.group_name)
+            if group:
+                layer.setCustomProperty("mismatch_identifier/load_order", task.order)
+                position = sum(
+                    1 for node in group.findLayers()
+                    if node.layer() is not None
+                    and node.layer().customProperty("mismatch_identifier/load_order", 0) < task.order
+                )
+                group.insertLayer(position, layer)
 
-                    # Apply the style if provided
-                    if style_folder_path:
-                        self.apply_style_from_folder(layer, style_folder_path)
+            print(f"Loaded layer: {layer.name()} in group: {task.group_name}")
 
+            # Apply the style if provided
+            if self.style_folder_path:
+                with span("apply_style", "load", layer=layer.name()):
+                    self.apply_style_from_folder(layer, self.style_folder_path)
+        elif task.error:
+            self._load_errors.append(task.error)
+        else:
+            print(f"Loading of {task.layer_name} was cancelled")
 
-                    # Update progress bar
-                    self.progress_manager.update_progress()
-                    
-                    
+        # Update progress bar
+        self.progress_manager.update_progress()
 
-                else:
-                    QtWidgets.QMessageBox.warning(self, "Error", f"Failed to load layer: {filename}")
+        if not self._load_tasks:
+            # Ensure progress bar reaches 100%
+            self.progress_manager.complete()
+            self._report_load_errors()
 
-        return files_loaded_in_this_folder
+    def _report_load_errors(self):
+        """Show the errors collected while loading in a single message."""
+        if self._load_errors:
+            QtWidgets.QMessageBox.warning(self, "Error", "\n".join(self._load_errors))
 
     def apply_style_from_folder(self, layer, style_folder_path):
         """Applies a style from the style folder to the layer, based on matching layer name."""
         try:
-            layer_name = layer.name().lower()  # Use the potentially renamed layer name
-            
-            for style_filename in os.listdir(style_folder_path):
-                # Remove extension for more flexible matching
-                style_name = os.path.splitext(style_filename)[0].lower()
-                
-                # More flexible matching
-                if (style_name == layer_name or 
-                    layer_name in style_name or 
-                    style_name in layer_name):
-                    
-                    style_filepath = os.path.join(style_folder_path, style_filename)
-                    
-                    # Try QML first, then SLD
-                    if style_filename.lower().endswith(".qml"):
-                        success = layer.loadNamedStyle(style_filepath)
-                        if success:
-                            print(f"Successfully applied QML style from {style_filepath} to {layer.name()}")
-                            layer.triggerRepaint()
-                            return True
-                    
-                    elif style_filename.lower().endswith(".sld"):
-                        success = layer.loadSldStyle(style_filepath)
-                        if success:
-                            print(f"Successfully applied SLD style from {style_filepath} to {layer.name()}")
-                            layer.triggerRepaint()
-                            return True
-            
-            print(f"No matching style found for layer: {layer.name()}")
-            return False
-        
+            # Styles are listed and parsed once per folder, not once per layer
+            return get_style_registry(style_folder_path).apply(layer)
+
         except Exception as e:
             print(f"Error applying style to {layer.name()}: {str(e)}")
-            return False
\ No newline at end of file
+            return False
@@ -1,14 +1,49 @@
+import hashlib
+import json
 import os
-import json  # Import the json module
+from collections import deque
 from PyQt5.QtCore import QSize
-from PyQt5.QtGui import QImage, QPainter, QColor
+from PyQt5.QtGui import QImage, QColor
 from qgis.core import *
 from qgis.utils import iface
+from .capture_settings import (
+    DEFAULT_PIXELS_PER_METER, DISTANCE_THRESHOLD_METERS, image_size_for_extent, minimum_pixels_per_meter,
+)
+from .capture_manifest import CaptureManifest, manifest_path_for
+from .tile_stack import TileStack, parse_tile_reference, tile_reference, tile_stack_path_for
+from .tile_writer import TileWriter
+from .profiling import span
 
 class GridCapture:
-    def __init__(self, grid_layer_path, output_folder):
+    def __init__(self, grid_layer_path, output_folder, pixels_per_meter=DEFAULT_PIXELS_PER_METER,
+                 render_cache=None, cache_margin=1.0, image_format="png", compression_level=1,
+                 writer_queue_size=8, on_cell_captured=None):
         self.grid_layer_path = grid_layer_path
         self.output_folder = output_folder
+        self.pixels_per_meter = pixels_per_meter
+        if pixels_per_meter < minimum_pixels_per_meter():
+            # Still captured, but near and far red lines may no longer be told apart
+            print(f"Warning: {pixels_per_meter} px/m is below {minimum_pixels_per_meter()} px/m, the lowest "
+                  f"resolution that resolves the {DISTANCE_THRESHOLD_METERS} m distance threshold.")
+        # Encoding options of the background TileWriter
+        self.image_format = image_format
+        self.compression_level = compression_level
+        self.writer_queue_size = writer_queue_size
+        self._written = deque()
+        # Optional callback receiving the manifest row of each captured cell,
+        # e.g. to classify tiles while the next ones render
+        self.on_cell_captured = on_cell_captured
+        # Optional RenderCache; cache_margin (meters) catches symbols of
+        # features just outside the cell that still bleed into the tile
+        self.render_cache = render_cache
+        self.cache_margin = cache_margin
+        self._cancelled = False
+        # With image_format="stack", tiles go to a memory-mapped TileStack instead of files
+        self.tile_stack = None
+        if image_format == "stack" and render_cache is not None:
+            # The render cache hard-links tile files, stacked tiles have none
+            print("Render cache disabled: not supported with the 'stack' image format.")
+            self.render_cache = None
 
         # Ensure the output folder exists
         if not os.path.exists(self.output_folder):
@@ -23,73 +58,272 @@ class GridCapture:
             return
 
         # Load other layers (you can modify to include any layers you want)
-        self.other_layers = [layer for layer in QgsProject.instance().mapLayers().values() if isinstance(layer, QgsVectorLayer)]
+        self.other_layers = [
+            layer for layer in QgsProject.instance().mapLayers().values()
+            if isinstance(layer, QgsVectorLayer)
+            # Result layers such as the highlighted errors must not end up in the tiles
+            and not layer.customProperty("mismatch_identifier/exclude_from_capture", False)
+        ]
         self.other_layers.append(self.grid_layer)  # Add the grid layer as well
 
         # Initialize map settings
         self.map_settings = QgsMapSettings()
         self.map_settings.setLayers(self.other_layers)  # Set all layers to render
         self.map_settings.setBackgroundColor(QColor(255, 255, 255))  # White background
+        # Opaque output, so tiles can be encoded without an intermediate copy
+        self.map_settings.setOutputImageFormat(QImage.Format_RGB32)
 
-        # Set image size for output
-        self.image_width = 2000  # Set width
-        self.image_height = 2000  # Set height
-        self.map_settings.setOutputSize(QSize(self.image_width, self.image_height))
+        # Styles (QML/SLD applied from the style folder) don't change during a run
+        self._style_hashes = {layer.id(): self._style_hash(layer) for layer in self.other_layers}
 
-    def capture_grid_cells(self):
-        # Iterate through each grid cell
-        for feature in self.grid_layer.getFeatures():
-            geom = feature.geometry()
-            extent = geom.boundingBox()  # Get the bounding box for the cell
-            print(f"Layer CRS: {self.grid_layer.crs().authid()}")
+    def cancel(self):
+        """Stop after the current cell; completed cells are kept for the next run."""
+        self._cancelled = True
 
-            # Set extent (zoom) for the map renderer to the current grid cell
-            self.map_settings.setExtent(extent)
+    def render_fingerprint(self, extent, image_width, image_height):
+        """
+        Hash of every parameter that determines the rendered image of a cell
 
-            # Set up a QImage to store the rendered image
-            image = QImage(self.image_width, self.image_height, QImage.Format_RGB888)
-            image.fill(QColor(255, 255, 255))  # Set background color to white
+        :param extent: Cell extent
+        :param image_width: Output width in pixels
+        :param image_height: Output height in pixels
+        :return: Hex digest
+        """
+        params = {
+            "crs": self.grid_layer.crs().authid(),
+            # Layer ids change between QGIS sessions, names and sources don't
+            # (corridor subsets are memory layers and carry their original source)
+            "layers": [
+                (layer.name(), layer.customProperty("mismatch_identifier/source", layer.source()))
+                for layer in self.other_layers
+            ],
+            "extent": [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+            "size": [image_width, image_height],
+            "background": self.map_settings.backgroundColor().name(),
+            "format": [self.image_format, self.compression_level],
+        }
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
 
-            # Set up QPainter to draw the image
-            painter = QPainter(image)
+    def _style_hash(self, layer):
+        """Hash of the style currently applied to a layer."""
+        style = QgsMapLayerStyle()
+        style.readFromLayer(layer)
+        return hashlib.sha1(style.xmlData().encode("utf-8")).hexdigest()
 
-            # Set up map renderer job (renders all layers)
+    def _feature_content_hash(self, layer, rect):
+        """Order-independent hash of the geometries and attributes of the features in rect."""
+        feature_digests = []
+        for feature in layer.getFeatures(QgsFeatureRequest().setFilterRect(rect)):
+            feature_digest = hashlib.sha1(bytes(feature.geometry().asWkb()))
+            feature_digest.update(repr(feature.attributes()).encode("utf-8"))
+            feature_digests.append(feature_digest.digest())
+        feature_digests.sort()
+        return hashlib.sha1(b"".join(feature_digests)).hexdigest()
+
+    def cache_key(self, extent, image_width, image_height):
+        """
+        Render cache key of a cell: extent, output size, and per layer its
+        style hash and the content hash of the features intersecting the cell
+
+        :param extent: Cell extent
+        :param image_width: Output width in pixels
+        :param image_height: Output height in pixels
+        :return: Hex digest
+        """
+        params = {
+            "crs": self.grid_layer.crs().authid(),
+            "extent": [extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+            "size": [image_width, image_height],
+            "background": self.map_settings.backgroundColor().name(),
+            "format": [self.image_format, self.compression_level],
+        }
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8"))
+
+        rect = extent.buffered(self.cache_margin)
+        for layer in self.other_layers:
+            digest.update(layer.name().encode("utf-8"))
+            digest.update(self._style_hashes[layer.id()].encode("utf-8"))
+            digest.update(self._feature_content_hash(layer, rect).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _is_captured(self, cell, fingerprint):
+        """A cell is done if it was rendered with the same parameters and its image is still on disk."""
+        if cell is None or cell["render_fingerprint"] != fingerprint:
+            return False
+        image_path = cell["image_path"]
+        reference = parse_tile_reference(image_path)
+        if reference is not None:
+            return self.tile_stack is not None and reference[1] in self.tile_stack
+        return bool(image_path) and os.path.isfile(image_path) and os.path.getsize(image_path) > 0
+
+    def _open_tile_stack(self):
+        """Stack with a slot for every grid cell, sized from the first cell."""
+        first_cell = next(self.grid_layer.getFeatures(), None)
+        if first_cell is None:
+            return None
+        extent = first_cell.geometry().boundingBox()
+        image_width, image_height = image_size_for_extent(extent.width(), extent.height(), self.pixels_per_meter)
+        return TileStack.open_or_create(
+            tile_stack_path_for(self.output_folder), self.grid_layer.featureCount(), (image_height, image_width, 3)
+        )
+
+    def capture_grid_cells(self, cell_ids=None, resume=True):
+        """
+        Render grid cells to images and record them in the capture manifest
+
+        :param cell_ids: Optional iterable of grid feature ids to capture (default: all cells)
+        :param resume: Skip cells already captured with the same render parameters
+        :return: dict with the number of captured and skipped cells and the writer counters
+        """
+        self._cancelled = False
+        captured = 0
+        skipped = 0
+
+        if self.image_format == "stack":
+            self.tile_stack = self._open_tile_stack()
+            if self.tile_stack is None:
+                print("The grid has no cells, nothing to capture.")
+                return {"captured": 0, "skipped": 0, "writer": {}}
+
+        # A single manifest replaces the per-cell JSON files
+        manifest = CaptureManifest(manifest_path_for(self.output_folder))
+
+        # Values shared by every cell are stored once for the run
+        manifest.set_run_constants(
+            crs=self.grid_layer.crs().authid(),
+            layers=[layer.name() for layer in self.other_layers],
+            pixels_per_meter=self.pixels_per_meter,
+        )
+
+        request = QgsFeatureRequest()
+        if cell_ids is not None:
+            request.setFilterFids(list(cell_ids))
+
+        # Encoding and disk writes overlap with rendering the next cells
+        self.tile_writer = TileWriter(
+            self.image_format,
+            self.compression_level,
+            max_queue_size=self.writer_queue_size,
+            on_written=self._on_tile_written,
+            tile_stack=self.tile_stack,
+        )
+
+        try:
+            # Iterate through each grid cell
+            for feature in self.grid_layer.getFeatures(request):
+                if self._cancelled:
+                    print("Capture cancelled, completed cells are kept for the next run.")
+                    break
+
+                if self._capture_cell(feature, manifest, resume):
+                    captured += 1
+                else:
+                    skipped += 1
+
+                self._drain_written(manifest)
+        finally:
+            self.tile_writer.close()
+            self._drain_written(manifest)
+
+            # Rows are only queued once their tile is on disk, so everything
+            # flushed here is valid for a resumed run
+            manifest.close()
+            if self.render_cache is not None:
+                self.render_cache.commit()
+            if self.tile_stack is not None:
+                self.tile_stack.close()
+                self.tile_stack = None
+
+        writer_stats = self.tile_writer.stats()
+        print(f"Saved capture manifest at {manifest.path}")
+        print(
+            f"Tile writer: {writer_stats['tiles_written']} tiles, {writer_stats['bytes_written']} bytes, "
+            f"{writer_stats['encode_seconds']} s encoding, {writer_stats['blocked_seconds']} s render blocked "
+            f"({writer_stats['blocked_submits']} full-queue waits), {writer_stats['errors']} errors"
+        )
+        print(f"✅ Grid capture finished: {captured} captured, {skipped} already up to date")
+        return {"captured": captured, "skipped": skipped, "writer": writer_stats}
+
+    def _on_tile_written(self, image_path, context):
+        """TileWriter callback (writer thread): hand the finished tile back to the render loop."""
+        self._written.append((image_path, context))
+
+    def _drain_written(self, manifest):
+        """Record tiles the writer has finished; the manifest and cache stay on this thread."""
+        while self._written:
+            image_path, (grid_id, extent, image_width, image_height, fingerprint, cache_key) = self._written.popleft()
+            if cache_key is not None:
+                self.render_cache.put(cache_key, image_path)
+            self._record_cell(manifest, grid_id, extent, image_path, image_width, image_height, fingerprint)
+            print(f"Captured image for Cell {grid_id} at {image_path}")
+
+    def _capture_cell(self, feature, manifest, resume):
+        """Render a single cell; returns False if a valid capture already exists."""
+        geom = feature.geometry()
+        extent = geom.boundingBox()  # Get the bounding box for the cell
+
+        # Size the output from the ground sample distance, not a fixed pixel count
+        image_width, image_height = image_size_for_extent(
+            extent.width(), extent.height(), self.pixels_per_meter
+        )
+
+        fingerprint = self.render_fingerprint(extent, image_width, image_height)
+        if resume and self._is_captured(manifest.get_cell(feature.id()), fingerprint):
+            return False
+
+        if self.tile_stack is not None:
+            image_path = tile_reference(self.tile_stack.folder, feature.id())
+        else:
+            image_path = os.path.join(self.output_folder, f"cell_{feature.id()}{self.tile_writer.extension}")
+
+        # Reuse the tile of a previous run when nothing visible in the cell changed
+        cache_key = None
+        if self.render_cache is not None:
+            with span("cache_key", "capture"):
+                cache_key = self.cache_key(extent, image_width, image_height)
+            if self.render_cache.get(cache_key, image_path):
+                self._record_cell(manifest, feature.id(), extent, image_path, image_width, image_height, fingerprint)
+                print(f"Reused cached image for Cell {feature.id()} at {image_path}")
+                return True
+
+        self.map_settings.setOutputSize(QSize(image_width, image_height))
+
+        # Set extent (zoom) for the map renderer to the current grid cell
+        self.map_settings.setExtent(extent)
+
+        # Set up map renderer job (renders all layers)
+        with span("render", "capture", cell=feature.id()):
             map_renderer_job = QgsMapRendererParallelJob(self.map_settings)
             map_renderer_job.start()
             map_renderer_job.waitForFinished()
 
-            # Get the rendered image
-            rendered_image = map_renderer_job.renderedImage()
-
-            # Draw the rendered image onto the painter
-            painter.drawImage(0, 0, rendered_image)
-
-            # End the painting process
-            painter.end()
-
-            # Save the rendered image as a PNG file
-            image_path = os.path.join(self.output_folder, f"cell_{feature.id()}.png")
-            image.save(image_path)  # Save the image
-
-            # Create metadata dictionary
-            metadata = {
-                "grid_id": feature.id(),
-                "extent": {
-                    "xmin": extent.xMinimum(),
-                    "ymin": extent.yMinimum(),
-                    "xmax": extent.xMaximum(),
-                    "ymax": extent.yMaximum(),
-                },
-                "crs": self.grid_layer.crs().authid(),
-                "layers": [layer.name() for layer in self.other_layers],
-            }
-
-            # Save metadata to a JSON file
-            metadata_path = os.path.join(self.output_folder, f"cell_{feature.id()}.json")
-            with open(metadata_path, "w") as f:
-                json.dump(metadata, f, indent=4)  # Save with indentation for readability
-
-            print(f"Captured image for Cell {feature.id()} at {image_path}")
-            print(f"Saved metadata for Cell {feature.id()} at {metadata_path}")
-
-        print("✅ All grid cells captured successfully!")
\ No newline at end of file
+        # Never write through a previous output hard-linked into the render cache
+        if os.path.exists(image_path):
+            os.remove(image_path)
+
+        # Hand the rendered image to the background writer and move on
+        self.tile_writer.submit(
+            map_renderer_job.renderedImage(),
+            image_path,
+            (feature.id(), extent, image_width, image_height, fingerprint, cache_key),
+        )
+        return True
+
+    def _record_cell(self, manifest, grid_id, extent, image_path, image_width, image_height, fingerprint):
+        """Queue the manifest row of a cell whose image is on disk (committed in batches)."""
+        values = dict(
+            xmin=extent.xMinimum(),
+            ymin=extent.yMinimum(),
+            xmax=extent.xMaximum(),
+            ymax=extent.yMaximum(),
+            image_path=os.path.abspath(image_path),
+            image_width=image_width,
+            image_height=image_height,
+            # Effective resolution after rounding the image size to whole pixels
+            pixels_per_meter=image_width / extent.width(),
+            render_fingerprint=fingerprint,
+        )
+        manifest.add_cell(grid_id, **values)
+
+        if self.on_cell_captured is not None:
+            self.on_cell_captured(dict(values, grid_id=grid_id))
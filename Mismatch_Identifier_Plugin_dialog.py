@@ -1,9 +1,10 @@
 import os
 from qgis.PyQt import uic
 from qgis.PyQt import QtWidgets
+from qgis.core import QgsApplication
 from .GridCapture import GridCapture
 from .File_loader import FileLoader
-from .grid_filter import GridFilter
+from .grid_filter import GridGenerationTask
 
 
 # This loads your .ui file so that PyQt can populate your plugin with the elements from Qt Designer
@@ -22,11 +23,10 @@ class Mismatch_Identifier_PluginDialog(QtWidgets.QDialog, FORM_CLASS):
         # #widgets-and-dialogs-with-auto-connect
         self.setupUi(self)
 
-        # Connect the Start Process button
-        self.Start_Process.clicked.connect(self.on_start_process_clicked)
-
         # Create a FileLoader instance
         self.file_loader = FileLoader(self)
+        # Grid generation task while it runs; only one at a time
+        self._grid_task = None
 
         # Connect the browse buttons from FileLoader to the current dialog
         self.Sauvegarde_Avant_AI_Button.clicked.connect(
@@ -42,35 +42,56 @@ class Mismatch_Identifier_PluginDialog(QtWidgets.QDialog, FORM_CLASS):
         self.Start_Process.clicked.connect(self.on_generate_grid)
         # Connect load button to load layers function
         self.StartLoading.clicked.connect(self.file_loader.load_layers)
-
-    def on_start_process_clicked(self):
-        """Placeholder method for the Start Process button."""
-        # You can add the logic that should happen when the 'Start Process' button is clicked.
-        pass
+        # Closing the dialog cancels layers still loading in the background
+        self.rejected.connect(self.file_loader.cancel_loading)
+        self.rejected.connect(self.cancel_grid_generation)
 
     def on_generate_grid(self):
-        """Callback for the Generate Grid button to generate grid."""
+        """Callback for the Generate Grid button: selection, ROI, export and grid run in a background task."""
+        if self._grid_task is not None:
+            QtWidgets.QMessageBox.information(self, "Grid", "The grid is already being generated.")
+            return
+
         reference_layer_name = "Arc_itineraire_AV"  # Name of the reference layer
         try:
-            # Create a GridFilter instance
-            grid_filter = GridFilter(reference_layer_name)
+            # Layers are looked up here; the task itself doesn't touch the project
+            task = GridGenerationTask(reference_layer_name, self._on_grid_task_finished)
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+            return
 
-            # Select layers within the buffer (5 meters)
-            grid_filter.select_layers_within_buffer()
+        progress_manager = self.file_loader.progress_manager
+        progress_manager.reset()
+        progress_manager.start_stage("grid", 100)
+        task.progressChanged.connect(self._on_grid_task_progress)
 
-            # Create the ROI from the selected layers
-            grid_filter.create_roi_from_bbox()
+        self._grid_task = task
+        self.Start_Process.setEnabled(False)
+        QgsApplication.taskManager().addTask(task)
 
-            
-            grid_filter.export_selected_layers()
-            
-            # Apply the grid separator and save the grid
-            grid_filter.apply_grid_separator()
-            
-            QtWidgets.QMessageBox.information(self, "Success", "Grid generated and saved successfully!")
+    def cancel_grid_generation(self):
+        """Cancel the grid generation task if it is running."""
+        if self._grid_task is not None:
+            self._grid_task.cancel()
 
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
+    def _on_grid_task_progress(self, progress):
+        """Main thread: move progressBar_1 to the task progress (0 to 100)."""
+        progress_manager = self.file_loader.progress_manager
+        progress_manager.update_progress(int(progress) - progress_manager.current_progress)
+
+    def _on_grid_task_finished(self, task, result):
+        """Main thread: report the outcome of the grid generation task."""
+        self._grid_task = None
+        self.Start_Process.setEnabled(True)
+
+        if result:
+            self.file_loader.progress_manager.complete()
+            QtWidgets.QMessageBox.information(self, "Success", "Grid generated and saved successfully!")
+        elif task.error:
+            QtWidgets.QMessageBox.critical(self, "Error", f"An error occurred: {task.error}")
+        else:
+            self.file_loader.progress_manager.reset()
+            print("Grid generation cancelled")
 
        
     
\ No newline at end of file
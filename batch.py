@@ -0,0 +1,318 @@
+"""
+Headless batch runs of the full pipeline over many Avant/Apres folder pairs.
+
+Each pair runs in its own working directory (the plugin writes to relative
+paths such as Grid/grid.shp and Exported_Layers) and in a worker process
+with its own headless QgsApplication.
+
+Run from the folder containing the plugin, e.g.::
+
+    python -m Mismatch_Identifier_Plugin.batch --zones "/data/zones/*" --output /data/runs --workers 4
+"""
+import argparse
+import contextlib
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Columns of the summary table, after zone, status and seconds
+SUMMARY_COUNTS = [
+    "layers", "grid_cells", "filtered_cells", "captured", "skipped",
+    "please_check", "cartography_error", "no_cartography_error", "random",
+]
+
+# QgsApplication of the worker process, kept alive for every zone it runs
+_qgs_app = None
+
+
+def _normalize(name):
+    """Lower-case name without accents ("Sauvegarde après IA" -> "sauvegarde apres ia")."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def find_folder_pair(zone_folder):
+    """
+    Find the Avant and Apres sub-folders of a zone folder
+
+    :param zone_folder: Folder containing e.g. "Sauvegarde avant IA" and "Sauvegarde après IA"
+    :return: (avant_folder, apres_folder), or None if either is missing
+    """
+    avant = apres = None
+    for name in sorted(os.listdir(zone_folder)):
+        path = os.path.join(zone_folder, name)
+        if not os.path.isdir(path):
+            continue
+        normalized = _normalize(name)
+        if avant is None and "avant" in normalized:
+            avant = path
+        elif apres is None and "apres" in normalized:
+            apres = path
+    if avant is None or apres is None:
+        return None
+    return avant, apres
+
+
+def collect_jobs(zone_patterns=(), pairs=(), pairs_file=None):
+    """
+    Build the list of zones to run
+
+    :param zone_patterns: Globs of zone folders, each holding an Avant and an Apres folder
+    :param pairs: (avant_folder, apres_folder) tuples
+    :param pairs_file: Optional file with one "avant;apres" pair per line
+    :return: list of dicts with zone, avant_folder and apres_folder
+    """
+    found = []
+    for pattern in zone_patterns:
+        zone_folders = sorted(path for path in glob.glob(pattern) if os.path.isdir(path))
+        if not zone_folders:
+            print(f"No zone folder matches {pattern}")
+        for zone_folder in zone_folders:
+            pair = find_folder_pair(zone_folder)
+            if pair is None:
+                print(f"Skipping {zone_folder}: no Avant/Apres folders found")
+                continue
+            found.append((os.path.basename(os.path.normpath(zone_folder)), pair[0], pair[1]))
+
+    listed = list(pairs)
+    if pairs_file:
+        with open(pairs_file, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                avant_folder, apres_folder = [part.strip() for part in line.split(";")]
+                listed.append((avant_folder, apres_folder))
+    for avant_folder, apres_folder in listed:
+        # Pairs usually sit side by side in the zone folder
+        zone = os.path.basename(os.path.dirname(os.path.abspath(avant_folder))) or "zone"
+        found.append((zone, avant_folder, apres_folder))
+
+    jobs = []
+    used_names = set()
+    for zone, avant_folder, apres_folder in found:
+        # Working directories must not collide
+        name = zone
+        suffix = 2
+        while name in used_names:
+            name = f"{zone}_{suffix}"
+            suffix += 1
+        used_names.add(name)
+        jobs.append({
+            "zone": name,
+            "avant_folder": os.path.abspath(avant_folder),
+            "apres_folder": os.path.abspath(apres_folder),
+        })
+    return jobs
+
+
+def init_headless_qgis(prefix_path):
+    """Start a headless QGIS in this process (process pool initializer and scripts)."""
+    global _qgs_app
+    if _qgs_app is not None:
+        return
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    from qgis.core import QgsApplication
+    QgsApplication.setPrefixPath(prefix_path, True)
+    _qgs_app = QgsApplication([], False)
+    _qgs_app.initQgis()
+
+
+def run_zone(job, options):
+    """
+    Run the pipeline for one zone in its own working directory (worker process)
+
+    :param job: dict from collect_jobs()
+    :param options: dict of PipelineContext keyword arguments plus output_root and stages
+    :return: dict with zone, status, seconds, timings, counts and error
+    """
+    from qgis.core import QgsProject
+    from .pipeline import PipelineContext, run_pipeline
+    from .profiling import profiler
+
+    working_directory = os.path.join(options["output_root"], job["zone"])
+    os.makedirs(working_directory, exist_ok=True)
+    result = {"zone": job["zone"], "working_directory": working_directory, "status": "ok",
+              "seconds": 0.0, "timings": {}, "counts": {}, "error": None}
+
+    context_options = {
+        key: value for key, value in options.items() if key not in ("output_root", "stages", "profile")
+    }
+    if options.get("profile"):
+        profiler.enabled = True
+    context = PipelineContext(job["avant_folder"], job["apres_folder"], **context_options)
+
+    # Layers of the previous zone run by this worker must not be rendered again
+    QgsProject.instance().clear()
+
+    start = time.perf_counter()
+    previous_directory = os.getcwd()
+    log_path = os.path.join(working_directory, "pipeline.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+            try:
+                os.chdir(working_directory)
+                result["timings"], result["counts"] = run_pipeline(context, options["stages"])
+            except Exception as e:
+                traceback.print_exc()
+                result["status"] = "failed"
+                result["error"] = str(e)
+                result["counts"] = dict(context.counts)
+            finally:
+                if profiler.enabled:
+                    # One trace per zone, in its working directory
+                    profiler.write_chrome_trace(os.path.join(working_directory, "profile_trace.json"))
+                    profiler.reset()
+                os.chdir(previous_directory)
+                QgsProject.instance().clear()
+
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _stage_names(results):
+    """Names of the timed stages of a batch run, in first-seen order."""
+    stage_names = []
+    for result in results:
+        for name in result["timings"]:
+            if name not in stage_names:
+                stage_names.append(name)
+    return stage_names
+
+
+def format_summary(results):
+    """
+    Summary table of a batch run
+
+    :param results: list of run_zone() results
+    :return: str, one line per zone
+    """
+    stage_names = _stage_names(results)
+    header = ["zone", "status", "seconds"] + [f"{name} s" for name in stage_names] + SUMMARY_COUNTS
+    rows = [header]
+    for result in results:
+        rows.append(
+            [result["zone"], result["status"], str(result["seconds"])]
+            + [str(result["timings"].get(name, "")) for name in stage_names]
+            + [str(result["counts"].get(name, "")) for name in SUMMARY_COUNTS]
+        )
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def write_summary(results, output_root):
+    """Write summary.json and summary.csv in the output folder."""
+    with open(os.path.join(output_root, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+
+    stage_names = _stage_names(results)
+    with open(os.path.join(output_root, "summary.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(
+            ["zone", "status", "seconds"] + [f"{name} s" for name in stage_names] + SUMMARY_COUNTS + ["error"]
+        )
+        for result in results:
+            writer.writerow(
+                [result["zone"], result["status"], result["seconds"]]
+                + [result["timings"].get(name, "") for name in stage_names]
+                + [result["counts"].get(name, "") for name in SUMMARY_COUNTS]
+                + [result["error"] or ""]
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the mismatch identification pipeline on many zones.")
+    parser.add_argument("--zones", action="append", default=[], metavar="GLOB",
+                        help="Glob of zone folders, each with an Avant and an Apres folder (repeatable)")
+    parser.add_argument("--pair", action="append", nargs=2, default=[], metavar=("AVANT", "APRES"),
+                        help="One Avant/Apres folder pair (repeatable)")
+    parser.add_argument("--pairs-file", help="File with one 'avant;apres' folder pair per line")
+    parser.add_argument("--output", default="Batch_Runs", help="Folder receiving one working directory per zone")
+    parser.add_argument("--styles", default="", help="Folder with QML/SLD styles")
+    parser.add_argument("--workers", type=int, default=2, help="Zones processed in parallel")
+    parser.add_argument("--stages", help="Comma-separated stages to run (default: all)")
+    parser.add_argument("--grid-size", type=int, default=20)
+    parser.add_argument("--buffer", type=float, default=5, help="Selection buffer in meters")
+    parser.add_argument("--pixels-per-meter", type=float,
+                        help="Capture resolution; a warning is printed when it can't resolve the distance "
+                             "threshold (see capture_settings.minimum_pixels_per_meter)")
+    parser.add_argument("--corridor-buffer", type=float, help="Only load reference layers near the routes")
+    parser.add_argument("--working-copies", choices=["gpkg", "qix"], help="Load inputs from indexed working copies")
+    parser.add_argument("--image-format", choices=["png", "webp", "npy", "stack"], default="png")
+    parser.add_argument("--engine", choices=["contours", "morphology"], default="contours",
+                        help="Classification engine")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a Chrome trace (profile_trace.json) in each zone working directory")
+    parser.add_argument("--qgis-prefix", default=os.environ.get("QGIS_PREFIX_PATH", "/usr"),
+                        help="QGIS installation prefix (default: $QGIS_PREFIX_PATH or /usr)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = collect_jobs(args.zones, args.pair, args.pairs_file)
+    if not jobs:
+        print("No zones to process.")
+        return 2
+
+    output_root = os.path.abspath(args.output)
+    os.makedirs(output_root, exist_ok=True)
+
+    options = {
+        "output_root": output_root,
+        "stages": args.stages.split(",") if args.stages else None,
+        "style_folder": os.path.abspath(args.styles) if args.styles else "",
+        "grid_size": args.grid_size,
+        "buffer_distance": args.buffer,
+        "corridor_buffer": args.corridor_buffer,
+        "working_copy_mode": args.working_copies,
+        "capture_options": {"image_format": args.image_format},
+        "classifier_engine": args.engine,
+        "profile": args.profile,
+    }
+    if args.pixels_per_meter:
+        options["pixels_per_meter"] = args.pixels_per_meter
+
+    print(f"Processing {len(jobs)} zones with {args.workers} workers into {output_root}")
+    results = []
+    # QGIS does not survive fork(); every worker starts its own interpreter
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_headless_qgis,
+        initargs=(args.qgis_prefix,),
+    ) as executor:
+        futures = {executor.submit(run_zone, job, options): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # The worker itself died (e.g. a crash in QGIS)
+                result = {"zone": job["zone"], "status": "crashed", "seconds": 0.0,
+                          "timings": {}, "counts": {}, "error": str(e)}
+            results.append(result)
+            print(f"{result['zone']}: {result['status']} in {result['seconds']} s")
+
+    results.sort(key=lambda result: result["zone"])
+    write_summary(results, output_root)
+    print(format_summary(results))
+
+    failed = [result for result in results if result["status"] != "ok"]
+    for result in failed:
+        print(f"{result['zone']} {result['status']}: {result['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Benchmarks of the grid, selection and classification steps (see bench_*.py)."""
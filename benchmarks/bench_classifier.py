@@ -0,0 +1,383 @@
+"""
+Latency, throughput and accuracy of MismatchIdentifier on synthetic tiles.
+
+Tiles are drawn with OpenCV: a green (AV) and/or red (AP) line at a known
+offset on a white background, so every tile has a known category. The
+benchmark reports the per-stage latency of classify_image (from the
+profiling spans), the throughput at several worker counts, the end-to-end
+process_images rate and the confusion matrix against the known labels.
+--compare-engine runs a second classification engine on the same tiles and
+reports its latency and its agreement with the first one.
+
+Save the predictions of a run and compare a later one against them to show
+that an optimization does not change any category::
+
+    python -m Mismatch_Identifier_Plugin.benchmarks.bench_classifier --tiles 300 --save-predictions before.json
+    python -m Mismatch_Identifier_Plugin.benchmarks.bench_classifier --tiles 300 --reference before.json
+"""
+import argparse
+import contextlib
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from ..capture_manifest import CaptureManifest, manifest_path_for
+from ..capture_settings import DEFAULT_PIXELS_PER_METER, DISTANCE_THRESHOLD_METERS
+from ..feature_store import ENGINES
+from ..mismatch_identifier import DEDUP_MODES, MismatchIdentifier
+from ..profiling import profiler
+from .harness import (
+    BASELINE_PATH, DEFAULT_TOLERANCE, HISTORY_PATH, accuracy, append_history, compare_to_baseline,
+    confusion_matrix, format_confusion, format_results, load_baseline, peak_rss_mb, save_baseline,
+)
+
+# Layout -> category the classifier should give it
+LAYOUTS = {
+    "blank": "random",
+    "green_only": "no_cartography_error",
+    "red_only": "random",
+    "near": "please_check",  # Red line closer to the green one than the distance threshold
+    "far": "cartography_error",
+}
+CATEGORIES = ["no_cartography_error", "please_check", "cartography_error", "random"]
+
+# Offsets of the near/far layouts, as multiples of the distance threshold
+NEAR_OFFSETS = (0.2, 0.9)
+FAR_OFFSETS = (1.2, 6.0)
+
+# BGR colors of the AV/AP route styles and of the background clutter
+GREEN = (0, 200, 0)
+RED = (0, 0, 255)
+GREY = (160, 160, 160)
+
+LABELS_FILENAME = "labels.csv"
+
+# Classifier of a worker process
+_worker_classifier = None
+
+
+def _draw_line(image, point, direction, color, width):
+    """Line through point, long enough to cross the whole tile."""
+    length = 2 * max(image.shape[:2])
+    p0 = (int(round(point[0] - direction[0] * length)), int(round(point[1] - direction[1] * length)))
+    p1 = (int(round(point[0] + direction[0] * length)), int(round(point[1] + direction[1] * length)))
+    cv2.line(image, p0, p1, color, width, cv2.LINE_AA)
+
+
+def make_tile(layout, offset_m, rng, pixels_per_meter=DEFAULT_PIXELS_PER_METER, tile_meters=20.0,
+              line_width_m=0.1, clutter_lines=4):
+    """
+    Draw one synthetic tile
+
+    :param layout: Key of LAYOUTS
+    :param offset_m: Distance between the red and the green line, in meters (near/far layouts)
+    :param rng: random.Random
+    :param pixels_per_meter: Tile resolution
+    :param tile_meters: Tile side, in meters (the grid cell size)
+    :param line_width_m: Route line width, in meters
+    :param clutter_lines: Number of grey parcel edges drawn under the routes
+    :return: BGR uint8 array
+    """
+    size = int(round(tile_meters * pixels_per_meter))
+    image = np.full((size, size, 3), 255, dtype=np.uint8)
+    width = max(1, int(round(line_width_m * pixels_per_meter)))
+
+    # Parcel edges: edges the classifier must ignore
+    for _ in range(clutter_lines):
+        angle = rng.uniform(0, math.pi)
+        _draw_line(image, (rng.uniform(0, size), rng.uniform(0, size)), (math.cos(angle), math.sin(angle)), GREY, 1)
+
+    angle = rng.uniform(0, math.pi)
+    direction = (math.cos(angle), math.sin(angle))
+    normal = (-direction[1], direction[0])
+    center = (rng.uniform(0.25, 0.75) * size, rng.uniform(0.25, 0.75) * size)
+
+    if layout in ("green_only", "near", "far"):
+        _draw_line(image, center, direction, GREEN, width)
+    if layout in ("red_only", "near", "far"):
+        shift = offset_m * pixels_per_meter if layout != "red_only" else 0.0
+        _draw_line(image, (center[0] + normal[0] * shift, center[1] + normal[1] * shift), direction, RED, width)
+    return image
+
+
+def generate_tiles(folder, count, seed=0, pixels_per_meter=DEFAULT_PIXELS_PER_METER, tile_meters=20.0,
+                   distance_threshold=DISTANCE_THRESHOLD_METERS):
+    """
+    Write count PNG tiles, cycling through the layouts, and their labels
+
+    :return: list of dicts with tile, image_path, layout, offset_m and expected
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    layouts = list(LAYOUTS)
+    tiles = []
+    for index in range(count):
+        layout = layouts[index % len(layouts)]
+        offset_m = None
+        if layout == "near":
+            offset_m = round(rng.uniform(*NEAR_OFFSETS) * distance_threshold, 3)
+        elif layout == "far":
+            offset_m = round(rng.uniform(*FAR_OFFSETS) * distance_threshold, 3)
+
+        name = f"tile_{index}.png"
+        image_path = os.path.join(folder, name)
+        cv2.imwrite(image_path, make_tile(layout, offset_m or 0.0, rng, pixels_per_meter, tile_meters))
+        tiles.append({"tile": name, "image_path": image_path, "layout": layout,
+                      "offset_m": offset_m, "expected": LAYOUTS[layout]})
+
+    with open(os.path.join(folder, LABELS_FILENAME), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["tile", "layout", "offset_m", "expected"], extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(tiles)
+    return tiles
+
+
+def _init_worker(output_folder, pixels_per_meter, engine):
+    global _worker_classifier
+    _worker_classifier = MismatchIdentifier(output_folder=output_folder, pixels_per_meter=pixels_per_meter,
+                                            engine=engine)
+
+
+def _classify_path(image_path):
+    details = _worker_classifier.classify_image_details(image_path)
+    return details["category"] if details else None
+
+
+def bench_stages(tiles, work_folder, pixels_per_meter, engine="contours"):
+    """
+    Classify every tile once with the profiler on
+
+    :return: (predictions, measured distances, total seconds, per-stage summary, shortcut counts)
+    """
+    classifier = MismatchIdentifier(output_folder=os.path.join(work_folder, "stages"),
+                                    pixels_per_meter=pixels_per_meter, engine=engine)
+    profiler.reset()
+    profiler.enabled = True
+    predictions = []
+    distances = []
+    start = time.perf_counter()
+    try:
+        for tile in tiles:
+            details = classifier.classify_image_details(tile["image_path"], pixels_per_meter)
+            predictions.append(details["category"] if details else None)
+            distances.append(details["min_distance_m"] if details else None)
+    finally:
+        profiler.enabled = False
+    seconds = time.perf_counter() - start
+    stages = profiler.summary().get("classify", {})
+    profiler.reset()
+    return predictions, distances, seconds, stages, classifier.shortcut_counts
+
+
+def bench_workers(tiles, work_folder, pixels_per_meter, worker_counts, engine="contours"):
+    """
+    Throughput of classify_image_details over a process pool
+
+    :return: {workers: {"seconds", "tiles_per_second", "predictions"}}
+    """
+    paths = [tile["image_path"] for tile in tiles]
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for workers in worker_counts:
+        with context.Pool(workers, initializer=_init_worker,
+                          initargs=(os.path.join(work_folder, f"workers_{workers}"), pixels_per_meter, engine)) as pool:
+            # Warm-up, so process start-up is not timed
+            pool.map(_classify_path, paths[:workers])
+            start = time.perf_counter()
+            predictions = pool.map(_classify_path, paths, chunksize=max(1, len(paths) // (workers * 8)))
+            seconds = time.perf_counter() - start
+        results[workers] = {
+            "seconds": round(seconds, 4),
+            "tiles_per_second": round(len(paths) / seconds, 2),
+            "predictions": predictions,
+        }
+    return results
+
+
+def bench_process_images(tiles, work_folder, pixels_per_meter, engine="contours", dedup="exact"):
+    """
+    End-to-end process_images over a copy of the tiles listed in a capture manifest
+
+    :return: (seconds, {tile: category}, dedup summary)
+    """
+    input_folder = os.path.join(work_folder, "Output_images")
+    output_folder = os.path.join(work_folder, "Classified_images")
+    os.makedirs(input_folder, exist_ok=True)
+    with CaptureManifest(manifest_path_for(input_folder)) as manifest:
+        for grid_id, tile in enumerate(tiles):
+            image_path = os.path.join(input_folder, tile["tile"])
+            shutil.copyfile(tile["image_path"], image_path)
+            manifest.add_cell(grid_id, image_path=os.path.abspath(image_path), pixels_per_meter=pixels_per_meter)
+
+    classifier = MismatchIdentifier(input_folder, output_folder, pixels_per_meter=pixels_per_meter, engine=engine,
+                                    dedup=dedup)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        classifier.process_images()
+    seconds = time.perf_counter() - start
+
+    with CaptureManifest(manifest_path_for(input_folder)) as manifest:
+        categories = {grid_id: None for grid_id in range(len(tiles))}
+        for cell in manifest.iter_cells():
+            categories[cell["grid_id"]] = cell["category"]
+    predictions = {tiles[grid_id]["tile"]: category for grid_id, category in categories.items()}
+    return seconds, predictions, classifier.dedup_summary()
+
+
+def distance_errors(tiles, distances):
+    """Mean and max absolute error of the measured red-to-green distance, for the near/far tiles."""
+    errors = [abs(distance - tile["offset_m"]) for tile, distance in zip(tiles, distances)
+              if tile["offset_m"] is not None and distance is not None]
+    if not errors:
+        return None
+    return {"tiles": len(errors), "mean_m": round(sum(errors) / len(errors), 4), "max_m": round(max(errors), 4)}
+
+
+def compare_predictions(predictions, reference):
+    """Tiles whose category differs from a reference run: {tile: (reference, now)}."""
+    return {tile: (reference.get(tile), category) for tile, category in predictions.items()
+            if tile in reference and reference[tile] != category}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MismatchIdentifier on synthetic tiles.")
+    parser.add_argument("--tiles", type=int, default=250, help="Number of synthetic tiles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pixels-per-meter", type=float, default=DEFAULT_PIXELS_PER_METER)
+    parser.add_argument("--tile-meters", type=float, default=20.0, help="Tile side in meters (grid cell size)")
+    parser.add_argument("--engine", choices=ENGINES, default="contours", help="Classification engine")
+    parser.add_argument("--compare-engine", choices=ENGINES,
+                        help="Also classify the tiles with this engine and report the agreement")
+    parser.add_argument("--dedup", choices=DEDUP_MODES + ("none",), default="exact",
+                        help="Deduplication mode of the process_images run")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts for the throughput runs")
+    parser.add_argument("--tiles-folder", help="Keep the generated tiles in this folder (default: temporary)")
+    parser.add_argument("--save-predictions", help="Write {tile: category} of this run to a JSON file")
+    parser.add_argument("--reference", help="Predictions JSON of an earlier run; exit 1 if any category changed")
+    parser.add_argument("--report", help="Write the full results to a JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_folder = tempfile.mkdtemp(prefix="bench_classifier_")
+    tiles_folder = args.tiles_folder or os.path.join(work_folder, "tiles")
+    try:
+        print(f"Generating {args.tiles} tiles in {tiles_folder}...")
+        tiles = generate_tiles(tiles_folder, args.tiles, args.seed, args.pixels_per_meter, args.tile_meters)
+        expected = [tile["expected"] for tile in tiles]
+
+        predictions, distances, stage_seconds, stages, shortcuts = bench_stages(
+            tiles, work_folder, args.pixels_per_meter, args.engine
+        )
+        workers = bench_workers(tiles, work_folder, args.pixels_per_meter,
+                                [int(count) for count in args.workers.split(",")], args.engine)
+        process_seconds, process_predictions, dedup_summary = bench_process_images(
+            tiles, work_folder, args.pixels_per_meter, args.engine, None if args.dedup == "none" else args.dedup
+        )
+        if args.compare_engine:
+            other_predictions, _, other_seconds, other_stages, _ = bench_stages(
+                tiles, work_folder, args.pixels_per_meter, args.compare_engine
+            )
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    matrix = confusion_matrix(expected, predictions, CATEGORIES)
+    by_tile = {tile["tile"]: category for tile, category in zip(tiles, predictions)}
+    # Parallel and end-to-end runs must agree with the sequential one
+    disagreements = {
+        f"workers_{count}": sum(a != b for a, b in zip(predictions, run["predictions"]))
+        for count, run in workers.items()
+    }
+    disagreements["process_images"] = len(compare_predictions(process_predictions, by_tile))
+
+    print(f"\nclassify_image_details: {len(tiles)} tiles in {stage_seconds:.3f} s "
+          f"({len(tiles) / stage_seconds:.1f} tiles/s)")
+    for name, stats in sorted(stages.items(), key=lambda item: -item[1]["total_s"]):
+        print(f"  {name:<20}{stats['mean_ms']:>10} ms/tile  (total {stats['total_s']} s)")
+    print(f"  shortcuts: {shortcuts}")
+    for count, run in workers.items():
+        print(f"{count} workers: {run['tiles_per_second']} tiles/s")
+    print(f"process_images: {len(tiles) / process_seconds:.1f} tiles/s")
+    print(f"  {dedup_summary}")
+    print(f"\nAccuracy {accuracy(matrix)}")
+    print(format_confusion(matrix))
+    print(f"Distance error: {distance_errors(tiles, distances)}")
+    print(f"Disagreements with the sequential run: {disagreements}")
+
+    engine_comparison = None
+    if args.compare_engine:
+        # Rows: categories of --engine, columns: categories of --compare-engine
+        pairs = [(a, b) for a, b in zip(predictions, other_predictions) if a is not None]
+        agreement = confusion_matrix([a for a, _ in pairs], [b for _, b in pairs], CATEGORIES)
+        engine_comparison = {
+            "engine": args.compare_engine,
+            "seconds": round(other_seconds, 4),
+            "stages": other_stages,
+            "accuracy": accuracy(confusion_matrix(expected, other_predictions, CATEGORIES)),
+            "agreement": accuracy(agreement),
+            "agreement_matrix": agreement,
+        }
+        print(f"\n{args.compare_engine} engine: {len(tiles) / other_seconds:.1f} tiles/s, "
+              f"accuracy {engine_comparison['accuracy']}, agreement with {args.engine} {accuracy(agreement)}")
+        for name, stats in sorted(other_stages.items(), key=lambda item: -item[1]["total_s"]):
+            print(f"  {name:<20}{stats['mean_ms']:>10} ms/tile  (total {stats['total_s']} s)")
+        print(format_confusion(agreement))
+
+    counts = {"tiles": len(tiles), "accuracy": accuracy(matrix)}
+    # Benchmark names of the default engine predate the engine option
+    suffix = "" if args.engine == "contours" else f"_{args.engine}"
+    results = [{"benchmark": f"classify_image{suffix}", "size": len(tiles), "wall_seconds": round(stage_seconds, 4),
+                "peak_rss_mb": peak_rss_mb(), "counts": counts}]
+    results += [{"benchmark": f"classify_workers_{count}{suffix}", "size": len(tiles), "wall_seconds": run["seconds"],
+                 "peak_rss_mb": None, "counts": {"tiles_per_second": run["tiles_per_second"]}}
+                for count, run in workers.items()]
+    results.append({"benchmark": f"process_images{suffix}", "size": len(tiles), "wall_seconds": round(process_seconds, 4),
+                    "peak_rss_mb": None, "counts": counts})
+    append_history(results, args.history)
+    compared = compare_to_baseline(results, load_baseline(args.baseline), args.tolerance)
+    print()
+    print(format_results(compared))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"results": results, "stages": stages, "shortcuts": shortcuts, "confusion_matrix": matrix,
+                       "distance_error": distance_errors(tiles, distances),
+                       "disagreements": disagreements, "engine_comparison": engine_comparison}, f, indent=4)
+    if args.save_predictions:
+        with open(args.save_predictions, "w") as f:
+            json.dump(by_tile, f, indent=4, sort_keys=True)
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+
+    status = 0
+    if args.reference:
+        with open(args.reference) as f:
+            changed = compare_predictions(by_tile, json.load(f))
+        print(f"{len(changed)} tiles changed category against {args.reference}")
+        for tile, (before, now) in sorted(changed.items()):
+            print(f"  {tile}: {before} -> {now}")
+        status = 1 if changed else 0
+    if any(disagreements.values()):
+        status = 1
+    if not args.update_baseline and any(result_status.startswith("regression") for _, result_status in compared):
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Benchmarks of grid generation, buffer selection and grid filtering on synthetic zones.
+
+Each case runs in its own headless QGIS process; wall time, peak RSS and
+feature counts are appended to benchmarks/results/history.jsonl and compared
+with benchmarks/baseline.json. Run from the folder containing the plugin::
+
+    python -m Mismatch_Identifier_Plugin.benchmarks.bench_grid --max-size 100000
+    python -m Mismatch_Identifier_Plugin.benchmarks.bench_grid --benchmarks select --update-baseline
+"""
+import argparse
+import math
+import os
+import sys
+
+from ..batch import init_headless_qgis
+from ..synthetic_dataset import APRES_FOLDER, AVANT_FOLDER, build_memory_layer, generate_dataset
+from .harness import (
+    BASELINE_PATH, DEFAULT_TOLERANCE, HISTORY_PATH, append_history, compare_to_baseline, format_results,
+    load_baseline, measure, run_isolated, save_baseline,
+)
+
+GRID_SIZE = 20
+REFERENCE_LAYER_NAME = "Arc_itineraire_AV"
+TARGET_LAYER_NAME = "BD_PARCELLAIRE_parcelle"
+ORIGIN = (932000.0, 2302000.0)
+
+# Parcels per km² of a generate_dataset() zone with the default parcel size
+PARCELS_PER_KM2 = 2304
+
+# Benchmark -> sizes (grid cells for grid/filter, target features for select)
+SIZES = {
+    "grid": [1000, 10000, 100000, 1000000],
+    "select": [100, 1000, 10000, 100000, 1000000],
+    "filter": [1000, 10000, 100000, 1000000],
+}
+
+
+def _add_layer(name, stem, geometries):
+    from qgis.core import QgsProject
+
+    layer = build_memory_layer(stem, geometries)
+    layer.setName(name)
+    QgsProject.instance().addMapLayer(layer)
+    return layer
+
+
+def _add_zone(side, seed):
+    """Synthetic zone of side x side meters, routes as the reference layer and parcels as the target."""
+    dataset = generate_dataset(width=side, height=side, origin=ORIGIN, building_density=0,
+                               grid_size=GRID_SIZE, seed=seed, with_labels=False)
+    routes = _add_layer(REFERENCE_LAYER_NAME, "Arc_itineraire", dataset["layers"][AVANT_FOLDER]["Arc_itineraire"])
+    parcels = _add_layer(TARGET_LAYER_NAME, "BD_PARCELLAIRE_parcelle",
+                         dataset["layers"][APRES_FOLDER]["BD_PARCELLAIRE_parcelle"])
+    return routes, parcels
+
+
+def _grid_side(cells):
+    """Side in meters of a square zone holding about this many grid cells."""
+    return math.ceil(math.sqrt(cells)) * GRID_SIZE
+
+
+def setup_grid(size, seed):
+    from ..grid_filter import GridGenerator
+
+    side = _grid_side(size)
+    # A single diagonal route is enough: only the reference extent matters
+    x0, y0 = ORIGIN
+    _add_layer(REFERENCE_LAYER_NAME, "Arc_itineraire", [[(x0, y0), (x0 + side, y0 + side)]])
+    return GridGenerator(REFERENCE_LAYER_NAME, GRID_SIZE)
+
+
+def run_grid(generator):
+    grid = generator.generate_grid()
+    return {"cells": grid.featureCount()}
+
+
+def setup_select(size, seed):
+    from ..grid_filter import GridFilter
+
+    side = max(1000 * math.sqrt(size / PARCELS_PER_KM2), 2 * GRID_SIZE)
+    routes, parcels = _add_zone(side, seed)
+    return GridFilter(REFERENCE_LAYER_NAME), routes.featureCount(), parcels.featureCount()
+
+
+def run_select(inputs):
+    grid_filter, routes, parcels = inputs
+    grid_filter.select_layers_within_buffer()
+    return {"routes": routes, "targets": parcels, "selected": len(grid_filter.selected_features)}
+
+
+def setup_filter(size, seed):
+    from ..grid_filter import GridFilter, GridGenerator
+
+    _add_zone(_grid_side(size), seed)
+    grid_filter = GridFilter(REFERENCE_LAYER_NAME)
+    grid_filter.select_layers_within_buffer()
+    grid = GridGenerator(REFERENCE_LAYER_NAME, GRID_SIZE).generate_grid()
+    return grid_filter, grid
+
+
+def run_filter(inputs):
+    grid_filter, grid = inputs
+    filtered = grid_filter.filter_grid_by_selection(grid)
+    return {
+        "cells": grid.featureCount(),
+        "selected": len(grid_filter.selected_features),
+        "kept": filtered.featureCount() if filtered is not None else 0,
+    }
+
+
+BENCHMARKS = {
+    "grid": (setup_grid, run_grid),
+    "select": (setup_select, run_select),
+    "filter": (setup_filter, run_filter),
+}
+
+
+def run_case(benchmark, size, seed, qgis_prefix):
+    """One benchmark case (worker process)."""
+    init_headless_qgis(qgis_prefix)
+    setup, run = BENCHMARKS[benchmark]
+    result = measure(setup, run, size, seed)
+    result.update(benchmark=benchmark, size=size, seed=seed)
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark grid generation, selection and filtering.")
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help=f"Comma-separated benchmarks (default: {','.join(BENCHMARKS)})")
+    parser.add_argument("--max-size", type=int, default=100000,
+                        help="Skip sizes above this (the 1M cases take minutes and several GiB)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative increase of wall time and peak RSS over the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--history", default=HISTORY_PATH, help="JSON lines file receiving the results")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--qgis-prefix", default=os.environ.get("QGIS_PREFIX_PATH", "/usr"),
+                        help="QGIS installation prefix (default: $QGIS_PREFIX_PATH or /usr)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = args.benchmarks.split(",")
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(unknown)}")
+        return 2
+
+    results = []
+    for name in names:
+        for size in SIZES[name]:
+            if size > args.max_size:
+                continue
+            print(f"Running {name}/{size}...")
+            results.append(run_isolated(run_case, name, size, args.seed, args.qgis_prefix))
+
+    append_history(results, args.history)
+    compared = compare_to_baseline(results, load_baseline(args.baseline), args.tolerance)
+    print(format_results(compared))
+
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    return 1 if any(status.startswith("regression") for _, status in compared) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Shared benchmark plumbing: one process per case, JSON history, baseline comparison.
+
+Kept free of QGIS imports so the bookkeeping can be reused (and tested) anywhere.
+"""
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCHMARK_FOLDER = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.path.join(BENCHMARK_FOLDER, "results", "history.jsonl")
+BASELINE_PATH = os.path.join(BENCHMARK_FOLDER, "baseline.json")
+
+# A case regresses when it is this much slower or bigger than its baseline
+DEFAULT_TOLERANCE = 0.2
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_revision():
+    """Short hash of the checked out commit, or None outside a git tree."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_FOLDER, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(setup, run, *args):
+    """
+    Time one case in the current process
+
+    :param setup: Called as setup(*args); builds the inputs, not timed
+    :param run: Called as run(inputs); returns a dict of counts
+    :return: dict with wall_seconds, setup_rss_mb, peak_rss_mb and counts
+    """
+    inputs = setup(*args)
+    setup_rss = peak_rss_mb()
+    start = time.perf_counter()
+    counts = run(inputs)
+    wall_seconds = time.perf_counter() - start
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "counts": counts or {},
+    }
+
+
+def run_isolated(function, *args):
+    """
+    Run function(*args) in a fresh process, so peak RSS belongs to this case only
+
+    :return: The function result
+    """
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def case_key(benchmark, size):
+    return f"{benchmark}/{size}"
+
+
+def append_history(results, path=HISTORY_PATH):
+    """Append one JSON line per result."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    revision = git_revision()
+    with open(path, "a") as f:
+        for result in results:
+            f.write(json.dumps(dict(result, timestamp=timestamp, revision=revision)) + "\n")
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Store the given results as the new reference, keeping other cases."""
+    baseline = load_baseline(path)
+    for result in results:
+        baseline[case_key(result["benchmark"], result["size"])] = {
+            "wall_seconds": result["wall_seconds"],
+            "peak_rss_mb": result["peak_rss_mb"],
+        }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=4, sort_keys=True)
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Flag the results that are slower or use more memory than their baseline
+
+    :param results: Benchmark results (dicts with benchmark, size, wall_seconds, peak_rss_mb)
+    :param baseline: dict from load_baseline()
+    :param tolerance: Allowed relative increase
+    :return: list of (result, status) with status "ok", "new" or "regression: ..."
+    """
+    compared = []
+    for result in results:
+        reference = baseline.get(case_key(result["benchmark"], result["size"]))
+        if reference is None:
+            compared.append((result, "new"))
+            continue
+
+        problems = []
+        for metric in ("wall_seconds", "peak_rss_mb"):
+            if reference.get(metric) and result[metric] > reference[metric] * (1 + tolerance):
+                problems.append(f"{metric} {reference[metric]} -> {result[metric]}")
+        compared.append((result, "regression: " + ", ".join(problems) if problems else "ok"))
+    return compared
+
+
+def format_results(compared):
+    """Results table, one line per case."""
+    rows = [["case", "wall s", "peak RSS MiB", "counts", "status"]]
+    for result, status in compared:
+        counts = " ".join(f"{key}={value}" for key, value in result["counts"].items())
+        rows.append([
+            case_key(result["benchmark"], result["size"]),
+            str(result["wall_seconds"]),
+            str(result["peak_rss_mb"]),
+            counts,
+            status,
+        ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows)
+
+
+def confusion_matrix(expected, predicted, categories):
+    """
+    Count (expected, predicted) category pairs
+
+    :param expected: Known categories
+    :param predicted: Categories produced, in the same order (None for unreadable tiles)
+    :param categories: Row and column order
+    :return: {expected: {predicted: count}}, with a "none" column for unreadable tiles
+    """
+    matrix = {row: {column: 0 for column in list(categories) + ["none"]} for row in categories}
+    for known, produced in zip(expected, predicted):
+        matrix[known][produced if produced is not None else "none"] += 1
+    return matrix
+
+
+def accuracy(matrix):
+    """Share of tiles on the diagonal of a confusion matrix."""
+    total = sum(sum(row.values()) for row in matrix.values())
+    correct = sum(row.get(category, 0) for category, row in matrix.items())
+    return round(correct / total, 4) if total else None
+
+
+def format_confusion(matrix):
+    """Confusion matrix table, expected categories as rows."""
+    columns = list(next(iter(matrix.values())))
+    rows = [["expected \\ predicted"] + columns]
+    for category, counts in matrix.items():
+        rows.append([category] + [str(counts[column]) for column in columns])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(value.rjust(width) if i else value.ljust(width)
+                               for i, (value, width) in enumerate(zip(row, widths))) for row in rows)
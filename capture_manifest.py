@@ -0,0 +1,211 @@
+import json
+import os
+import sqlite3
+
+MANIFEST_FILENAME = "capture_manifest.sqlite"
+
+# One row per grid cell. Capture fills the extent and render parameters,
+# classification fills the category and distance metrics later on.
+CELL_COLUMNS = [
+    ("grid_id", "INTEGER PRIMARY KEY"),
+    ("xmin", "REAL"),
+    ("ymin", "REAL"),
+    ("xmax", "REAL"),
+    ("ymax", "REAL"),
+    ("image_path", "TEXT"),
+    ("image_width", "INTEGER"),
+    ("image_height", "INTEGER"),
+    ("pixels_per_meter", "REAL"),
+    ("render_fingerprint", "TEXT"),
+    ("category", "TEXT"),
+    ("min_distance_m", "REAL"),
+]
+
+
+def manifest_path_for(folder):
+    """
+    Path of the capture manifest stored in a capture output folder
+
+    :param folder: GridCapture output folder
+    :return: Path to the SQLite manifest
+    """
+    return os.path.join(folder, MANIFEST_FILENAME)
+
+
+class CaptureManifest:
+    def __init__(self, path, batch_size=500):
+        """
+        Open (or create) a capture manifest
+
+        Run-level constants (CRS, rendered layers, ...) are stored once in the
+        ``run`` table, per-cell rows in the ``cells`` table. Writes are buffered
+        and committed in batches of ``batch_size`` rows.
+
+        :param path: Path to the SQLite file
+        :param batch_size: Number of buffered rows that triggers a commit
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._pending_cells = []
+        self._pending_updates = {}
+        self._pending_count = 0
+
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        # WAL lets a reader (classification) run while capture is appending
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        columns = ", ".join(f"{name} {sql_type}" for name, sql_type in CELL_COLUMNS)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT)")
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS cells ({columns})")
+
+            # Add columns introduced after the manifest was first created
+            existing = {row[1] for row in self.connection.execute("PRAGMA table_info(cells)")}
+            for name, sql_type in CELL_COLUMNS:
+                if name not in existing:
+                    self.connection.execute(f"ALTER TABLE cells ADD COLUMN {name} {sql_type}")
+
+        self.columns = [name for name, _ in CELL_COLUMNS]
+
+    def set_run_constants(self, **constants):
+        """
+        Store values shared by every cell of the run
+
+        :param constants: JSON-serializable values keyed by name
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO run (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in constants.items()],
+            )
+
+    def run_constants(self):
+        """
+        Return the run-level constants
+
+        :return: dict of constants
+        """
+        return {key: json.loads(value) for key, value in self.connection.execute("SELECT key, value FROM run")}
+
+    def add_cell(self, grid_id, **values):
+        """
+        Queue a cell row; replaces any previous row with the same id
+
+        :param grid_id: Grid cell feature id
+        :param values: Column values
+        """
+        values["grid_id"] = grid_id
+        self._pending_cells.append(values)
+        self._pending_count += 1
+        if self._pending_count >= self.batch_size:
+            self.flush()
+
+    def update_cell(self, grid_id, **values):
+        """
+        Queue an update of some columns of an existing cell row
+
+        :param grid_id: Grid cell feature id
+        :param values: Column values to update
+        """
+        key = tuple(sorted(values))
+        self._pending_updates.setdefault(key, []).append(
+            tuple(values[name] for name in key) + (grid_id,)
+        )
+        self._pending_count += 1
+        if self._pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all queued rows in a single transaction."""
+        if not self._pending_count:
+            return
+
+        with self.connection:
+            if self._pending_cells:
+                # Group rows by their column set so each group is one executemany
+                groups = {}
+                for row in self._pending_cells:
+                    groups.setdefault(tuple(sorted(row)), []).append(row)
+                for names, rows in groups.items():
+                    placeholders = ", ".join("?" for _ in names)
+                    self.connection.executemany(
+                        f"INSERT OR REPLACE INTO cells ({', '.join(names)}) VALUES ({placeholders})",
+                        [tuple(row[name] for name in names) for row in rows],
+                    )
+
+            for names, rows in self._pending_updates.items():
+                assignments = ", ".join(f"{name} = ?" for name in names)
+                self.connection.executemany(f"UPDATE cells SET {assignments} WHERE grid_id = ?", rows)
+
+        self._pending_cells = []
+        self._pending_updates = {}
+        self._pending_count = 0
+
+    def get_cell(self, grid_id):
+        """
+        Return a single cell row
+
+        :param grid_id: Grid cell feature id
+        :return: dict of column values, or None
+        """
+        cursor = self.connection.execute(f"SELECT {', '.join(self.columns)} FROM cells WHERE grid_id = ?", (grid_id,))
+        row = cursor.fetchone()
+        return dict(zip(self.columns, row)) if row else None
+
+    def iter_cells(self, where=None, params=(), fetch_size=1000):
+        """
+        Stream cell rows without loading the whole table
+
+        :param where: Optional SQL condition, e.g. "category IS NULL"
+        :param params: Parameters for the condition
+        :param fetch_size: Number of rows fetched per round trip
+        :return: Generator of dicts
+        """
+        query = f"SELECT {', '.join(self.columns)} FROM cells"
+        if where:
+            query += f" WHERE {where}"
+        query += " ORDER BY grid_id"
+
+        # A separate cursor so updates queued while iterating don't reset it
+        cursor = self.connection.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(self.columns, row))
+
+    def count_cells(self, where=None, params=()):
+        """
+        Count cell rows
+
+        :param where: Optional SQL condition
+        :param params: Parameters for the condition
+        :return: Number of matching rows
+        """
+        query = "SELECT COUNT(*) FROM cells"
+        if where:
+            query += f" WHERE {where}"
+        return self.connection.execute(query, params).fetchone()[0]
+
+    def close(self):
+        """Flush pending rows and close the database."""
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,37 @@
+import math
+
+# Ground sample distance shared by GridCapture and MismatchIdentifier.
+# 100 px/m reproduces the historical 2000 px capture of a 20 m grid cell.
+DEFAULT_PIXELS_PER_METER = 100.0
+
+# Red/green distance (meters) under which a cell is flagged "please_check"
+DISTANCE_THRESHOLD_METERS = 0.5
+
+# Number of pixels the distance threshold must span to survive
+# antialiasing and edge detection
+MIN_PIXELS_PER_THRESHOLD = 8
+
+
+def minimum_pixels_per_meter(threshold_meters=DISTANCE_THRESHOLD_METERS, min_pixels=MIN_PIXELS_PER_THRESHOLD):
+    """
+    Lowest ground sample distance that still resolves the distance threshold
+
+    :param threshold_meters: Distance that must be resolved, in meters
+    :param min_pixels: Number of pixels the threshold must span
+    :return: Pixels per meter
+    """
+    return min_pixels / threshold_meters
+
+
+def image_size_for_extent(width_meters, height_meters, pixels_per_meter=DEFAULT_PIXELS_PER_METER):
+    """
+    Compute the output image size for a cell extent at a given resolution
+
+    :param width_meters: Width of the cell extent
+    :param height_meters: Height of the cell extent
+    :param pixels_per_meter: Ground sample distance
+    :return: (width, height) in pixels
+    """
+    width = max(1, int(math.ceil(width_meters * pixels_per_meter - 1e-6)))
+    height = max(1, int(math.ceil(height_meters * pixels_per_meter - 1e-6)))
+    return width, height
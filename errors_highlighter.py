@@ -0,0 +1,203 @@
+import glob
+import json
+import os
+from qgis.core import (
+    QgsCategorizedSymbolRenderer,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFillSymbol,
+    QgsGeometry,
+    QgsProject,
+    QgsRectangle,
+    QgsRendererCategory,
+    QgsSpatialIndex,
+    QgsVectorLayer,
+)
+from PyQt5.QtCore import QVariant
+from .capture_manifest import CaptureManifest, manifest_path_for
+
+# Categories highlighted on the map, with their fill color
+HIGHLIGHT_CATEGORIES = {
+    "cartography_error": "#ff0004",
+    "please_check": "#ff9900",
+}
+
+
+def iter_classified_cells(capture_folder="Output_images", classified_folder="Classified_images",
+                          categories=tuple(HIGHLIGHT_CATEGORIES)):
+    """
+    Classification results joined to their grid cells, in one pass
+
+    Reads the capture manifest, or the per-cell JSON files of captures made
+    before it existed.
+
+    :param capture_folder: GridCapture output folder (holds the manifest)
+    :param classified_folder: MismatchIdentifier output folder (holds legacy JSON files)
+    :param categories: Categories to return
+    :return: generator of (grid_id, category, (xmin, ymin, xmax, ymax), min_distance_m)
+    """
+    manifest_path = manifest_path_for(capture_folder)
+    if os.path.exists(manifest_path):
+        placeholders = ", ".join("?" for _ in categories)
+        with CaptureManifest(manifest_path) as manifest:
+            for cell in manifest.iter_cells(f"category IN ({placeholders})", tuple(categories)):
+                bounds = (cell["xmin"], cell["ymin"], cell["xmax"], cell["ymax"])
+                yield cell["grid_id"], cell["category"], bounds, cell["min_distance_m"]
+        return
+
+    for category in categories:
+        for json_path in glob.glob(os.path.join(glob.escape(classified_folder), category, "*.json")):
+            with open(json_path, "r") as f:
+                metadata = json.load(f)
+            extent = metadata["extent"]
+            bounds = (extent["xmin"], extent["ymin"], extent["xmax"], extent["ymax"])
+            yield metadata["grid_id"], category, bounds, metadata.get("min_distance_m")
+
+
+class ErrorsHighlighter:
+    def __init__(self, capture_folder="Output_images", classified_folder="Classified_images",
+                 target_layer_name="Arc_itineraire_AP", categories=tuple(HIGHLIGHT_CATEGORIES), batch_size=5000):
+        """
+        Show the flagged grid cells on the map and select the cable routes they contain
+
+        :param capture_folder: GridCapture output folder
+        :param classified_folder: MismatchIdentifier output folder
+        :param target_layer_name: Layer whose features are selected
+        :param categories: Categories to highlight
+        :param batch_size: Number of cells added to the errors layer per provider call
+        """
+        self.capture_folder = capture_folder
+        self.classified_folder = classified_folder
+        self.target_layer_name = target_layer_name
+        self.categories = list(categories)
+        self.batch_size = batch_size
+        self.errors_layer = None
+
+    def get_layer_by_name(self, layer_name):
+        layer = QgsProject.instance().mapLayersByName(layer_name)
+        if layer:
+            return layer[0]
+        else:
+            raise ValueError(f"Layer '{layer_name}' not found in QGIS.")
+
+    def build_errors_layer(self, crs_authid):
+        """
+        Memory layer of the flagged cells, filled in one pass over the results
+
+        :param crs_authid: CRS of the grid
+        :return: (layer, {category: [cell QgsGeometry, ...]})
+        """
+        errors_layer = QgsVectorLayer(f"Polygon?crs={crs_authid}", "Errors", "memory")
+        provider = errors_layer.dataProvider()
+        provider.addAttributes([
+            QgsField("grid_id", QVariant.Int),
+            QgsField("category", QVariant.String),
+            QgsField("min_dist", QVariant.Double),
+        ])
+        errors_layer.updateFields()
+        fields = errors_layer.fields()
+
+        cells_by_category = {category: [] for category in self.categories}
+        batch = []
+        for grid_id, category, bounds, min_distance in iter_classified_cells(
+            self.capture_folder, self.classified_folder, self.categories
+        ):
+            geometry = QgsGeometry.fromRect(QgsRectangle(*bounds))
+            cells_by_category[category].append(geometry)
+
+            feature = QgsFeature(fields)
+            feature.setGeometry(geometry)
+            feature.setAttributes([grid_id, category, min_distance])
+            batch.append(feature)
+            if len(batch) >= self.batch_size:
+                provider.addFeatures(batch)
+                batch = []
+        if batch:
+            provider.addFeatures(batch)
+
+        errors_layer.updateExtents()
+        # Its red fill would otherwise be taken for AP routes in later captures
+        errors_layer.setCustomProperty("mismatch_identifier/exclude_from_capture", True)
+        return errors_layer, cells_by_category
+
+    def _style_errors_layer(self, errors_layer):
+        renderer_categories = []
+        for category, color in HIGHLIGHT_CATEGORIES.items():
+            symbol = QgsFillSymbol.createSimple({
+                "color": color,
+                "outline_color": color,
+                "outline_width": "0.4",
+            })
+            symbol.setOpacity(0.35)
+            renderer_categories.append(QgsRendererCategory(category, symbol, category))
+        errors_layer.setRenderer(QgsCategorizedSymbolRenderer("category", renderer_categories))
+
+    def select_intersecting(self, target_layer, cells_by_category):
+        """
+        Select the target features crossing flagged cells, one index query per category
+
+        :param target_layer: Layer to select in (the cable routes after the AI pass)
+        :param cells_by_category: {category: [cell QgsGeometry, ...]}
+        :return: ({category: set of feature ids}, set of all the selected feature ids); a feature
+            crossing cells of several categories is in several sets but selected once
+        """
+        # Geometries are stored in the index, so candidates are never fetched again
+        index = QgsSpatialIndex(
+            target_layer.getFeatures(QgsFeatureRequest().setNoAttributes()),
+            flags=QgsSpatialIndex.FlagStoreFeatureGeometries,
+        )
+
+        selected = {}
+        for category, cell_geometries in cells_by_category.items():
+            if not cell_geometries:
+                selected[category] = set()
+                continue
+
+            cells = QgsGeometry.collectGeometry(cell_geometries)
+            engine = QgsGeometry.createGeometryEngine(cells.constGet())
+            engine.prepareGeometry()
+
+            selected[category] = {
+                feature_id for feature_id in index.intersects(cells.boundingBox())
+                if engine.intersects(index.geometry(feature_id).constGet())
+            }
+            print(f"{category}: {len(cell_geometries)} cells, {len(selected[category])} {target_layer.name()} features")
+
+        all_ids = set().union(*selected.values()) if selected else set()
+        target_layer.selectByIds(list(all_ids))
+        return selected, all_ids
+
+    def highlight(self):
+        """
+        Add the errors layer to the project and select the flagged cable routes
+
+        :return: dict with the number of cells and selected features per category, and the
+            number of selected features ("selected_total")
+        """
+        target_layer = self.get_layer_by_name(self.target_layer_name)
+
+        crs_authid = target_layer.crs().authid()
+        manifest_path = manifest_path_for(self.capture_folder)
+        if os.path.exists(manifest_path):
+            with CaptureManifest(manifest_path) as manifest:
+                crs_authid = manifest.run_constants().get("crs", crs_authid)
+
+        errors_layer, cells_by_category = self.build_errors_layer(crs_authid)
+        self._style_errors_layer(errors_layer)
+
+        # Replace the layer of a previous run
+        project = QgsProject.instance()
+        for layer in project.mapLayersByName(errors_layer.name()):
+            project.removeMapLayer(layer.id())
+        project.addMapLayer(errors_layer)
+        self.errors_layer = errors_layer
+
+        selected, all_ids = self.select_intersecting(target_layer, cells_by_category)
+
+        print(f"Errors layer: {errors_layer.featureCount()} cells")
+        return {
+            "cells": {category: len(cells) for category, cells in cells_by_category.items()},
+            "selected": {category: len(ids) for category, ids in selected.items()},
+            "selected_total": len(all_ids),
+        }
@@ -0,0 +1,231 @@
+import json
+import os
+import cv2
+from PyQt5.QtCore import QByteArray, QVariant
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsProject,
+    QgsRectangle,
+    QgsVectorFileWriter,
+    QgsWkbTypes,
+)
+from .capture_manifest import CaptureManifest, manifest_path_for
+from .errors_highlighter import HIGHLIGHT_CATEGORIES, iter_classified_cells
+from .mismatch_identifier import read_tile
+from .report_stats import REPORT_CATEGORIES, CategoryStats
+from .tile_stack import is_tile_reference
+
+class ReportExporter:
+    def __init__(self, capture_folder="Output_images", classified_folder="Classified_images", output_folder="Report",
+                 route_layer_name="Arc_itineraire_AP", flagged_categories=tuple(HIGHLIGHT_CATEGORIES),
+                 batch_size=1000, thumbnail_size=128):
+        """
+        Export the classification results to a GeoPackage and a summary
+
+        Cells are streamed from the capture manifest and written in batches;
+        images are only read for the flagged cells, to embed their thumbnail.
+
+        :param capture_folder: GridCapture output folder
+        :param classified_folder: MismatchIdentifier output folder (legacy JSON results)
+        :param output_folder: Folder receiving report.gpkg and report_summary.json
+        :param route_layer_name: Layer whose selected features (see ErrorsHighlighter) are exported
+        :param flagged_categories: Categories whose tiles get a thumbnail
+        :param batch_size: Number of features written per call
+        :param thumbnail_size: Longest side of the thumbnails, in pixels
+        """
+        self.capture_folder = capture_folder
+        self.classified_folder = classified_folder
+        self.output_folder = output_folder
+        self.route_layer_name = route_layer_name
+        self.flagged_categories = set(flagged_categories)
+        self.batch_size = batch_size
+        self.thumbnail_size = thumbnail_size
+        self.report_path = os.path.join(output_folder, "report.gpkg")
+        self.summary_path = os.path.join(output_folder, "report_summary.json")
+
+    def _cell_fields(self):
+        fields = QgsFields()
+        fields.append(QgsField("grid_id", QVariant.Int))
+        fields.append(QgsField("category", QVariant.String))
+        fields.append(QgsField("min_dist", QVariant.Double))
+        fields.append(QgsField("image_path", QVariant.String))
+        fields.append(QgsField("image_w", QVariant.Int))
+        fields.append(QgsField("image_h", QVariant.Int))
+        fields.append(QgsField("px_per_m", QVariant.Double))
+        fields.append(QgsField("thumbnail", QVariant.ByteArray))
+        return fields
+
+    def _create_writer(self, layer_name, fields, wkb_type, crs, overwrite_file):
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.fileEncoding = "UTF-8"
+        options.layerName = layer_name
+        if not overwrite_file:
+            options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+
+        writer = QgsVectorFileWriter.create(
+            self.report_path, fields, wkb_type, crs, QgsCoordinateTransformContext(), options
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise IOError(f"Could not create layer {layer_name} in {self.report_path}: {writer.errorMessage()}")
+        return writer
+
+    def _iter_cells(self):
+        """Classified cells as manifest-like dicts, read in one pass."""
+        manifest_path = manifest_path_for(self.capture_folder)
+        if os.path.exists(manifest_path):
+            with CaptureManifest(manifest_path) as manifest:
+                for cell in manifest.iter_cells("category IS NOT NULL"):
+                    yield cell
+            return
+
+        # Captures made before the manifest: no image metadata, hence no thumbnails
+        for grid_id, category, bounds, min_distance in iter_classified_cells(
+            self.capture_folder, self.classified_folder, REPORT_CATEGORIES
+        ):
+            xmin, ymin, xmax, ymax = bounds
+            yield {"grid_id": grid_id, "category": category, "min_distance_m": min_distance,
+                   "xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax}
+
+    def thumbnail(self, image_path):
+        """
+        PNG thumbnail of a tile
+
+        :param image_path: Tile path (PNG, WebP or NPY) or tile stack reference
+        :return: QByteArray, or None if the tile can't be read
+        """
+        if not image_path or not (is_tile_reference(image_path) or os.path.exists(image_path)):
+            return None
+        image = read_tile(image_path)
+        if image is None:
+            return None
+
+        height, width = image.shape[:2]
+        scale = self.thumbnail_size / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                               interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".png", image)
+        return QByteArray(encoded.tobytes()) if ok else None
+
+    def _crs(self):
+        manifest_path = manifest_path_for(self.capture_folder)
+        if os.path.exists(manifest_path):
+            with CaptureManifest(manifest_path) as manifest:
+                constants = manifest.run_constants()
+            if constants.get("crs"):
+                return QgsCoordinateReferenceSystem(constants["crs"]), constants
+        route_layers = QgsProject.instance().mapLayersByName(self.route_layer_name)
+        crs = route_layers[0].crs() if route_layers else QgsCoordinateReferenceSystem()
+        return crs, {}
+
+    def export_cells(self, crs):
+        """
+        Write every classified cell to the "cells" layer, in batches
+
+        :param crs: Grid CRS
+        :return: CategoryStats of the exported cells
+        """
+        fields = self._cell_fields()
+        writer = self._create_writer("cells", fields, QgsWkbTypes.Polygon, crs, overwrite_file=True)
+
+        stats = CategoryStats(REPORT_CATEGORIES)
+        thumbnails = 0
+        batch = []
+        for cell in self._iter_cells():
+            category = cell["category"]
+            stats.add(category, cell["min_distance_m"])
+
+            thumbnail = None
+            if category in self.flagged_categories:
+                thumbnail = self.thumbnail(cell.get("image_path"))
+                thumbnails += thumbnail is not None
+
+            feature = QgsFeature(fields)
+            feature.setGeometry(QgsGeometry.fromRect(QgsRectangle(cell["xmin"], cell["ymin"], cell["xmax"], cell["ymax"])))
+            feature.setAttributes([
+                cell["grid_id"],
+                category,
+                cell["min_distance_m"],
+                cell.get("image_path"),
+                cell.get("image_width"),
+                cell.get("image_height"),
+                cell.get("pixels_per_meter"),
+                thumbnail,
+            ])
+            batch.append(feature)
+            if len(batch) >= self.batch_size:
+                writer.addFeatures(batch)
+                batch = []
+        if batch:
+            writer.addFeatures(batch)
+
+        # Deleting the writer flushes and closes the layer
+        del writer
+        print(f"Exported {stats.total()} cells ({thumbnails} thumbnails) to {self.report_path}")
+        return stats
+
+    def export_error_routes(self):
+        """
+        Write the selected cable route features (highlighted errors) to the "error_routes" layer
+
+        :return: Number of features written, or None if the layer isn't loaded
+        """
+        route_layers = QgsProject.instance().mapLayersByName(self.route_layer_name)
+        if not route_layers:
+            print(f"Layer '{self.route_layer_name}' not loaded, error routes not exported.")
+            return None
+        route_layer = route_layers[0]
+
+        writer = self._create_writer(
+            "error_routes", route_layer.fields(), route_layer.wkbType(), route_layer.crs(), overwrite_file=False
+        )
+        written = 0
+        batch = []
+        for feature in route_layer.getSelectedFeatures():
+            batch.append(feature)
+            if len(batch) >= self.batch_size:
+                writer.addFeatures(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            writer.addFeatures(batch)
+            written += len(batch)
+
+        del writer
+        print(f"Exported {written} error route features to {self.report_path}")
+        return written
+
+    def export(self):
+        """
+        Write report.gpkg and report_summary.json
+
+        :return: Summary dict
+        """
+        os.makedirs(self.output_folder, exist_ok=True)
+        crs, run_constants = self._crs()
+
+        stats = self.export_cells(crs)
+        error_routes = self.export_error_routes()
+
+        summary = {
+            "report": os.path.abspath(self.report_path),
+            "run": run_constants,
+            "cells": stats.total(),
+            "categories": stats.as_dict(),
+            "error_routes": error_routes,
+        }
+        with open(self.summary_path, "w") as f:
+            json.dump(summary, f, indent=4)
+
+        print(f"{'category':<22}{'cells':>8}{'min dist mean (m)':>20}")
+        for category, values in summary["categories"].items():
+            mean = values["min_distance_m"]["mean"]
+            print(f"{category:<22}{values['count']:>8}{'' if mean is None else mean:>20}")
+        print(f"Saved report summary at {self.summary_path}")
+        return summary
@@ -0,0 +1,173 @@
+"""
+Columnar store of the per-tile features measured by MismatchIdentifier.
+
+Extraction (decoding, color masks, edges, contours, distances) is the slow
+part of the classification; the decision is a handful of comparisons. With
+the features kept, the categories of a whole run can be recomputed for a new
+distance threshold with NumPy, without decoding any image again.
+
+The store is a "features" folder next to the capture manifest, holding one
+.npy file per column, rows sorted by grid id.
+"""
+import os
+
+import numpy as np
+
+FEATURES_FOLDERNAME = "features"
+
+# Classification engines of MismatchIdentifier, stored by index in the "engine" column
+ENGINES = ("contours", "morphology")
+
+# Column -> dtype. Distances are NaN when a tile has no red/green pair to measure
+FEATURE_COLUMNS = {
+    "grid_id": np.int64,
+    "engine": np.int8,
+    "pixels_per_meter": np.float64,
+    "green_pixels": np.int64,
+    "red_pixels": np.int64,
+    "white_pixels": np.int64,
+    "green_edge_pixels": np.int64,
+    "red_edge_pixels": np.int64,
+    "green_contours": np.int32,
+    "red_contours": np.int32,
+    "min_distance_m": np.float64,
+    "median_distance_m": np.float64,
+    "max_distance_m": np.float64,
+    "near_red_ratio": np.float64,  # Morphology engine: share of red pixels within the threshold of green
+}
+
+
+def _missing_value(name):
+    """Value of a column that was not measured: NaN, or 0 (also the contours engine) for integers."""
+    return np.nan if np.issubdtype(FEATURE_COLUMNS[name], np.floating) else 0
+
+
+def feature_store_path_for(folder):
+    """
+    Path of the feature store of a capture output folder
+
+    :param folder: GridCapture output folder (where the manifest is)
+    :return: Folder holding the column files
+    """
+    return os.path.join(folder, FEATURES_FOLDERNAME)
+
+
+def decide_categories(features, distance_threshold):
+    """
+    Category rules of MismatchIdentifier, applied to many tiles at once
+
+    Contours engine: red and green edges present, "please_check" when the
+    nearest red contour is closer than the threshold. Morphology engine: red
+    and green pixels present, "please_check" when at least half of the red
+    pixels are within the threshold of a green pixel, i.e. when the lower
+    median of the red pixel distances is within it.
+
+    :param features: dict of columns (FeatureStore.load()) or of single values
+    :param distance_threshold: Red/green distance under which a tile is "please_check", in meters
+    :return: Array of category names
+    """
+    morphology = np.atleast_1d(features.get("engine", 0)) == ENGINES.index("morphology")
+    green = np.where(morphology, np.atleast_1d(features["green_pixels"]) > 0,
+                     np.atleast_1d(features["green_edge_pixels"]) > 0)
+    red = np.where(morphology, np.atleast_1d(features["red_pixels"]) > 0,
+                   np.atleast_1d(features["red_edge_pixels"]) > 0)
+    min_distance = np.atleast_1d(np.asarray(features["min_distance_m"], dtype=np.float64))
+    median_distance = np.atleast_1d(np.asarray(features["median_distance_m"], dtype=np.float64))
+    with np.errstate(invalid="ignore"):
+        # NaN (nothing to measure) compares False, like the infinite distance of classify_image
+        near = np.where(morphology, median_distance <= distance_threshold, min_distance < distance_threshold)
+
+    both = green & red
+    return np.select(
+        [both & near, both, green],
+        ["please_check", "cartography_error", "no_cartography_error"],
+        default="random",
+    )
+
+
+class FeatureStore:
+    def __init__(self, folder):
+        """
+        Feature columns of a capture run
+
+        Rows are buffered by add() and merged into the column files by save().
+
+        :param folder: Store folder, see feature_store_path_for()
+        """
+        self.folder = folder
+        self._rows = []
+
+    def _column_path(self, name):
+        return os.path.join(self.folder, f"{name}.npy")
+
+    def add(self, grid_id, features):
+        """
+        Queue the features of one tile
+
+        :param grid_id: Grid cell feature id
+        :param features: dict from MismatchIdentifier.extract_features()
+        """
+        self._rows.append(dict(features, grid_id=grid_id))
+
+    def exists(self):
+        return os.path.exists(self._column_path("grid_id"))
+
+    def load(self, mmap=True):
+        """
+        Read the stored columns
+
+        :param mmap: Memory-map the files instead of reading them
+        :return: {column: array}, empty if nothing was saved yet
+        """
+        if not self.exists():
+            return {}
+        columns = {}
+        for name in FEATURE_COLUMNS:
+            path = self._column_path(name)
+            if os.path.exists(path):
+                columns[name] = np.load(path, mmap_mode="r" if mmap else None)
+        length = len(columns["grid_id"])
+        for name in FEATURE_COLUMNS:
+            if name not in columns:
+                # Column added after the store was written
+                columns[name] = np.full(length, _missing_value(name), dtype=FEATURE_COLUMNS[name])
+        return columns
+
+    def save(self):
+        """
+        Merge the queued rows into the column files; a tile extracted again replaces its old row
+
+        :return: Number of rows written
+        """
+        if not self._rows:
+            return 0
+
+        added = {
+            name: np.array(
+                [_missing_value(name) if row.get(name) is None else row[name] for row in self._rows], dtype=dtype
+            )
+            for name, dtype in FEATURE_COLUMNS.items()
+        }
+        # Keep the last row of a tile added twice
+        grid_ids = added["grid_id"][::-1]
+        _, last = np.unique(grid_ids, return_index=True)
+        keep = len(grid_ids) - 1 - last
+        added = {name: column[keep] for name, column in added.items()}
+
+        stored = self.load(mmap=False)
+        if stored:
+            kept = ~np.isin(stored["grid_id"], added["grid_id"])
+            added = {name: np.concatenate([stored[name][kept], column]) for name, column in added.items()}
+
+        order = np.argsort(added["grid_id"], kind="stable")
+        os.makedirs(self.folder, exist_ok=True)
+        for name, column in added.items():
+            # Write then rename, so a reader never sees a half-written column
+            temporary_path = self._column_path(f"{name}.tmp")
+            np.save(temporary_path, column[order])
+            os.replace(temporary_path, self._column_path(name))
+
+        written = len(self._rows)
+        self._rows = []
+        print(f"Saved {written} feature rows to {self.folder}")
+        return written
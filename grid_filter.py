@@ -8,9 +8,14 @@ from qgis.core import (
     QgsVectorFileWriter, 
     QgsFeatureRequest,
     QgsCoordinateTransformContext, 
-    QgsVectorLayer
+    QgsVectorLayer,
+    QgsVectorLayerFeatureSource,
+    QgsMemoryProviderUtils,
+    QgsApplication,
+    QgsTask
 )
 import os
+from .profiling import span, timed
 
 class GridGenerator:
     def __init__(self, reference_layer_name, grid_size=20, output_path="Grid/grid.shp"):
@@ -18,6 +23,9 @@ class GridGenerator:
         self.grid_size = grid_size
         self.output_path = output_path
         self.reference_layer = self.get_layer_by_name(reference_layer_name)
+        # Snapshot taken on the main thread, so the grid can be built in a background task
+        self.extent = QgsRectangle(self.reference_layer.extent())
+        self.crs_authid = self.reference_layer.crs().authid()
 
     def get_layer_by_name(self, layer_name):
         layer = QgsProject.instance().mapLayersByName(layer_name)
@@ -26,28 +34,50 @@ class GridGenerator:
         else:
             raise ValueError(f"Layer '{layer_name}' not found in QGIS.")
 
-    def generate_grid(self):
-        extent = self.reference_layer.extent()
+    @timed("generate_grid", "grid")
+    def generate_grid(self, is_canceled=None, on_progress=None):
+        """
+        Build the grid cells over the reference extent; safe to call outside the main thread
+
+        :param is_canceled: Optional callable, returning True stops the generation
+        :param on_progress: Optional callable receiving the fraction done (0 to 1)
+        :return: Memory QgsVectorLayer, or None if cancelled
+        """
+        extent = self.extent
         xmin, ymin, xmax, ymax = extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()
 
-        grid_layer = QgsVectorLayer("Polygon?crs=" + self.reference_layer.crs().authid(), "Grid", "memory")
+        grid_layer = QgsVectorLayer("Polygon?crs=" + self.crs_authid, "Grid", "memory")
         provider = grid_layer.dataProvider()
 
-        for x in range(int(xmin), int(xmax), self.grid_size):
+        columns = range(int(xmin), int(xmax), self.grid_size)
+        for column, x in enumerate(columns):
+            if is_canceled is not None and is_canceled():
+                return None
+
+            features = []
             for y in range(int(ymin), int(ymax), self.grid_size):
                 rect = QgsRectangle(x, y, x + self.grid_size, y + self.grid_size)
                 feature = QgsFeature()
                 feature.setGeometry(QgsGeometry.fromRect(rect))
-                provider.addFeature(feature)
+                features.append(feature)
+            # One provider call per column instead of one per cell
+            provider.addFeatures(features)
+
+            if on_progress is not None:
+                on_progress((column + 1) / len(columns))
 
         return grid_layer
 
-    def save_grid(self):
-        grid_layer = self.generate_grid()
+    def save_grid(self, is_canceled=None, on_progress=None):
+        grid_layer = self.generate_grid(is_canceled, on_progress)
+        if grid_layer is None:
+            print("Grid generation cancelled.")
+            return None
         os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
-        QgsVectorFileWriter.writeAsVectorFormat(
-            grid_layer, self.output_path, "UTF-8", grid_layer.crs(), "ESRI Shapefile"
-        )
+        with span("write_grid", "grid"):
+            QgsVectorFileWriter.writeAsVectorFormat(
+                grid_layer, self.output_path, "UTF-8", grid_layer.crs(), "ESRI Shapefile"
+            )
         print(f"Grid saved to {self.output_path}")
         return grid_layer
 
@@ -57,10 +87,13 @@ class GridFilter:
         self.reference_layer_name = reference_layer_name
         self.buffer_distance = buffer_distance
         self.reference_layer = self.get_layer_by_name(reference_layer_name)
+        self.crs_authid = self.reference_layer.crs().authid()
         self.selected_layers = []
         self.output_path = output_path
         self.roi_layer = None
         self.selected_features = []  
+        # Per target layer: id, name, fields, wkb_type, crs and the selected features
+        self.selection_results = []
 
 
 
@@ -69,7 +102,7 @@ class GridFilter:
             print("No selected features available to create ROI.")
             return None
 
-        roi_layer = QgsVectorLayer("Polygon?crs=" + self.reference_layer.crs().authid(), "ROI", "memory")
+        roi_layer = QgsVectorLayer("Polygon?crs=" + self.crs_authid, "ROI", "memory")
         provider = roi_layer.dataProvider()
 
         for geom in self.selected_features:
@@ -90,6 +123,18 @@ class GridFilter:
             raise ValueError(f"Layer '{layer_name}' not found in QGIS.")
 
     def select_layers_within_buffer(self, buffer_distance=None, reference_layer_names=None, target_layer_names=None):
+        prepared = self.prepare_selection(buffer_distance, reference_layer_names, target_layer_names)
+        if prepared is None:
+            return
+        self.compute_selection(prepared)
+        self.apply_selection()
+
+    def prepare_selection(self, buffer_distance=None, reference_layer_names=None, target_layer_names=None):
+        """
+        Main thread: find the layers and snapshot them as feature sources
+
+        :return: dict for compute_selection(), or None if layers are missing
+        """
         if buffer_distance is None:
             buffer_distance = self.buffer_distance
 
@@ -114,7 +159,7 @@ class GridFilter:
 
         if not reference_layers:
             print("No reference layers found.")
-            return
+            return None
 
         target_layers = [
             layer for layer_id, layer in layers.items() 
@@ -123,51 +168,111 @@ class GridFilter:
 
         if not target_layers:
             print("No target layers found.")
-            return
+            return None
 
+        # Feature sources can be iterated from any thread, layers cannot
+        return {
+            "buffer_distance": buffer_distance,
+            "references": [QgsVectorLayerFeatureSource(layer) for layer in reference_layers],
+            "targets": [
+                {
+                    "layer_id": layer.id(),
+                    "name": layer.name(),
+                    "fields": layer.fields(),
+                    "wkb_type": layer.wkbType(),
+                    "crs": layer.crs(),
+                    "source": QgsVectorLayerFeatureSource(layer),
+                }
+                for layer in target_layers
+            ],
+        }
+
+    def compute_selection(self, prepared, is_canceled=None, on_progress=None):
+        """
+        Find the target features within the buffer of the reference features; safe to call outside the main thread
+
+        :param prepared: Result of prepare_selection()
+        :param is_canceled: Optional callable, returning True stops the selection
+        :param on_progress: Optional callable receiving the fraction done (0 to 1)
+        :return: self.selection_results, or None if cancelled
+        """
+        buffer_distance = prepared["buffer_distance"]
+
+        # Buffer each reference feature once; a prepared geometry makes the
+        # repeated intersects tests against it cheap. The engine only points to
+        # the buffer, so the buffer is kept alongside it
+        buffered_references = []
+        with span("buffer", "select"):
+            for reference_source in prepared["references"]:
+                for reference_feature in reference_source.getFeatures():
+                    buffered_geom = reference_feature.geometry().buffer(buffer_distance, 5)
+                    engine = QgsGeometry.createGeometryEngine(buffered_geom.constGet())
+                    engine.prepareGeometry()
+                    buffered_references.append((buffered_geom.boundingBox(), buffered_geom, engine))
+
+        results = []
+        steps = max(len(buffered_references) * len(prepared["targets"]), 1)
+        step = 0
+        for target in prepared["targets"]:
+            selected = {}
+
+            with span("intersects", "select", layer=target["name"]):
+                for bbox, _, engine in buffered_references:
+                    if is_canceled is not None and is_canceled():
+                        return None
+
+                    # Only the features near this reference feature are tested
+                    request = QgsFeatureRequest().setFilterRect(bbox)
+                    for feature in target["source"].getFeatures(request):
+                        if feature.id() not in selected and engine.intersects(feature.geometry().constGet()):
+                            selected[feature.id()] = feature
+
+                    step += 1
+                    if on_progress is not None:
+                        on_progress(step / steps)
+
+            result = {key: value for key, value in target.items() if key != "source"}
+            result["features"] = list(selected.values())
+            results.append(result)
+
+        self.selection_results = results
+        self.selected_features = [feature.geometry() for result in results for feature in result["features"]]
+        return results
+
+    def apply_selection(self):
+        """Main thread: select the computed features in their layers."""
+        project = QgsProject.instance()
         self.selected_layers = []
-        self.selected_features = []  
-
-        for target_layer in target_layers:
-            target_layer.startEditing()
-            target_layer.removeSelection()
-            selected_feature_ids = set()
 
-            for reference_layer in reference_layers:
-                buffered_reference_geoms = [
-                    reference_feature.geometry().buffer(buffer_distance, 5) 
-                    for reference_feature in reference_layer.getFeatures()
-                ]
+        for result in self.selection_results:
+            target_layer = project.mapLayer(result["layer_id"])
+            if target_layer is None:
+                continue  # Removed from the project meanwhile
 
-                for feature in target_layer.getFeatures():
-                    feature_geom = feature.geometry()
-
-                    if any(buffered_geom.intersects(feature_geom) for buffered_geom in buffered_reference_geoms):
-                        selected_feature_ids.add(feature.id())
-                        self.selected_features.append(feature.geometry())  
-
-            if selected_feature_ids:
-                target_layer.selectByIds(list(selected_feature_ids))
-            
-            target_layer.commitChanges()
+            target_layer.removeSelection()
+            selected_feature_ids = [feature.id() for feature in result["features"]]
 
             if selected_feature_ids:
+                target_layer.selectByIds(selected_feature_ids)
                 self.selected_layers.append(target_layer)
                 print(f"Selected {len(selected_feature_ids)} features in {target_layer.name()}")
 
         print("Selection completed.")
 
-    def apply_grid_separator(self, grid_size=20, output_path="Grid/grid.shp"):
+    def apply_grid_separator(self, grid_size=20, output_path="Grid/grid.shp", is_canceled=None, on_progress=None):
         grid_generator = GridGenerator(
             reference_layer_name=self.reference_layer_name, 
             grid_size=grid_size, 
             output_path=output_path
         )
         
-        grid_layer = grid_generator.save_grid()
+        grid_layer = grid_generator.save_grid(is_canceled, on_progress)
+        if grid_layer is None:
+            return None
         print(f"Grid separator applied and saved to {output_path}")
         return grid_layer
 
+    @timed("filter_grid_by_selection", "filter")
     def filter_grid_by_selection(self, grid_layer):
         if not self.selected_features:
             print("No selected features to filter the grid.")
@@ -185,47 +290,42 @@ class GridFilter:
         return filtered_grid
     
     
+    @timed("export_selected_layers", "select")
     def export_selected_layers(self, export_dir="Exported_Layers", filtered_grid=None):
         os.makedirs(export_dir, exist_ok=True)
+        # Exported from the computed selection, so this also works outside the main thread
+        selections = [result for result in self.selection_results if result["features"]]
         print("Contents of self.selected_layers:")
-        for layer in self.selected_layers:
-            print(f"  - {layer.name()}")
+        for result in selections:
+            print(f"  - {result['name']}")
 
-        for idx, selected_layer in enumerate(self.selected_layers):
+        for idx, result in enumerate(selections):
             layer_name = f"selected_layer_{idx + 1}.shp"
             export_path = os.path.join(export_dir, layer_name)
 
             # Create a new layer containing only selected features
-            selected_features = selected_layer.selectedFeatures()
-            print(f"Number of selected features in {selected_layer.name()}: {len(selected_features)}")
-            if not selected_features:
-                print(f"No selected features in {selected_layer.name()}, skipping export.")
-                continue
-            # Create a new memory layer for the selected features
-            selected_layer_filtered = QgsVectorLayer(
-                selected_layer.source(), f"Selected_{selected_layer.name()}", "memory"
+            selected_features = result["features"]
+            print(f"Number of selected features in {result['name']}: {len(selected_features)}")
+            # Create a new memory layer for the selected features, with the source fields
+            selected_layer_filtered = QgsMemoryProviderUtils.createMemoryLayer(
+                f"Selected_{result['name']}", result["fields"], result["wkb_type"], result["crs"]
             )
             provider = selected_layer_filtered.dataProvider()
             provider.addFeatures(selected_features)
 
             # --- Use the new writeAsVectorFormatV3 method ---
-            crs = selected_layer.crs()
             transform_context = QgsCoordinateTransformContext()
             options = QgsVectorFileWriter.SaveVectorOptions()
             options.fileEncoding = "UTF-8"
             options.driverName = "ESRI Shapefile"
 
-            # Initialize an error message variable
-            error_message = ""
-            
-            # Corrected writeAsVectorFormatV3 call: passing 5 arguments
-            error = QgsVectorFileWriter.writeAsVectorFormatV3(
+            # Returns (error, error_message, new_filename, new_layer)
+            error, error_message = QgsVectorFileWriter.writeAsVectorFormatV3(
                 selected_layer_filtered,
                 export_path,
                 transform_context,
-                options,
-                error_message
-            )
+                options
+            )[:2]
 
             if error == QgsVectorFileWriter.NoError:
                 print(f"Exported selected layer {idx + 1} to {export_path}")
@@ -243,16 +343,80 @@ class GridFilter:
             options_grid.fileEncoding = "UTF-8"
             options_grid.driverName = "ESRI Shapefile"
 
-            error_message_grid = ""
-            error_grid = QgsVectorFileWriter.writeAsVectorFormatV3(
+            error_grid, error_message_grid = QgsVectorFileWriter.writeAsVectorFormatV3(
                 filtered_grid,
                 grid_path,
                 transform_context_grid,
-                options_grid,
-                error_message_grid
-            )
+                options_grid
+            )[:2]
 
             if error_grid == QgsVectorFileWriter.NoError:
                 print(f"Filtered grid exported to {grid_path}")
             else:
                 print(f"Error exporting filtered grid: {error_message_grid}")
+
+
+class GridGenerationTask(QgsTask):
+    def __init__(self, reference_layer_name, on_finished, buffer_distance=5, grid_size=20,
+                 export_dir="Exported_Layers", grid_path="Grid/grid.shp"):
+        """
+        Background task running selection, ROI, export and grid generation
+
+        Layers are looked up here, on the main thread; run() only reads the
+        snapshots taken from them. The selection is applied to the layers
+        once the task is back on the main thread.
+
+        :param reference_layer_name: Layer the selection and the grid are built from
+        :param on_finished: Called on the main thread as on_finished(task, result)
+        :param buffer_distance: Selection buffer around the reference layer, in meters
+        :param grid_size: Grid cell size, in meters
+        :param export_dir: Folder receiving the selected features
+        :param grid_path: Output path of the grid
+        """
+        super(GridGenerationTask, self).__init__("Generating grid", QgsTask.CanCancel)
+        self.on_finished = on_finished
+        self.export_dir = export_dir
+        self.grid_filter = GridFilter(reference_layer_name, buffer_distance)
+        self.grid_generator = GridGenerator(reference_layer_name, grid_size, grid_path)
+        self.prepared = self.grid_filter.prepare_selection()
+        self.grid_layer = None
+        self.error = None
+
+    def run(self):
+        """Runs in a worker thread."""
+        try:
+            if self.prepared is not None:
+                # Selection is most of the work: 0-60 %
+                results = self.grid_filter.compute_selection(
+                    self.prepared, self.isCanceled, lambda fraction: self.setProgress(60 * fraction)
+                )
+                if results is None:
+                    return False
+
+                self.grid_filter.create_roi_from_bbox()
+                self.grid_filter.export_selected_layers(self.export_dir)
+            self.setProgress(70)
+
+            grid_layer = self.grid_generator.save_grid(
+                self.isCanceled, lambda fraction: self.setProgress(70 + 30 * fraction)
+            )
+            if grid_layer is None:
+                return False
+
+            # Memory layers created here are handed over to the main thread
+            main_thread = QgsApplication.instance().thread()
+            grid_layer.moveToThread(main_thread)
+            if self.grid_filter.roi_layer is not None:
+                self.grid_filter.roi_layer.moveToThread(main_thread)
+            self.grid_layer = grid_layer
+            return True
+
+        except Exception as e:
+            self.error = str(e)
+            return False
+
+    def finished(self, result):
+        """Runs on the main thread once run() returned or the task was cancelled."""
+        if result:
+            self.grid_filter.apply_selection()
+        self.on_finished(self, result)
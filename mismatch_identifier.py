@@ -1,12 +1,163 @@
+import argparse
 import cv2
+import hashlib
+import io
+import json
 import numpy as np
+import mmap
 import os
+import queue
 import shutil
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .capture_settings import DEFAULT_PIXELS_PER_METER, DISTANCE_THRESHOLD_METERS
+    from .capture_manifest import CaptureManifest, manifest_path_for
+    from .feature_store import ENGINES, FeatureStore, decide_categories, feature_store_path_for
+    from .profiling import span
+    from .tile_stack import TileStack, is_tile_reference, parse_tile_reference, read_stacked_tile
+except ImportError:  # Run as a standalone script
+    from capture_settings import DEFAULT_PIXELS_PER_METER, DISTANCE_THRESHOLD_METERS
+    from capture_manifest import CaptureManifest, manifest_path_for
+    from feature_store import ENGINES, FeatureStore, decide_categories, feature_store_path_for
+    from profiling import span
+    from tile_stack import TileStack, is_tile_reference, parse_tile_reference, read_stacked_tile
+
+# Pixels kept around the colored lines when cropping before edge detection,
+# so the crop border does not change the Canny result near the lines
+ROI_MARGIN = 8
+
+# Tile deduplication: "exact" hashes the file bytes, "downsampled" a small
+# quantized copy of the image (tiles that differ by less share a category)
+DEDUP_MODES = ("exact", "downsampled")
+DEDUP_THUMBNAIL_SIZE = 32
+
+# Stacked tiles (see tile_stack) are gathered in chunks of this many cells,
+# then classified in batches of consecutive slots
+STACK_CHUNK_SIZE = 1024
+
+
+def read_tile(image_path):
+    """Reads a captured tile as a BGR array (PNG/WebP/JPEG, raw NPY or a tile stack reference from GridCapture)."""
+    if is_tile_reference(image_path):
+        return read_stacked_tile(image_path)
+    if image_path.lower().endswith(".npy"):
+        if not os.path.exists(image_path):
+            return None
+        return np.load(image_path)
+    return cv2.imread(image_path)
+
+
+def decode_tile(data, image_path):
+    """Decodes the bytes of a tile file, like read_tile(image_path)."""
+    if image_path.lower().endswith(".npy"):
+        return np.load(io.BytesIO(data))
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class TileMover:
+    def __init__(self, batch_size=64, max_queue_size=256):
+        """
+        Move classified tiles to their category folders on a background thread
+
+        Queued moves are taken in batches of up to batch_size. The thread that
+        owns the manifest collects the finished ones with drain() and records
+        them, so a cell is never marked classified before its file has moved.
+
+        :param batch_size: Maximum number of moves done per wake-up
+        :param max_queue_size: Number of moves allowed to wait (backpressure on the classifier)
+        """
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.errors = []
+        self._done = queue.Queue()
+
+        self._thread = threading.Thread(target=self._run, name="TileMover", daemon=True)
+        self._thread.start()
+
+    def move(self, source, destination, context):
+        """
+        Queue a move; blocks while the queue is full
+
+        :param context: Returned by drain() once the file has moved
+        """
+        self.queue.put((source, destination, context))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            with span("move", "classify", tiles=len(batch)):
+                for source, destination, context in batch:
+                    try:
+                        shutil.move(source, destination)
+                    except OSError as e:
+                        self.errors.append((source, str(e)))
+                        print(f"Failed to move {source}: {str(e)}")
+                        continue
+                    print(f"Moved {os.path.basename(source)} to {os.path.basename(os.path.dirname(destination))}")
+                    self._done.put(context)
+
+    def drain(self):
+        """Contexts of the moves finished since the last call."""
+        done = []
+        while True:
+            try:
+                done.append(self._done.get_nowait())
+            except queue.Empty:
+                return done
+
+    def close(self):
+        """Wait for the queued moves."""
+        self.queue.put(None)
+        self._thread.join()
+
 
 class MismatchIdentifier:
-    def __init__(self, input_folder="Output_images", output_folder="Classified_images"):
+    def __init__(self, input_folder="Output_images", output_folder="Classified_images",
+                 pixels_per_meter=DEFAULT_PIXELS_PER_METER, distance_threshold=DISTANCE_THRESHOLD_METERS,
+                 engine="contours", dedup="exact", dedup_cache_size=100000):
         self.input_folder = input_folder
         self.output_folder = output_folder
+        # Fallback resolution for images captured without metadata
+        self.pixels_per_meter = pixels_per_meter
+        self.distance_threshold = distance_threshold
+
+        # Feature extraction, by name (see feature_store.ENGINES)
+        self._engines = {
+            "contours": self._contour_features,
+            "morphology": self._morphology_features,
+        }
+        if engine not in self._engines:
+            raise ValueError(f"Unknown classification engine '{engine}', expected one of {', '.join(ENGINES)}")
+        self.engine = engine
+
+        # How often each shortcut of extract_features fired: color presence,
+        # then tiles with both colors but no red or no green edges
+        self.shortcut_counts = {"empty": 0, "no_green": 0, "no_red": 0, "both_colors": 0, "no_edge_pair": 0}
+
+        # Identical tiles (blank cells, straight ducts...) are classified once
+        if dedup is not None and dedup not in DEDUP_MODES:
+            raise ValueError(f"Unknown dedup mode '{dedup}', expected one of {', '.join(DEDUP_MODES)}")
+        self.dedup = dedup
+        self.dedup_cache_size = dedup_cache_size
+        self._dedup_cache = OrderedDict()  # Tile key -> classify_image_details() result, least recent first
+        self.dedup_counts = {"classified": 0, "duplicates": 0}
 
         # Define HSV color ranges
         self.color_ranges = {
@@ -38,77 +189,535 @@ class MismatchIdentifier:
 
         return detected_colors
 
-    def calculate_pixels_per_meter(self):
-        """Calculates the pixels per meter for the given image."""
-        # Each cell is 20x20 meters, and the image is 3000x3000 pixels
-        pixels_per_meter = 2000 / 10  # 150 pixels per meter
-        return pixels_per_meter
+    def calculate_pixels_per_meter(self, metadata=None):
+        """Returns the pixels per meter recorded by GridCapture for an image."""
+        if metadata:
+            if metadata.get("pixels_per_meter"):
+                return float(metadata["pixels_per_meter"])
 
-    def classify_image(self, image_path):
+            # Older captures: derive it from the image size and the cell extent
+            extent = metadata.get("extent")
+            if extent and metadata.get("image_width"):
+                return metadata["image_width"] / (extent["xmax"] - extent["xmin"])
+
+        return self.pixels_per_meter
+
+    def _load_metadata(self, json_path):
+        """Loads the JSON metadata written by GridCapture, if any."""
+        if not os.path.exists(json_path):
+            return None
+        with open(json_path) as f:
+            return json.load(f)
+
+    def classify_image(self, image_path, pixels_per_meter=None):
         """Classifies an image into one of the predefined categories."""
-        image = cv2.imread(image_path)
+        details = self.classify_image_details(image_path, pixels_per_meter)
+        return details["category"] if details else None
+
+    def classify_image_details(self, image_path, pixels_per_meter=None, image=None):
+        """Classifies an image and returns its category, the measured red-to-green distance and its features."""
+        if image is None:
+            with span("decode", "classify"):
+                image = read_tile(image_path)
         if image is None:
             return None  # Skip invalid images
 
-        hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        features = self.extract_features(image, pixels_per_meter)
+        return {
+            "category": self.decide_category(features),
+            "min_distance_m": features["min_distance_m"],
+            "features": features,
+        }
+
+    def decide_category(self, features):
+        """Applies the category rules to the features of one image (see feature_store.decide_categories)."""
+        return str(decide_categories(features, self.distance_threshold)[0])
+
+    def extract_features(self, image, pixels_per_meter=None):
+        """
+        Measures what the category rules need from a BGR image
+
+        Color pixel counts, then the measures of the selected engine: edge
+        pixel and contour counts and red-to-green contour distances for
+        "contours", red pixel distances to the green mask for "morphology".
+        Distances are in meters, None when there is nothing to measure.
+
+        The color counts come first because they are cheap: engines skip the
+        measures the decision cannot use (see shortcut_counts).
+        """
+        if pixels_per_meter is None:
+            pixels_per_meter = self.calculate_pixels_per_meter()
+
+        green_mask, red_mask, white_mask = self._color_masks(image)
+        features = self._color_features(
+            pixels_per_meter, cv2.countNonZero(green_mask), cv2.countNonZero(red_mask), cv2.countNonZero(white_mask)
+        )
+        features.update(self._engines[self.engine](image, green_mask, red_mask, features))
+        return features
+
+    def extract_features_batch(self, tiles, pixels_per_meter):
+        """
+        extract_features() of a batch of tiles of the same size
+
+        The tiles are stacked into one tall image, so the color conversion and
+        the color masks run once for the whole batch and the pixel counts are
+        vectorized; the engine then runs on each tile's rows of the masks.
+
+        :param tiles: B x H x W x 3 BGR array (e.g. from TileStack.batches())
+        :param pixels_per_meter: Resolution of each tile
+        :return: List of feature dicts, in tile order
+        """
+        tiles = np.asarray(tiles)
+        count, height = tiles.shape[:2]
+        image = tiles.reshape((count * height,) + tiles.shape[2:])
+        green_mask, red_mask, white_mask = self._color_masks(image)
+
+        pixel_counts = [
+            np.count_nonzero(mask.reshape(count, -1), axis=1).tolist()
+            for mask in (green_mask, red_mask, white_mask)
+        ]
+        batch_features = []
+        for index, counts in enumerate(zip(*pixel_counts)):
+            features = self._color_features(pixels_per_meter[index], *counts)
+            rows = slice(index * height, (index + 1) * height)
+            features.update(self._engines[self.engine](tiles[index], green_mask[rows], red_mask[rows], features))
+            batch_features.append(features)
+        return batch_features
+
+    def _color_masks(self, image):
+        """Green, red and white masks of a BGR image."""
+        with span("hsv", "classify"):
+            hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+        # Color-Based Filtering
+        with span("in_range", "classify"):
+            green_mask = cv2.inRange(hsv_image, np.array(self.color_ranges["green"][0]), np.array(self.color_ranges["green"][1]))
+            red_mask1 = cv2.inRange(hsv_image, np.array(self.color_ranges["red1"][0]), np.array(self.color_ranges["red1"][1]))
+            red_mask2 = cv2.inRange(hsv_image, np.array(self.color_ranges["red2"][0]), np.array(self.color_ranges["red2"][1]))
+            red_mask = cv2.bitwise_or(red_mask1, red_mask2)
+            white_mask = cv2.inRange(hsv_image, np.array(self.color_ranges["white"][0]), np.array(self.color_ranges["white"][1]))
+        return green_mask, red_mask, white_mask
+
+    def _color_features(self, pixels_per_meter, green_pixels, red_pixels, white_pixels):
+        """Color part of the features, counted in shortcut_counts."""
+        if green_pixels and red_pixels:
+            self.shortcut_counts["both_colors"] += 1
+        elif green_pixels:
+            self.shortcut_counts["no_red"] += 1
+        elif red_pixels:
+            self.shortcut_counts["no_green"] += 1
+        else:
+            self.shortcut_counts["empty"] += 1
+        return {
+            "engine": ENGINES.index(self.engine),
+            "pixels_per_meter": pixels_per_meter,
+            "green_pixels": green_pixels,
+            "red_pixels": red_pixels,
+            "white_pixels": white_pixels,
+        }
+
+    def _contour_features(self, image, green_mask, red_mask, features):
+        """
+        Contours engine: edges of the colored lines and the distances between their contours
+
+        Edge detection only runs where the decision needs it: not at all
+        without green pixels (the tile is "random"), on the bounding box of the
+        green pixels without red ones (only the green edge count matters), on
+        the bounding box of both colors otherwise. Counts that are not needed
+        are left at 0.
+        """
+        result = {
+            "green_edge_pixels": 0, "red_edge_pixels": 0, "green_contours": 0, "red_contours": 0,
+            "min_distance_m": None, "median_distance_m": None, "max_distance_m": None,
+        }
+        if not features["green_pixels"]:
+            return result
+
+        with span("roi", "classify"):
+            colored_mask = cv2.bitwise_or(green_mask, red_mask) if features["red_pixels"] else green_mask
+            x, y, width, height = cv2.boundingRect(colored_mask)
+            x0, y0 = max(0, x - ROI_MARGIN), max(0, y - ROI_MARGIN)
+            x1 = min(image.shape[1], x + width + ROI_MARGIN)
+            y1 = min(image.shape[0], y + height + ROI_MARGIN)
+            roi = (slice(y0, y1), slice(x0, x1))
 
         # 1. Edge Detection
-        edges = cv2.Canny(image, 50, 150)
-
-        # 2. Color-Based Filtering
-        green_mask = cv2.inRange(hsv_image, np.array(self.color_ranges["green"][0]), np.array(self.color_ranges["green"][1]))
-        red_mask1 = cv2.inRange(hsv_image, np.array(self.color_ranges["red1"][0]), np.array(self.color_ranges["red1"][1]))
-        red_mask2 = cv2.inRange(hsv_image, np.array(self.color_ranges["red2"][0]), np.array(self.color_ranges["red2"][1]))
-        red_mask = cv2.bitwise_or(red_mask1, red_mask2)
-
-        green_edges = cv2.bitwise_and(edges, edges, mask=green_mask)
-        red_edges = cv2.bitwise_and(edges, edges, mask=red_mask)
-
-        green_contours, _ = cv2.findContours(green_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        red_contours, _ = cv2.findContours(red_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        green_lines_present = np.sum(green_edges) > 0
-        red_lines_present = np.sum(red_edges) > 0
-
-        pixels_per_meter = self.calculate_pixels_per_meter()
-
-        min_distance_meters = float('inf')
-        for red_contour in red_contours:
-            for green_contour in green_contours:
-                # Calculate minimum distance between red_contour and green_contour
-                distance_pixels = cv2.pointPolygonTest(green_contour, (int(red_contour[0][0][0]), int(red_contour[0][0][1])), True)
-                distance_meters = abs(distance_pixels) / pixels_per_meter
-                min_distance_meters = min(min_distance_meters, distance_meters)
-
-        if min_distance_meters < 0.5 and green_lines_present and red_lines_present:
-            return "please_check"
-        elif green_lines_present and red_lines_present:
-            return "cartography_error"
-        elif green_lines_present and not red_lines_present:
-            return "no_cartography_error"
+        with span("canny", "classify"):
+            edges = cv2.Canny(image[roi], 50, 150)
+
+        if not features["red_pixels"]:
+            with span("contours", "classify"):
+                green_edges = cv2.bitwise_and(edges, edges, mask=green_mask[roi])
+            result["green_edge_pixels"] = cv2.countNonZero(green_edges)
+            return result
+
+        # 2. Edges of the colored lines
+        pixels_per_meter = features["pixels_per_meter"]
+        with span("contours", "classify"):
+            green_edges = cv2.bitwise_and(edges, edges, mask=green_mask[roi])
+            red_edges = cv2.bitwise_and(edges, edges, mask=red_mask[roi])
+            result["green_edge_pixels"] = cv2.countNonZero(green_edges)
+            result["red_edge_pixels"] = cv2.countNonZero(red_edges)
+            if not result["green_edge_pixels"] or not result["red_edge_pixels"]:
+                # No distance to measure: the edge counts decide
+                self.shortcut_counts["no_edge_pair"] += 1
+                return result
+
+            # Offset back to image coordinates
+            green_contours, _ = cv2.findContours(green_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
+            red_contours, _ = cv2.findContours(red_edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
+
+        # Distance from each red contour to the nearest green contour
+        distances = []
+        with span("distance", "classify", pairs=len(red_contours) * len(green_contours)):
+            for red_contour in red_contours:
+                min_distance_meters = float('inf')
+                for green_contour in green_contours:
+                    # Calculate minimum distance between red_contour and green_contour
+                    distance_pixels = cv2.pointPolygonTest(green_contour, (int(red_contour[0][0][0]), int(red_contour[0][0][1])), True)
+                    distance_meters = abs(distance_pixels) / pixels_per_meter
+                    min_distance_meters = min(min_distance_meters, distance_meters)
+                if green_contours:
+                    distances.append(min_distance_meters)
+
+        result.update(
+            green_contours=len(green_contours),
+            red_contours=len(red_contours),
+            min_distance_m=min(distances) if distances else None,
+            median_distance_m=float(np.median(distances)) if distances else None,
+            max_distance_m=max(distances) if distances else None,
+        )
+        return result
+
+    def _morphology_features(self, image, green_mask, red_mask, features):
+        """
+        Morphology engine: dilates the green mask by the distance threshold and ANDs it with the red mask
+
+        The dilation by a disk of threshold x pixels_per_meter is read from the
+        distance transform of the green mask: same mask as cv2.dilate, but
+        O(pixels) whatever the radius, and it gives the distance of every red
+        pixel on the way. No edges or contours are computed.
+        """
+        result = {
+            "green_edge_pixels": 0, "red_edge_pixels": 0, "green_contours": 0, "red_contours": 0,
+            "min_distance_m": None, "median_distance_m": None, "max_distance_m": None, "near_red_ratio": None,
+        }
+        if not features["green_pixels"] or not features["red_pixels"]:
+            return result  # Nothing to measure
+
+        pixels_per_meter = features["pixels_per_meter"]
+        with span("distance_transform", "classify"):
+            # Distance of every pixel to the nearest green pixel
+            distance = cv2.distanceTransform(cv2.bitwise_not(green_mask), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+        with span("overlap", "classify"):
+            radius = self.distance_threshold * pixels_per_meter
+            _, near_green = cv2.threshold(distance, radius, 255, cv2.THRESH_BINARY_INV)
+            overlap = cv2.bitwise_and(red_mask, near_green.astype(np.uint8))
+            min_distance, max_distance, _, _ = cv2.minMaxLoc(distance, mask=red_mask)
+
+            # Lower median: within the threshold exactly when half of the red pixels overlap
+            red_distances = distance[red_mask > 0]
+            middle = (len(red_distances) - 1) // 2
+            median_distance = float(np.partition(red_distances, middle)[middle])
+
+        result.update(
+            min_distance_m=min_distance / pixels_per_meter,
+            median_distance_m=median_distance / pixels_per_meter,
+            max_distance_m=max_distance / pixels_per_meter,
+            near_red_ratio=cv2.countNonZero(overlap) / features["red_pixels"],
+        )
+        return result
+
+    def process_images(self, prefetch_workers=4, prefetch_depth=16, move_batch_size=64, stack_batch_size=16):
+        """
+        Classifies the captured images listed in the manifest and records the results in it.
+
+        Reading and decoding run ahead on a thread pool (at most prefetch_depth
+        tiles in flight), classification on this thread, and the moves to the
+        category folders on a TileMover thread. A cell is recorded in the
+        manifest once its image has been moved.
+
+        Tiles captured into a tile stack are not decoded nor moved: they are
+        classified in batches of up to stack_batch_size consecutive slots (see
+        _classify_stacked()) and keep their stack reference in the manifest.
+        """
+        manifest_path = manifest_path_for(self.input_folder)
+        if not os.path.exists(manifest_path):
+            # Captures made before the manifest still come with per-cell JSON files
+            self._process_legacy_images()
+            return
+
+        feature_store = FeatureStore(feature_store_path_for(self.input_folder))
+        mover = TileMover(batch_size=move_batch_size)
+        with CaptureManifest(manifest_path) as manifest:
+            try:
+                with ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="TilePrefetch") as executor:
+                    pending = deque()
+                    stacked = []
+                    for cell in manifest.iter_cells("category IS NULL"):
+                        if is_tile_reference(cell["image_path"]):
+                            stacked.append(cell)
+                            if len(stacked) >= STACK_CHUNK_SIZE:
+                                self._classify_stacked(stacked, manifest, feature_store, stack_batch_size)
+                                stacked = []
+                            continue
+                        pixels_per_meter = self.calculate_pixels_per_meter(cell)
+                        future = executor.submit(self._load_tile, cell["image_path"], pixels_per_meter)
+                        pending.append((cell, pixels_per_meter, future))
+                        if len(pending) >= prefetch_depth:
+                            self._classify_prefetched(*pending.popleft(), feature_store, mover)
+                            self._record_moved(manifest, mover)
+                    while pending:
+                        self._classify_prefetched(*pending.popleft(), feature_store, mover)
+                        self._record_moved(manifest, mover)
+                    self._classify_stacked(stacked, manifest, feature_store, stack_batch_size)
+            finally:
+                mover.close()
+                self._record_moved(manifest, mover)
+                # The manifest keeps the categories of an interrupted run: keep their features too,
+                # as these cells won't be extracted again
+                feature_store.save()
+        print(f"Classification shortcuts: {self.shortcut_counts}")
+        print(self.dedup_summary())
+
+    def _classify_prefetched(self, cell, pixels_per_meter, future, feature_store, mover):
+        """Classifies a prefetched tile and queues its move."""
+        key, image = future.result()
+        details = self._classify_loaded(cell["image_path"], pixels_per_meter, key, image)
+        if not details:
+            return  # Skip missing or invalid images
+        result = self._cell_result(cell, details, feature_store)
+        mover.move(cell["image_path"], result["image_path"], (cell["grid_id"], result))
+
+    def _classify_stacked(self, cells, manifest, feature_store, batch_size=16):
+        """
+        Classifies stacked tiles straight from the memory map of their stack and records them in the manifest
+
+        :param cells: Manifest rows whose image_path is a tile stack reference
+        :param batch_size: Maximum number of tiles per extract_features_batch() call
+        """
+        by_stack = {}
+        for cell in cells:
+            folder, grid_id = parse_tile_reference(cell["image_path"])
+            by_stack.setdefault(folder, {})[grid_id] = cell
+
+        for folder, stacked_cells in by_stack.items():
+            if not TileStack.exists(folder):
+                print(f"Tile stack {folder} not found, {len(stacked_cells)} cells skipped")
+                continue
+            stack = TileStack(folder)
+            try:
+                # Cells missing from the stack are skipped, like missing images
+                for grid_ids, tiles in stack.batches(stacked_cells, batch_size):
+                    batch_cells = [stacked_cells[grid_id] for grid_id in grid_ids]
+                    batch_features = self.extract_features_batch(
+                        tiles, [self.calculate_pixels_per_meter(cell) for cell in batch_cells]
+                    )
+                    columns = {name: [features[name] for features in batch_features] for name in batch_features[0]}
+                    categories = decide_categories(columns, self.distance_threshold).tolist()
+                    self.dedup_counts["classified"] += len(batch_cells)
+
+                    for cell, features, category in zip(batch_cells, batch_features, categories):
+                        result = self._cell_result(
+                            cell,
+                            {"category": category, "min_distance_m": features["min_distance_m"], "features": features},
+                            feature_store,
+                        )
+                        manifest.update_cell(cell["grid_id"], **result)
+            finally:
+                stack.close()
+
+    def _record_moved(self, manifest, mover):
+        """Records the cells whose image has been moved (the manifest stays on this thread)."""
+        for grid_id, result in mover.drain():
+            # Updates are committed in batches by the manifest
+            manifest.update_cell(grid_id, **result)
+
+    def dedup_summary(self):
+        """One line with the number of classified and duplicate tiles."""
+        total = self.dedup_counts["classified"] + self.dedup_counts["duplicates"]
+        ratio = self.dedup_counts["duplicates"] / total if total else 0.0
+        return (f"Deduplication ({self.dedup}): {total} tiles, {self.dedup_counts['classified']} classified, "
+                f"{self.dedup_counts['duplicates']} duplicates ({ratio:.1%})")
+
+    def _load_tile(self, image_path, pixels_per_meter):
+        """
+        Reads a tile through a memory map and decodes it; safe to call from prefetch threads
+
+        :return: (dedup key, image). The key is None without dedup; the image is
+            None for an unreadable tile or one whose key is already in the dedup cache
+        """
+        if is_tile_reference(image_path):
+            # Already decoded in the stack: read the view, no dedup
+            return None, read_stacked_tile(image_path)
+        try:
+            f = open(image_path, "rb")
+        except OSError:
+            return None, None
+        with f:
+            if not os.fstat(f.fileno()).st_size:
+                return None, None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = np.frombuffer(mapped, dtype=np.uint8)
+                try:
+                    key = None
+                    if self.dedup == "exact":
+                        with span("dedup_hash", "classify"):
+                            key = (hashlib.blake2b(data, digest_size=16).hexdigest(), pixels_per_meter)
+                        if key in self._dedup_cache:
+                            return key, None  # Known duplicate: no need to decode
+
+                    with span("decode", "classify"):
+                        image = decode_tile(data, image_path)
+                    if image is not None and self.dedup == "downsampled":
+                        with span("dedup_hash", "classify"):
+                            key = self._thumbnail_key(image, pixels_per_meter)
+                    return key, image
+                finally:
+                    # The map cannot close while an array still points into it
+                    del data
+
+    def _thumbnail_key(self, image, pixels_per_meter):
+        """Dedup key of the "downsampled" mode."""
+        thumbnail = cv2.resize(image, (DEDUP_THUMBNAIL_SIZE, DEDUP_THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+        # 16 levels per channel, so antialiasing noise does not split identical drawings
+        digest = hashlib.blake2b(np.right_shift(thumbnail, 4).tobytes(), digest_size=16).hexdigest()
+        return digest, image.shape, pixels_per_meter
+
+    def _classify_loaded(self, image_path, pixels_per_meter, key, image):
+        """classify_image_details() of a loaded tile, reusing the result of an identical tile when there is one."""
+        if key is not None and key in self._dedup_cache:
+            self._dedup_cache.move_to_end(key)
+            self.dedup_counts["duplicates"] += 1
+            return self._dedup_cache[key]
+
+        # image is None if the tile was unreadable, or evicted from the cache since it was loaded
+        details = self.classify_image_details(image_path, pixels_per_meter, image)
+        if details is None:
+            return None
+        self.dedup_counts["classified"] += 1
+
+        if key is not None:
+            self._dedup_cache[key] = details
+            if len(self._dedup_cache) > self.dedup_cache_size:
+                self._dedup_cache.popitem(last=False)
+        return details
+
+    def _cell_result(self, cell, details, feature_store=None):
+        """Manifest values of a classified cell; queues its features in feature_store, if given."""
+        if feature_store is not None:
+            feature_store.add(cell["grid_id"], details["features"])
+
+        category = details["category"]
+        if is_tile_reference(cell["image_path"]):
+            # Stacked tiles stay in their stack
+            destination = cell["image_path"]
         else:
-            return "random"
+            destination = os.path.abspath(os.path.join(self.output_folder, category, os.path.basename(cell["image_path"])))
+        return {
+            "category": category,
+            "min_distance_m": details["min_distance_m"],
+            "image_path": destination,
+        }
+
+    def classify_cell(self, cell, feature_store=None):
+        """
+        Classifies the image of one manifest row and moves it to its category folder (stacked tiles are not moved).
+
+        Returns the manifest values to update (category, min_distance_m, image_path),
+        or None if the image is missing or invalid. The features of the image
+        are queued in feature_store, if given. With dedup, a tile identical to
+        one already classified gets its result without being processed.
+        """
+        image_path = cell["image_path"]
+        pixels_per_meter = self.calculate_pixels_per_meter(cell)
+        key, image = self._load_tile(image_path, pixels_per_meter) if self.dedup else (None, None)
+        details = self._classify_loaded(image_path, pixels_per_meter, key, image)
+        if not details:
+            return None
 
-    def process_images(self):
+        result = self._cell_result(cell, details, feature_store)
+        if result["image_path"] != image_path:
+            with span("move", "classify"):
+                shutil.move(image_path, result["image_path"])
+            print(f"Moved {os.path.basename(image_path)} to {result['category']}")
+        return result
+
+    def reclassify(self, distance_threshold=None, move_files=True):
+        """
+        Recomputes the categories of the classified cells from the feature store, without reading any image
+
+        :param distance_threshold: New red/green distance threshold in meters (default: the current one)
+        :param move_files: Move the images whose category changed and record the change in the manifest;
+            if False, only count the categories (e.g. to tune the threshold)
+        :return: dict with the number of cells per category, of changed cells and of classified
+            cells missing from the feature store (left out of the counts)
+        """
+        if distance_threshold is not None:
+            self.distance_threshold = distance_threshold
+
+        features = FeatureStore(feature_store_path_for(self.input_folder)).load()
+        if not features:
+            print("No stored features: run process_images first.")
+            return None
+
+        categories = decide_categories(features, self.distance_threshold)
+        counts = {category: int(np.count_nonzero(categories == category)) for category in self.categories}
+
+        with CaptureManifest(manifest_path_for(self.input_folder)) as manifest:
+            previous = {
+                cell["grid_id"]: cell
+                for cell in manifest.iter_cells("category IS NOT NULL")
+            }
+            changed = 0
+            for grid_id, category in zip(features["grid_id"].tolist(), categories.tolist()):
+                cell = previous.get(grid_id)
+                if cell is None or cell["category"] == category:
+                    continue
+                changed += 1
+                if not move_files:
+                    continue
+                if is_tile_reference(cell["image_path"]):
+                    manifest.update_cell(grid_id, category=category)
+                    continue
+
+                destination = os.path.join(self.output_folder, category, os.path.basename(cell["image_path"]))
+                if os.path.exists(cell["image_path"]):
+                    shutil.move(cell["image_path"], destination)
+                manifest.update_cell(grid_id, category=category, image_path=os.path.abspath(destination))
+
+        counts["changed"] = changed
+        counts["missing_features"] = len(set(previous) - set(features["grid_id"].tolist()))
+        if counts["missing_features"]:
+            print(f"Warning: {counts['missing_features']} classified cells have no stored features "
+                  f"and keep their category")
+        print(f"Reclassified {len(categories)} cells at {self.distance_threshold} m: {counts}")
+        return counts
+
+    def _process_legacy_images(self):
         """Processes all images and JSON files in the input folder and classifies them."""
         for filename in os.listdir(self.input_folder):
-            if not filename.lower().endswith((".png", ".jpg", ".jpeg", ".json")):
+            if not filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".npy", ".json")):
                 continue  # Skip non-image and non-JSON files
 
             file_path = os.path.join(self.input_folder, filename)
 
-            if filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            if filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".npy")):
+                json_filename = filename.rsplit(".", 1)[0] + ".json"
+                json_path = os.path.join(self.input_folder, json_filename)
+                metadata = self._load_metadata(json_path)
+
                 # Classify the image
-                category = self.classify_image(file_path)
+                category = self.classify_image(file_path, self.calculate_pixels_per_meter(metadata))
                 if category:
                     destination = os.path.join(self.output_folder, category, filename)
-                    shutil.move(file_path, destination)
+                    with span("move", "classify"):
+                        shutil.move(file_path, destination)
                     print(f"Moved {filename} to {category}")
 
                     # Move the corresponding JSON file
-                    json_filename = filename.rsplit(".", 1)[0] + ".json"
-                    json_path = os.path.join(self.input_folder, json_filename)
-                    if os.path.exists(json_path):
+                    if metadata is not None:
                         json_destination = os.path.join(self.output_folder, category, json_filename)
                         shutil.move(json_path, json_destination)
                         print(f"Moved {json_filename} to {category}")
@@ -119,7 +728,8 @@ class MismatchIdentifier:
                 image_path = os.path.join(self.input_folder, image_filename)
 
                 if os.path.exists(image_path):  # Check if the corresponding image exists
-                    category = self.classify_image(image_path)
+                    metadata = self._load_metadata(file_path)
+                    category = self.classify_image(image_path, self.calculate_pixels_per_meter(metadata))
                     if category:
                         destination = os.path.join(self.output_folder, category, filename)
                         shutil.move(file_path, destination)
@@ -127,5 +737,17 @@ class MismatchIdentifier:
 
 # Run the classifier
 if __name__ == "__main__":
-    classifier = MismatchIdentifier()
-    classifier.process_images()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Classify the captured tiles.")
+    parser.add_argument("--reclassify", type=float, metavar="THRESHOLD",
+                        help="Recompute the categories from the stored features with this distance threshold (m)")
+    parser.add_argument("--dry-run", action="store_true", help="With --reclassify: only count the categories")
+    parser.add_argument("--engine", choices=ENGINES, default="contours", help="Classification engine")
+    parser.add_argument("--dedup", choices=DEDUP_MODES + ("none",), default="exact",
+                        help="Classify identical tiles once")
+    args = parser.parse_args()
+
+    classifier = MismatchIdentifier(engine=args.engine, dedup=None if args.dedup == "none" else args.dedup)
+    if args.reclassify is not None:
+        classifier.reclassify(args.reclassify, move_files=not args.dry_run)
+    else:
+        classifier.process_images()
\ No newline at end of file
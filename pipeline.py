@@ -0,0 +1,334 @@
+import os
+import time
+from qgis.core import QgsProject, QgsVectorFileWriter, QgsVectorLayer
+from .File_loader import FileLoader, compute_corridor_extent, list_required_layers, open_required_layer
+from .GridCapture import GridCapture
+from .capture_manifest import CaptureManifest, manifest_path_for
+from .capture_settings import DEFAULT_PIXELS_PER_METER
+from .errors_highlighter import ErrorsHighlighter
+from .exporter import ReportExporter
+from .grid_filter import GridFilter
+from .mismatch_identifier import MismatchIdentifier
+from .profiling import profiler, span
+from .streaming_classifier import StreamingClassifier
+from .style_registry import get_style_registry
+from .working_copy import WorkingCopyCache
+
+
+class PipelineContext:
+    def __init__(self, avant_folder="", apres_folder="", style_folder="", reference_layer_name="Arc_itineraire_AV",
+                 buffer_distance=5, grid_size=20, pixels_per_meter=DEFAULT_PIXELS_PER_METER,
+                 corridor_buffer=None, working_copy_mode=None, capture_options=None, classifier_engine="contours"):
+        """
+        Inputs, settings and intermediate results shared by the pipeline stages
+
+        Output paths are relative, like the rest of the plugin, so a run writes
+        into the current working directory.
+
+        :param avant_folder: Folder with the layers before the AI pass
+        :param apres_folder: Folder with the layers after the AI pass
+        :param style_folder: Optional folder with QML/SLD styles
+        :param reference_layer_name: Layer the selection and the grid are built from
+        :param buffer_distance: Selection buffer around the reference layer, in meters
+        :param grid_size: Grid cell size, in meters
+        :param pixels_per_meter: Capture resolution
+        :param corridor_buffer: If set, load reference layers only within this distance of the routes
+        :param working_copy_mode: Optional WorkingCopyCache mode ("gpkg" or "qix")
+        :param capture_options: Extra GridCapture keyword arguments (image_format, render_cache, ...)
+        :param classifier_engine: MismatchIdentifier engine ("contours" or "morphology")
+        """
+        self.avant_folder = avant_folder
+        self.apres_folder = apres_folder
+        self.style_folder = style_folder
+        self.reference_layer_name = reference_layer_name
+        self.buffer_distance = buffer_distance
+        self.grid_size = grid_size
+        self.pixels_per_meter = pixels_per_meter
+        self.corridor_buffer = corridor_buffer
+        self.working_copy_mode = working_copy_mode
+        self.capture_options = capture_options or {}
+        self.classifier_engine = classifier_engine
+
+        self.working_copy_folder = "Working_Copies"
+        self.grid_path = "Grid/grid.shp"
+        self.filtered_grid_path = "Grid/filtered_grid.shp"
+        self.export_dir = "Exported_Layers"
+        self.capture_folder = "Output_images"
+        self.classified_folder = "Classified_images"
+        self.report_folder = "Report"
+
+        # Filled in by the stages
+        self.grid_filter = None
+        self.grid_layer = None
+        self.classifier_stream = None
+        self.counts = {}
+
+
+class PipelineStage:
+    def __init__(self, name, run, depends_on=()):
+        """
+        One step of the pipeline
+
+        :param name: Stage name
+        :param run: Called as run(context)
+        :param depends_on: Names of the stages whose outputs this stage reads
+        """
+        self.name = name
+        self.run = run
+        self.depends_on = tuple(depends_on)
+
+
+def load_stage(context):
+    """Load the required layers of both folders into the project, headless (no dialog)."""
+    project = QgsProject.instance()
+    root = project.layerTreeRoot()
+
+    working_copies = None
+    if context.working_copy_mode:
+        working_copies = WorkingCopyCache(context.working_copy_folder, context.working_copy_mode)
+
+    corridor = None
+    if context.corridor_buffer is not None:
+        corridor = compute_corridor_extent([context.avant_folder, context.apres_folder], context.corridor_buffer)
+
+    loaded = 0
+    for folder_path, group_name, is_first_folder in (
+        (context.avant_folder, "Avant AI", True),
+        (context.apres_folder, "Apres AI", False),
+    ):
+        if not folder_path or not os.path.isdir(folder_path):
+            raise ValueError(f"Folder not found: {folder_path}")
+
+        group = root.findGroup(group_name)
+        if group:
+            root.removeChildNode(group)
+        group = root.addGroup(group_name)
+
+        required_layers = list_required_layers(os.path.normpath(folder_path), FileLoader.REQUIRED_FILES, is_first_folder)
+        for layer_path, layer_name, order, is_route in sorted(required_layers, key=lambda item: item[2]):
+            layer = open_required_layer(layer_path, layer_name, working_copies, None if is_route else corridor)
+            if layer is None:
+                raise ValueError(f"Failed to load layer: {os.path.basename(layer_path)}")
+
+            project.addMapLayer(layer, False)
+            group.addLayer(layer)
+            if context.style_folder:
+                get_style_registry(context.style_folder).apply(layer)
+            loaded += 1
+
+    context.counts["layers"] = loaded
+
+
+def select_stage(context):
+    """Select the features near the reference layer, build the ROI and export the selection."""
+    grid_filter = GridFilter(context.reference_layer_name, context.buffer_distance)
+    grid_filter.select_layers_within_buffer()
+    grid_filter.create_roi_from_bbox()
+    grid_filter.export_selected_layers(context.export_dir)
+
+    context.grid_filter = grid_filter
+    context.counts["selected_features"] = len(grid_filter.selected_features)
+
+
+def grid_stage(context):
+    """Generate the grid over the reference layer extent and save it."""
+    grid_filter = context.grid_filter or GridFilter(context.reference_layer_name, context.buffer_distance)
+    context.grid_layer = grid_filter.apply_grid_separator(context.grid_size, context.grid_path)
+    context.counts["grid_cells"] = context.grid_layer.featureCount()
+
+
+def filter_stage(context):
+    """Keep the grid cells that intersect the selection and save them for the capture."""
+    grid_layer = context.grid_layer
+    if grid_layer is None:
+        grid_layer = QgsVectorLayer(context.grid_path, "Grid", "ogr")
+        if not grid_layer.isValid():
+            raise ValueError(f"Grid not found: {context.grid_path}")
+
+    grid_filter = context.grid_filter
+    if grid_filter is None:
+        # The selection only lives in memory; redo it when this stage runs alone
+        grid_filter = GridFilter(context.reference_layer_name, context.buffer_distance)
+        grid_filter.select_layers_within_buffer()
+        context.grid_filter = grid_filter
+
+    filtered_grid = grid_filter.filter_grid_by_selection(grid_layer)
+    if filtered_grid is None:
+        # Nothing selected: capture the whole grid, not a stale filtered grid
+        if os.path.exists(context.filtered_grid_path):
+            QgsVectorFileWriter.deleteShapeFile(context.filtered_grid_path)
+        context.counts["filtered_cells"] = grid_layer.featureCount()
+        return
+
+    os.makedirs(os.path.dirname(context.filtered_grid_path), exist_ok=True)
+    QgsVectorFileWriter.writeAsVectorFormat(
+        filtered_grid, context.filtered_grid_path, "UTF-8", filtered_grid.crs(), "ESRI Shapefile"
+    )
+    print(f"Filtered grid saved to {context.filtered_grid_path}")
+    context.counts["filtered_cells"] = filtered_grid.featureCount()
+
+
+def capture_stage(context):
+    """Render the (filtered) grid cells; captured cells stream to the classifier if it runs too."""
+    grid_path = context.filtered_grid_path if os.path.exists(context.filtered_grid_path) else context.grid_path
+
+    stream = context.classifier_stream
+    grid_capture = GridCapture(
+        grid_path,
+        context.capture_folder,
+        context.pixels_per_meter,
+        on_cell_captured=stream.submit if stream is not None else None,
+        **context.capture_options
+    )
+    if not grid_capture.grid_layer.isValid():
+        raise ValueError(f"Grid not found: {grid_path}")
+
+    result = grid_capture.capture_grid_cells()
+    context.counts["captured"] = result["captured"]
+    context.counts["skipped"] = result["skipped"]
+
+
+def classify_stage(context):
+    """Classify the captured tiles and count the cells of each category."""
+    manifest_path = manifest_path_for(context.capture_folder)
+
+    stream = context.classifier_stream
+    if stream is not None:
+        context.classifier_stream = None
+        stream.close(manifest_path)
+
+    # Cells not streamed (resumed captures, or this stage running alone)
+    classifier = MismatchIdentifier(context.capture_folder, context.classified_folder, context.pixels_per_meter,
+                                    engine=context.classifier_engine)
+    classifier.process_images()
+
+    if os.path.exists(manifest_path):
+        with CaptureManifest(manifest_path) as manifest:
+            for category in classifier.categories:
+                context.counts[category] = manifest.count_cells("category = ?", (category,))
+
+
+def highlight_stage(context):
+    """Add the errors layer and select the flagged cable routes."""
+    highlighter = ErrorsHighlighter(context.capture_folder, context.classified_folder)
+    result = highlighter.highlight()
+    context.counts["highlighted_routes"] = result["selected_total"]
+
+
+def report_stage(context):
+    """Export the report GeoPackage and summary."""
+    exporter = ReportExporter(context.capture_folder, context.classified_folder, context.report_folder)
+    summary = exporter.export()
+    context.counts["error_routes"] = summary["error_routes"]
+
+
+def default_stages():
+    """The stages of a full run, with their dependencies; all of them are always registered."""
+    return [
+        PipelineStage("load", load_stage),
+        PipelineStage("select", select_stage, depends_on=["load"]),
+        PipelineStage("grid", grid_stage, depends_on=["load"]),
+        PipelineStage("filter", filter_stage, depends_on=["select", "grid"]),
+        PipelineStage("capture", capture_stage, depends_on=["filter"]),
+        PipelineStage("classify", classify_stage, depends_on=["capture"]),
+        PipelineStage("highlight", highlight_stage, depends_on=["classify"]),
+        PipelineStage("report", report_stage, depends_on=["highlight"]),
+    ]
+
+
+class Pipeline:
+    def __init__(self, context, stages=None):
+        """
+        Run pipeline stages in dependency order
+
+        :param context: PipelineContext
+        :param stages: PipelineStage list (default: default_stages())
+        """
+        self.context = context
+        self.stages = {}
+        self.timings = {}
+        for stage in (stages if stages is not None else default_stages()):
+            self.add_stage(stage)
+
+    def add_stage(self, stage):
+        """
+        Add a stage; its dependencies must already be registered
+
+        :param stage: PipelineStage
+        """
+        if stage.name in self.stages:
+            raise ValueError(f"Stage '{stage.name}' is already registered")
+        missing = [name for name in stage.depends_on if name not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {', '.join(missing)}")
+        self.stages[stage.name] = stage
+
+    def order(self, stage_names=None):
+        """
+        Stages to run, dependencies first
+
+        Stages left out are not run; the selected ones then read the outputs
+        an earlier run left on disk.
+
+        :param stage_names: Names of the stages to run (default: all)
+        :return: list of PipelineStage
+        """
+        if stage_names is None:
+            stage_names = list(self.stages)
+        unknown = [name for name in stage_names if name not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(unknown)}, expected some of {list(self.stages)}")
+
+        # Stages can only depend on stages registered before them, so
+        # registration order is already a topological order
+        selected = set(stage_names)
+        return [stage for name, stage in self.stages.items() if name in selected]
+
+    def run(self, stage_names=None):
+        """
+        Run stages and time each of them
+
+        :param stage_names: Names of the stages to run (default: all)
+        :return: dict of stage name -> seconds
+        """
+        stages = self.order(stage_names)
+        names = [stage.name for stage in stages]
+
+        # Capture and classification overlap when both run
+        if "capture" in names and "classify" in names:
+            classifier = MismatchIdentifier(
+                self.context.capture_folder, self.context.classified_folder, self.context.pixels_per_meter,
+                engine=self.context.classifier_engine,
+            )
+            self.context.classifier_stream = StreamingClassifier(classifier)
+
+        try:
+            for stage in stages:
+                print(f"[pipeline] {stage.name} started")
+                start = time.perf_counter()
+                with span(stage.name, "pipeline"):
+                    stage.run(self.context)
+                self.timings[stage.name] = round(time.perf_counter() - start, 3)
+                print(f"[pipeline] {stage.name} finished in {self.timings[stage.name]} s")
+        finally:
+            # Record what was classified even if a stage failed
+            stream = self.context.classifier_stream
+            if stream is not None:
+                self.context.classifier_stream = None
+                stream.close(manifest_path_for(self.context.capture_folder))
+
+        if profiler.enabled:
+            profiler.print_summary()
+        return dict(self.timings)
+
+
+def run_pipeline(context, stage_names=None):
+    """
+    Convenience function running the default stages
+
+    :param context: PipelineContext
+    :param stage_names: Names of the stages to run (default: all)
+    :return: (timings, counts)
+    """
+    timings = Pipeline(context).run(stage_names)
+    return timings, dict(context.counts)
@@ -0,0 +1,232 @@
+"""
+Lightweight timing spans for the pipeline.
+
+Disabled by default: span() then returns a shared no-op context manager and
+timed() functions only check a flag, so instrumentation can stay in
+production code. Enable it with ``enable()`` or by setting the
+MISMATCH_PROFILE environment variable to the path of the Chrome trace to
+write at exit (open it in chrome://tracing or https://ui.perfetto.dev).
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+PROFILE_ENV_VAR = "MISMATCH_PROFILE"
+
+
+class _NullSpan:
+    """Returned by span() when profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.category, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        """Collects completed spans from any thread."""
+        self.enabled = False
+        self.events = []  # (name, category, start, duration, thread id, args)
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def span(self, name, category="", **args):
+        """
+        Time a block of code
+
+        :param name: Span name, e.g. "render"
+        :param category: Stage the span belongs to, e.g. "capture"
+        :param args: Extra values shown in the trace viewer
+        :return: Context manager
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def record(self, name, category, start, duration, args=None):
+        """
+        Record a completed span
+
+        :param start: time.perf_counter() at the start of the span
+        :param duration: Seconds
+        """
+        thread = threading.current_thread()
+        with self._lock:
+            self.thread_names[thread.ident] = thread.name
+            self.events.append((name, category, start, duration, thread.ident, args or None))
+
+    def reset(self):
+        """Drop the recorded spans."""
+        with self._lock:
+            self.events = []
+            self.thread_names = {}
+            self.origin = time.perf_counter()
+
+    def summary(self):
+        """
+        Per stage and span name: count, total, mean and max duration
+
+        :return: {category: {name: {...}}}
+        """
+        with self._lock:
+            events = list(self.events)
+
+        summary = {}
+        for name, category, start, duration, thread_id, args in events:
+            stats = summary.setdefault(category or "other", {}).setdefault(
+                name, {"count": 0, "total_s": 0.0, "max_ms": 0.0}
+            )
+            stats["count"] += 1
+            stats["total_s"] += duration
+            stats["max_ms"] = max(stats["max_ms"], duration * 1000)
+
+        for spans in summary.values():
+            for stats in spans.values():
+                stats["mean_ms"] = round(stats["total_s"] * 1000 / stats["count"], 3)
+                stats["total_s"] = round(stats["total_s"], 6)
+                stats["max_ms"] = round(stats["max_ms"], 3)
+        return summary
+
+    def chrome_trace(self):
+        """
+        Recorded spans in the Chrome trace-event format
+
+        :return: dict ready for json.dump
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+
+        trace_events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}}
+            for thread_id, thread_name in thread_names.items()
+        ]
+        for name, category, start, duration, thread_id, args in events:
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",  # Complete event: start and duration
+                "ts": round((start - self.origin) * 1e6, 3),
+                "dur": round(duration * 1e6, 3),
+                "pid": pid,
+                "tid": thread_id,
+            }
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            trace_events.append(event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        """
+        Write the Chrome trace and, next to it, the per-stage summary
+
+        :param path: Trace path, e.g. "profile_trace.json"
+        :return: Path of the summary JSON
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+        summary_path = os.path.splitext(path)[0] + "_summary.json"
+        with open(summary_path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+        print(f"Saved profile trace at {path} and summary at {summary_path}")
+        return summary_path
+
+    def print_summary(self):
+        """Print one line per span, grouped by stage."""
+        for category, spans in self.summary().items():
+            print(f"[{category}]")
+            for name, stats in sorted(spans.items(), key=lambda item: -item[1]["total_s"]):
+                print(
+                    f"  {name:<24}{stats['count']:>8} x {stats['mean_ms']:>10} ms "
+                    f"(total {stats['total_s']} s, max {stats['max_ms']} ms)"
+                )
+
+
+# Shared by the whole plugin
+profiler = Profiler()
+
+
+def span(name, category="", **args):
+    """Time a block of code with the shared profiler (no-op when disabled)."""
+    if not profiler.enabled:
+        return _NULL_SPAN
+    return _Span(profiler, name, category, args)
+
+
+def timed(name=None, category=""):
+    """
+    Decorator timing every call of a function with the shared profiler
+
+    :param name: Span name (default: the function name)
+    :param category: Stage the span belongs to
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(span_name, category, start, time.perf_counter() - start)
+
+        return wrapper
+    return decorator
+
+
+def enable(trace_path=None):
+    """
+    Start recording spans
+
+    :param trace_path: If set, the Chrome trace is written there at exit
+    """
+    profiler.enabled = True
+    if trace_path:
+        atexit.register(profiler.write_chrome_trace, trace_path)
+
+
+def disable():
+    """Stop recording spans; recorded ones are kept."""
+    profiler.enabled = False
+
+
+def is_enabled():
+    return profiler.enabled
+
+
+if os.environ.get(PROFILE_ENV_VAR):
+    enable(os.environ[PROFILE_ENV_VAR])
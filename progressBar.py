@@ -1,68 +1,253 @@
-from PyQt5.QtWidgets import QProgressBar, QApplication
+import json
+import threading
+import time
+
+try:
+    from PyQt5.QtWidgets import QProgressBar, QApplication
+except ImportError:  # Headless runs without Qt
+    QProgressBar = QApplication = None
+
+
+class StageCounter:
+    # Throughput is sampled over windows of at least this many seconds
+    SAMPLE_SECONDS = 0.25
+
+    def __init__(self, name, total=0, smoothing=0.3):
+        """
+        Counters of one processing stage
+
+        :param name: Stage name
+        :param total: Number of items expected
+        :param smoothing: Weight of the newest sample in the moving average
+        """
+        self.name = name
+        self.total = total
+        self.smoothing = smoothing
+        self.processed = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self.rate = None  # Items per second, exponential moving average
+        self._sample_time = self.started
+        self._sample_processed = 0
+
+    def add(self, count, now):
+        """
+        Count processed items and update the moving average
+
+        :param count: Number of items processed
+        :param now: Current time.perf_counter()
+        """
+        self.processed += count
+        elapsed = now - self._sample_time
+        if elapsed >= self.SAMPLE_SECONDS:
+            rate = (self.processed - self._sample_processed) / elapsed
+            self.rate = rate if self.rate is None else self.smoothing * rate + (1 - self.smoothing) * self.rate
+            self._sample_time = now
+            self._sample_processed = self.processed
+
+    def elapsed(self, now=None):
+        """Seconds since the stage started (until it finished)."""
+        end = self.finished if self.finished is not None else (now or time.perf_counter())
+        return end - self.started
+
+    def throughput(self, now=None):
+        """Items per second; the average since the start until enough samples exist."""
+        if self.rate is not None and self.finished is None:
+            return self.rate
+        elapsed = self.elapsed(now)
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, now=None):
+        """Estimated seconds left, or None if unknown."""
+        if not self.total or self.finished is not None:
+            return None
+        rate = self.throughput(now)
+        if rate <= 0:
+            return None
+        return max(self.total - self.processed, 0) / rate
+
+    def as_dict(self):
+        """Counters as a JSON-serializable dict."""
+        eta = self.eta()
+        return {
+            "stage": self.name,
+            "processed": self.processed,
+            "total": self.total,
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "items_per_second": round(self.throughput(), 3),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
 
 class ProgressBarManager:
-    def __init__(self, progress_bar):
+    def __init__(self, progress_bar=None, update_interval=0.1, log_interval=None):
         """
         Initialize the Progress Bar Manager
-        
-        :param progress_bar: QProgressBar object to manage
+
+        Updates can come from worker threads; the progress bar itself is only
+        touched from the main thread, at most once per ``update_interval``.
+
+        :param progress_bar: QProgressBar object to manage, or None when headless
+        :param update_interval: Minimum seconds between two progress bar refreshes
+        :param log_interval: If set, print a progress line every this many seconds
         """
         self.progress_bar = progress_bar
+        self.update_interval = update_interval
+        self.log_interval = log_interval
         self.total_items = 0  # Initialize total_items
         self.current_progress = 0
-    
+
+        self.stages = {}
+        self.stage = None
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+        self._last_log = 0.0
+
     def reset(self):
         """
         Reset the progress bar to 0
         """
-        self.progress_bar.setValue(0)
-        self.current_progress = 0
-        self.total_items = 0
-    
-    def set_total(self, total_items):
+        with self._lock:
+            self.current_progress = 0
+            self.total_items = 0
+            self.stages = {}
+            self.stage = None
+        self._set_value(0)
+
+    def start_stage(self, name, total_items=0):
+        """
+        Start counting a new stage; earlier stages keep their counters
+
+        :param name: Stage name
+        :param total_items: Number of items the stage will process
+        """
+        with self._lock:
+            if self.stage is not None and self.stage.finished is None:
+                self.stage.finished = time.perf_counter()
+            self.stage = StageCounter(name, total_items)
+            self.stages[name] = self.stage
+            self.total_items = total_items
+            self.current_progress = 0
+        self._refresh(force=True)
+
+    def set_total(self, total_items, stage="progress"):
         """
         Set the total number of items to track
-        
+
         :param total_items: Total number of items to process
+        :param stage: Name of the stage the items belong to
         """
-        self.total_items = total_items
-        self.current_progress = 0
-    
+        self.start_stage(stage, total_items)
+
     def update_progress(self, processed_items=1):
         """
-        Update the progress bar
-        
+        Update the progress bar; safe to call from worker threads
+
         :param processed_items: Number of items processed in this update
         """
-        # If total_items is not set, default to a safe value
-        if self.total_items == 0:
-            self.total_items = 1  # Prevent division by zero
-        
-        self.current_progress += processed_items
-        
-        # Calculate percentage
-        progress_percentage = int((self.current_progress / self.total_items) * 100)
-        
-        # Ensure we don't exceed 100%
-        progress_percentage = min(progress_percentage, 100)
-        
-        # Set progress bar value
-        self.progress_bar.setValue(progress_percentage)
-        
-        # Process UI events to keep interface responsive
-        QApplication.processEvents()
-    
+        now = time.perf_counter()
+        with self._lock:
+            if self.stage is None:
+                self.stage = StageCounter("progress")
+                self.stages[self.stage.name] = self.stage
+            self.current_progress += processed_items
+            self.stage.add(processed_items, now)
+
+        if now - self._last_refresh >= self.update_interval:
+            self._refresh()
+        if self.log_interval is not None and now - self._last_log >= self.log_interval:
+            self._last_log = now
+            self.log_stats()
+
+    def flush(self):
+        """Refresh the progress bar now, e.g. from a main-thread timer while workers run."""
+        self._refresh(force=True)
+
     def complete(self):
         """
         Ensure progress bar reaches 100%
         """
-        self.progress_bar.setValue(100)
+        with self._lock:
+            if self.stage is not None and self.stage.finished is None:
+                self.stage.finished = time.perf_counter()
+        self._set_value(100)
+        if self.progress_bar is not None and _in_main_thread():
+            self.progress_bar.setFormat("%p%")
+
+    def percentage(self):
+        """Progress of the current stage, 0 to 100."""
+        # If total_items is not set, default to a safe value
+        total = self.total_items or 1  # Prevent division by zero
+        return min(int((self.current_progress / total) * 100), 100)
+
+    def eta(self):
+        """Estimated seconds left in the current stage, or None."""
+        with self._lock:
+            return self.stage.eta() if self.stage is not None else None
+
+    def throughput(self):
+        """Items per second of the current stage."""
+        with self._lock:
+            return self.stage.throughput() if self.stage is not None else 0.0
+
+    def stats(self):
+        """
+        Counters of every stage
+
+        :return: list of dicts, in stage order
+        """
+        with self._lock:
+            return [stage.as_dict() for stage in self.stages.values()]
 
-def create_progress_bar_manager(progress_bar):
+    def log_stats(self):
+        """Print one line per stage."""
+        for stage in self.stats():
+            eta = f", ETA {stage['eta_seconds']} s" if stage["eta_seconds"] is not None else ""
+            print(
+                f"[{stage['stage']}] {stage['processed']}/{stage['total']} in {stage['elapsed_seconds']} s "
+                f"({stage['items_per_second']} items/s{eta})"
+            )
+
+    def export_stats(self, path):
+        """
+        Write the stage counters to a JSON file
+
+        :param path: Output path
+        """
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=4)
+
+    def _refresh(self, force=False):
+        # Widgets may only be touched from the main thread; workers just count
+        if self.progress_bar is None or not _in_main_thread():
+            return
+        now = time.perf_counter()
+        if not force and now - self._last_refresh < self.update_interval:
+            return
+        self._last_refresh = now
+
+        self.progress_bar.setValue(self.percentage())
+        eta = self.eta()
+        self.progress_bar.setFormat(f"%p% - ETA {int(eta)} s" if eta is not None else "%p%")
+
+        # Process UI events to keep interface responsive
+        if QApplication is not None:
+            QApplication.processEvents()
+
+    def _set_value(self, value):
+        if self.progress_bar is not None and _in_main_thread():
+            self.progress_bar.setValue(value)
+
+
+def _in_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+
+def create_progress_bar_manager(progress_bar=None, **kwargs):
     """
     Convenience function to create a ProgressBarManager
-    
-    :param progress_bar: QProgressBar object
+
+    :param progress_bar: QProgressBar object, or None when headless
     :return: ProgressBarManager instance
     """
-    return ProgressBarManager(progress_bar)
\ No newline at end of file
+    return ProgressBarManager(progress_bar, **kwargs)
@@ -0,0 +1,141 @@
+import os
+import shutil
+import sqlite3
+import time
+
+
+class RenderCache:
+    def __init__(self, cache_folder="Render_Cache", max_bytes=2 * 1024 ** 3, commit_every=100):
+        """
+        Content-addressed store of rendered tiles with a disk budget
+
+        Tiles are keyed by a hash of everything that determines their pixels
+        (see GridCapture.cache_key). When the cache grows past ``max_bytes``
+        the least recently used tiles are evicted.
+
+        :param cache_folder: Folder holding the tiles and their index
+        :param max_bytes: Disk budget for cached tiles
+        :param commit_every: Number of index changes batched per commit
+        """
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cache_folder, "index.sqlite"))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tiles (key TEXT PRIMARY KEY, path TEXT, size INTEGER, last_access REAL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tiles_last_access ON tiles (last_access)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+    def _tile_path(self, key, extension):
+        # Two-level fan-out keeps directories small on large grids
+        return os.path.join(self.cache_folder, key[:2], key + extension)
+
+    def _changed(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.connection.commit()
+            self._uncommitted = 0
+
+    def get(self, key, destination):
+        """
+        Copy a cached tile to ``destination``
+
+        :param key: Tile key
+        :param destination: Path the tile should be written to
+        :return: True on a cache hit
+        """
+        row = self.connection.execute("SELECT path FROM tiles WHERE key = ?", (key,)).fetchone()
+        if row is None or not os.path.isfile(row[0]):
+            if row is not None:
+                self._remove(key)
+            self.misses += 1
+            return False
+
+        _link_or_copy(row[0], destination)
+        self.connection.execute("UPDATE tiles SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._changed()
+        self.hits += 1
+        return True
+
+    def put(self, key, source_path):
+        """
+        Store a freshly rendered tile
+
+        :param key: Tile key
+        :param source_path: Path of the rendered tile
+        """
+        tile_path = self._tile_path(key, os.path.splitext(source_path)[1])
+        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+
+        previous = self.connection.execute("SELECT size FROM tiles WHERE key = ?", (key,)).fetchone()
+        if previous is not None:
+            self.total_bytes -= previous[0]
+
+        _link_or_copy(source_path, tile_path)
+        size = os.path.getsize(tile_path)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tiles (key, path, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, tile_path, size, time.time()),
+        )
+        self.total_bytes += size
+        self._changed()
+
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used tiles until the cache fits its budget."""
+        cursor = self.connection.execute("SELECT key, path, size FROM tiles ORDER BY last_access")
+        evicted = []
+        for key, path, size in cursor:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if os.path.exists(path):
+                os.remove(path)
+            self.total_bytes -= size
+            evicted.append((key,))
+
+        self.connection.executemany("DELETE FROM tiles WHERE key = ?", evicted)
+        self.connection.commit()
+        self._uncommitted = 0
+        if evicted:
+            print(f"Render cache: evicted {len(evicted)} tiles ({self.total_bytes} bytes in use)")
+
+    def _remove(self, key):
+        row = self.connection.execute("SELECT size FROM tiles WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self.total_bytes -= row[0]
+            self.connection.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            self._changed()
+
+    def commit(self):
+        """Commit pending index changes."""
+        self.connection.commit()
+        self._uncommitted = 0
+        print(f"Render cache: {self.hits} hits, {self.misses} misses, {self.total_bytes} bytes in use")
+
+    def close(self):
+        """Commit the index and close it."""
+        if self.connection is None:
+            return
+        self.commit()
+        self.connection.close()
+        self.connection = None
+
+
+def _link_or_copy(source, destination):
+    """Hard-link a tile when possible (same volume), copy it otherwise."""
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
@@ -0,0 +1,65 @@
+"""
+Statistics of the report, accumulated one cell at a time while the cells are streamed.
+"""
+import math
+
+# Every category the classifier produces, in report order
+REPORT_CATEGORIES = ["cartography_error", "please_check", "no_cartography_error", "random"]
+
+
+class RunningStats:
+    def __init__(self):
+        """Count, min, max, mean and standard deviation updated one value at a time (Welford)."""
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    def as_dict(self):
+        """Statistics as a JSON-serializable dict (None when empty)."""
+        if not self.count:
+            return {"count": 0, "min": None, "max": None, "mean": None, "std": None}
+        return {
+            "count": self.count,
+            "min": round(self.minimum, 3),
+            "max": round(self.maximum, 3),
+            "mean": round(self.mean, 3),
+            "std": round(math.sqrt(self._m2 / self.count), 3),
+        }
+
+
+class CategoryStats:
+    def __init__(self, categories=REPORT_CATEGORIES):
+        """
+        Cell count and min_distance_m statistics per category
+
+        :param categories: Categories reported even without cells; others are added when a cell has them
+        """
+        self.counts = {category: 0 for category in categories}
+        self.distances = {category: RunningStats() for category in categories}
+
+    def add(self, category, min_distance_m=None):
+        """Count one cell; min_distance_m is None when nothing was measured."""
+        self.counts[category] = self.counts.get(category, 0) + 1
+        distances = self.distances.setdefault(category, RunningStats())
+        if min_distance_m is not None:
+            distances.add(min_distance_m)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def as_dict(self):
+        """{category: {"count": ..., "min_distance_m": RunningStats.as_dict()}}, in report order."""
+        return {
+            category: {"count": count, "min_distance_m": self.distances[category].as_dict()}
+            for category, count in self.counts.items()
+        }
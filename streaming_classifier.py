@@ -0,0 +1,95 @@
+"""
+Classification of captured tiles on a worker thread, fed by GridCapture.
+
+The pipeline runs it when capture and classify run together; it only needs a
+MismatchIdentifier and the capture manifest, so it can also be used headless.
+"""
+import queue
+import threading
+import time
+
+try:
+    from .capture_manifest import CaptureManifest
+    from .feature_store import FeatureStore, feature_store_path_for
+except ImportError:  # Imported outside the plugin package (tests)
+    from capture_manifest import CaptureManifest
+    from feature_store import FeatureStore, feature_store_path_for
+
+
+class StreamingClassifier:
+    def __init__(self, classifier, max_queue_size=32):
+        """
+        Classify captured tiles on a worker thread while the next cells render
+
+        The queue is bounded, so a classifier falling behind slows the capture
+        down instead of piling up cells. Results are written to the manifest in
+        close(), once the capture has committed the rows they update.
+
+        :param classifier: MismatchIdentifier
+        :param max_queue_size: Number of captured cells allowed to wait
+        """
+        self.classifier = classifier
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        # Filled on the worker thread, written in close() like the manifest updates
+        self.feature_store = FeatureStore(feature_store_path_for(classifier.input_folder))
+        self.results = []
+        self.errors = []
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="StreamingClassifier", daemon=True)
+        self._thread.start()
+
+    def submit(self, cell):
+        """
+        Queue a captured cell; blocks while the queue is full
+
+        :param cell: Manifest row of the cell (GridCapture on_cell_captured callback)
+        """
+        start = time.perf_counter()
+        self.queue.put(cell)
+        self.blocked_seconds += time.perf_counter() - start
+
+    def _run(self):
+        while True:
+            cell = self.queue.get()
+            if cell is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                result = self.classifier.classify_cell(cell, self.feature_store)
+            except Exception as e:
+                self.errors.append((cell["grid_id"], str(e)))
+                print(f"Failed to classify Cell {cell['grid_id']}: {str(e)}")
+                result = None
+            self.busy_seconds += time.perf_counter() - start
+
+            if result is not None:
+                self.results.append((cell["grid_id"], result))
+
+    def close(self, manifest_path):
+        """
+        Wait for the queued cells and record their categories
+
+        :param manifest_path: Capture manifest to update
+        :return: Number of cells classified
+        """
+        self.queue.put(None)
+        self._thread.join()
+
+        try:
+            if self.results:
+                with CaptureManifest(manifest_path) as manifest:
+                    for grid_id, result in self.results:
+                        manifest.update_cell(grid_id, **result)
+        finally:
+            self.feature_store.save()
+
+        print(
+            f"Streaming classifier: {len(self.results)} cells in {round(self.busy_seconds, 3)} s, "
+            f"capture blocked {round(self.blocked_seconds, 3)} s, {len(self.errors)} errors, "
+            f"shortcuts {self.classifier.shortcut_counts}"
+        )
+        print(self.classifier.dedup_summary())
+        return len(self.results)
@@ -0,0 +1,132 @@
+import os
+from PyQt5.QtXml import QDomDocument
+
+STYLE_EXTENSIONS = (".qml", ".sld")
+
+# Registries already built, keyed by absolute style folder path
+_registries = {}
+
+
+def normalize_style_name(name):
+    """
+    Normalize a layer or style file name for matching
+
+    :param name: Layer name or style file name
+    :return: Lower-case name without its data/style extension
+    """
+    name = name.strip().lower()
+    base, extension = os.path.splitext(name)
+    if extension in (".shp", ".gpkg") + STYLE_EXTENSIONS:
+        name = base
+    return name
+
+
+def get_style_registry(style_folder_path):
+    """
+    Return the registry of a style folder, rebuilding it if the folder changed
+
+    :param style_folder_path: Folder containing QML/SLD files
+    :return: StyleRegistry
+    """
+    key = os.path.abspath(style_folder_path)
+    registry = _registries.get(key)
+    if registry is None or registry.mtime != os.stat(key).st_mtime_ns:
+        registry = StyleRegistry(key)
+        _registries[key] = registry
+    return registry
+
+
+class StyleRegistry:
+    def __init__(self, style_folder_path):
+        """
+        Parse every style of a folder once, indexed by normalized name
+
+        :param style_folder_path: Folder containing QML/SLD files
+        """
+        self.style_folder_path = style_folder_path
+        self.mtime = os.stat(style_folder_path).st_mtime_ns
+        self.styles = {}  # normalized name -> (path, kind, QDomDocument)
+        self._matches = {}  # normalized layer name -> style name or None
+
+        for style_filename in sorted(os.listdir(style_folder_path)):
+            kind = os.path.splitext(style_filename)[1].lower()
+            if kind not in STYLE_EXTENSIONS:
+                continue
+
+            name = normalize_style_name(style_filename)
+            # QML wins over an SLD with the same name, as before
+            if name in self.styles and self.styles[name][1] == ".qml":
+                continue
+
+            style_filepath = os.path.join(style_folder_path, style_filename)
+            document = self._parse(style_filepath, kind)
+            if document is not None:
+                self.styles[name] = (style_filepath, kind, document)
+
+        print(f"Style registry: {len(self.styles)} styles parsed from {style_folder_path}")
+
+    def _parse(self, style_filepath, kind):
+        with open(style_filepath, "rb") as f:
+            data = f.read()
+
+        document = QDomDocument()
+        # SLD relies on namespaces (se:, ogc:), QML doesn't use them
+        ok, error, line, column = document.setContent(data, kind == ".sld")
+        if not ok:
+            print(f"Could not parse style {style_filepath} (line {line}, column {column}): {error}")
+            return None
+        return document
+
+    def match(self, layer_name):
+        """
+        Find the style of a layer; exact names win over partial matches
+
+        :param layer_name: Layer name
+        :return: Normalized style name, or None
+        """
+        name = normalize_style_name(layer_name)
+        if name in self._matches:
+            return self._matches[name]
+
+        if name in self.styles:
+            match = name
+        else:
+            candidates = [
+                style_name for style_name in self.styles
+                if name in style_name or style_name in name
+            ]
+            # Prefer the most specific (longest) name
+            candidates.sort(key=len, reverse=True)
+            match = candidates[0] if candidates else None
+            if len(candidates) > 1:
+                print(f"Ambiguous styles for layer {layer_name}: {', '.join(candidates)}; using {match}")
+
+        self._matches[name] = match
+        return match
+
+    def apply(self, layer):
+        """
+        Apply the matching parsed style to a layer
+
+        :param layer: QgsVectorLayer
+        :return: True if a style was applied
+        """
+        style_name = self.match(layer.name())
+        if style_name is None:
+            print(f"No matching style found for layer: {layer.name()}")
+            return False
+
+        style_filepath, kind, document = self.styles[style_name]
+        if kind == ".qml":
+            success, error = layer.importNamedStyle(document)
+        else:
+            named_layer = document.firstChildElement("StyledLayerDescriptor").firstChildElement("NamedLayer")
+            success, error = layer.readSld(named_layer)
+
+        if not success:
+            print(f"Error applying style {style_filepath} to {layer.name()}: {error}")
+            return False
+
+        print(f"Successfully applied {kind[1:].upper()} style from {style_filepath} to {layer.name()}")
+        layer.triggerRepaint()
+        return True
@@ -0,0 +1,441 @@
+"""
+Seeded synthetic zones for scale testing.
+
+Generates a street grid carrying cable routes (Arc_itineraire) before and
+after the AI pass, with controlled offsets, deletions and additions, plus
+the parcels, buildings and cadastre polylines around them. Layers are
+written with the file names and attribute schemas of the real
+"Sauvegarde avant IA" / "Sauvegarde après IA" folders, together with the
+expected category of every grid cell (ground_truth.csv).
+
+Geometry is generated in pure Python, QGIS is only needed to write the
+shapefiles::
+
+    python -m Mismatch_Identifier_Plugin.synthetic_dataset --output /data/synthetic/zone_x10 --scale 10 --seed 1
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import random
+
+try:
+    from .capture_settings import DISTANCE_THRESHOLD_METERS
+except ImportError:  # Run as a standalone script
+    from capture_settings import DISTANCE_THRESHOLD_METERS
+
+AVANT_FOLDER = "Sauvegarde avant IA"
+APRES_FOLDER = "Sauvegarde après IA"
+DEFAULT_CRS = "EPSG:27572"  # NTF Lambert II etendu, like the sample data
+
+# (name, dBASE type, length, precision), as in the sample shapefiles
+ARC_ITINERAIRE_SCHEMA = [
+    ("OBJECTID", "N", 10, 0), ("STATUT", "C", 1, 0), ("MODE_POSE", "C", 2, 0), ("AUT_PASSAG", "N", 1, 0),
+    ("AUT_PASS_1", "C", 254, 0), ("NATURE_CON", "C", 1, 0), ("TYPE_LONGU", "C", 1, 0), ("LONGUEUR", "N", 7, 2),
+    ("NOTE", "C", 254, 0), ("COMPOSITIO", "C", 254, 0), ("ID_PROPRIE", "N", 10, 0), ("INDEX_DOC_", "N", 10, 0),
+    ("ENABLED", "N", 4, 0), ("ORIGINE", "N", 1, 0), ("LABEL_CABL", "C", 254, 0), ("NB_CABLE", "N", 2, 0),
+    ("ORANGE", "N", 1, 0), ("CLASSE", "C", 1, 0), ("LARGEUR", "N", 3, 0), ("HAUTEUR", "N", 3, 0),
+    ("EXPLOITATI", "N", 1, 0), ("MAINTENANC", "N", 1, 0), ("GESTION", "N", 1, 0), ("CONVENTION", "N", 1, 0),
+    ("REF_CONVEN", "C", 125, 0), ("MODIF_DATE", "D", 8, 0), ("MODIF_AUTE", "C", 10, 0), ("MODIF_ETUD", "C", 9, 0),
+    ("METRIC", "N", 5, 0), ("IS_ANTENNA", "N", 5, 0), ("RECALAGE_D", "D", 8, 0), ("SHAPE_LEN", "F", 19, 11),
+]
+BATIMENT_SCHEMA = [
+    ("OBJECTID", "N", 9, 0), ("TYPE", "C", 21, 0), ("NATURE", "C", 1, 0), ("TYPEID", "N", 9, 0),
+    ("ID_CHANTIE", "N", 9, 0), ("SHAPE_Leng", "F", 19, 11), ("SHAPE_Area", "F", 19, 11),
+]
+PARCELLE_SCHEMA = [
+    ("OBJECTID", "N", 9, 0), ("NUMERO", "C", 4, 0), ("FEUILLE", "N", 4, 0), ("SECTION", "C", 2, 0),
+    ("CODE_DEP", "C", 2, 0), ("NOM_COM", "C", 45, 0), ("CODE_COM", "C", 3, 0), ("COM_ABS", "C", 3, 0),
+    ("CODE_ARR", "C", 3, 0), ("NATURE", "C", 1, 0), ("TYPEID", "N", 9, 0), ("ID_CHANTIE", "N", 9, 0),
+    ("SHAPE_Leng", "F", 19, 11), ("SHAPE_Area", "F", 19, 11),
+]
+CADASTRE_POLYGONE_SCHEMA = [
+    ("OBJECTID", "N", 10, 0), ("TYPEID", "N", 10, 0), ("NATURE", "C", 1, 0), ("ID_CHANTIE", "N", 10, 0),
+    ("ETAT", "N", 1, 0), ("SHAPE_AREA", "F", 19, 11), ("SHAPE_LEN", "F", 19, 11),
+]
+CADASTRE_POLYLIGNE_SCHEMA = [
+    ("OBJECTID", "N", 10, 0), ("TYPEID", "N", 10, 0), ("NATURE", "C", 1, 0), ("ID_CHANTIE", "N", 10, 0),
+    ("ETAT", "N", 1, 0), ("SHAPE_LEN", "F", 19, 11),
+]
+
+# File stem -> (geometry type, schema)
+LAYER_SPECS = {
+    "Arc_itineraire": ("LineString", ARC_ITINERAIRE_SCHEMA),
+    "BD_PARCELLAIRE_batiment": ("Polygon", BATIMENT_SCHEMA),
+    "BD_PARCELLAIRE_parcelle": ("Polygon", PARCELLE_SCHEMA),
+    "Cadastre,_Polygone": ("Polygon", CADASTRE_POLYGONE_SCHEMA),
+    "Cadastre,_Polyligne": ("LineString", CADASTRE_POLYLIGNE_SCHEMA),
+}
+
+
+def _line_length(points):
+    return sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+
+
+def _ring_area(ring):
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:]))) / 2
+
+
+def _rectangle(xmin, ymin, xmax, ymax):
+    return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax), (xmin, ymin)]
+
+
+def _offset_line(points, distance):
+    """Shift a polyline sideways, perpendicular to its overall direction."""
+    (x0, y0), (x1, y1) = points[0], points[-1]
+    length = math.hypot(x1 - x0, y1 - y0) or 1.0
+    nx, ny = -(y1 - y0) / length, (x1 - x0) / length
+    return [(x + nx * distance, y + ny * distance) for x, y in points]
+
+
+def segment_intersects_rect(p0, p1, xmin, ymin, xmax, ymax):
+    """Liang-Barsky test: does the segment p0-p1 cross the rectangle (more than at a corner)?"""
+    x0, y0 = p0
+    dx, dy = p1[0] - x0, p1[1] - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - xmin), (dx, xmax - x0), (-dy, y0 - ymin), (dy, ymax - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return t1 - t0 > 1e-9
+
+
+def expected_category(kinds, min_offset, distance_threshold=DISTANCE_THRESHOLD_METERS):
+    """
+    Category a cell should get, from the route differences it contains
+
+    :param kinds: Set of "same", "offset", "deleted" and "added"
+    :param min_offset: Smallest AV/AP offset in the cell, in meters (None if no offset)
+    :param distance_threshold: MismatchIdentifier distance threshold
+    :return: MismatchIdentifier category
+    """
+    if not kinds:
+        return "random"
+    if "deleted" in kinds or "added" in kinds:
+        return "cartography_error"
+    if "offset" in kinds:
+        return "please_check" if min_offset < distance_threshold else "cartography_error"
+    return "no_cartography_error"
+
+
+def _attributes(schema, object_id, geometry_type, geometry):
+    """Attribute values for a schema; only ids and measures are filled in."""
+    if geometry_type == "LineString":
+        length, area = _line_length(geometry), None
+    else:
+        length, area = _line_length(geometry[0]), _ring_area(geometry[0])
+
+    values = []
+    for name, field_type, field_length, precision in schema:
+        upper = name.upper()
+        if upper == "OBJECTID":
+            values.append(object_id)
+        elif upper in ("SHAPE_LEN", "SHAPE_LENG", "LONGUEUR"):
+            values.append(round(length, 2))
+        elif upper == "SHAPE_AREA":
+            values.append(round(area, 2) if area is not None else None)
+        else:
+            values.append(None)
+    return values
+
+
+def generate_dataset(width=1000.0, height=1000.0, origin=(932000.0, 2302000.0), street_spacing=80.0,
+                     route_density=0.6, parcel_size=20.0, building_density=0.6, offset_ratio=0.1,
+                     offset_range=(0.1, 3.0), deletion_ratio=0.03, addition_ratio=0.03, grid_size=20,
+                     distance_threshold=DISTANCE_THRESHOLD_METERS, seed=0, with_labels=True):
+    """
+    Generate a synthetic zone; the same arguments always give the same zone
+
+    :param width: Zone width, in meters
+    :param height: Zone height, in meters
+    :param origin: Lower-left corner (EPSG:27572 coordinates)
+    :param street_spacing: Distance between streets, in meters
+    :param route_density: Share of street segments carrying a cable route
+    :param parcel_size: Approximate parcel side, in meters
+    :param building_density: Share of parcels with a building
+    :param offset_ratio: Share of AP routes shifted from their AV position
+    :param offset_range: (min, max) shift of the offset routes, in meters
+    :param deletion_ratio: Share of AV routes missing after the AI pass
+    :param addition_ratio: Number of AP-only routes, relative to the AV routes
+    :param grid_size: Grid cell size used for the labels (GridGenerator grid_size)
+    :param distance_threshold: Threshold separating please_check from cartography_error
+    :param seed: Random seed
+    :param with_labels: Compute the cell labels (skip for layer-only benchmarks)
+    :return: dict with the config, the layers per folder and the cell labels
+    """
+    config = {key: value for key, value in locals().items()}
+    rng = random.Random(seed)
+    x_origin, y_origin = origin
+
+    xs = [x_origin + i * street_spacing for i in range(int(width // street_spacing) + 1)]
+    ys = [y_origin + j * street_spacing for j in range(int(height // street_spacing) + 1)]
+
+    # Street segments between consecutive crossings
+    street_segments = []
+    for x in xs:
+        street_segments += [((x, y0), (x, y1)) for y0, y1 in zip(ys, ys[1:])]
+    for y in ys:
+        street_segments += [((x0, y), (x1, y)) for x0, x1 in zip(xs, xs[1:])]
+
+    def route(start, end):
+        # A slightly bent polyline, like a drawn route
+        (x0, y0), (x1, y1) = start, end
+        middle = ((x0 + x1) / 2 + rng.uniform(-1, 1) * (x0 == x1), (y0 + y1) / 2 + rng.uniform(-1, 1) * (y0 == y1))
+        return [start, middle, end]
+
+    cabled = []
+    free = []
+    for segment in street_segments:
+        (cabled if rng.random() < route_density else free).append(segment)
+
+    av_routes = []
+    ap_routes = []
+    differences = []  # (kind, offset, av line or None, ap line or None)
+    for start, end in cabled:
+        line = route(start, end)
+        av_routes.append(line)
+        draw = rng.random()
+        if draw < deletion_ratio:
+            differences.append(("deleted", None, line, None))
+        elif draw < deletion_ratio + offset_ratio:
+            offset = rng.uniform(*offset_range)
+            shifted = _offset_line(line, offset * rng.choice((-1, 1)))
+            ap_routes.append(shifted)
+            differences.append(("offset", offset, line, shifted))
+        else:
+            ap_routes.append(list(line))
+            differences.append(("same", None, line, line))
+
+    rng.shuffle(free)
+    for start, end in free[:round(addition_ratio * len(av_routes))]:
+        line = route(start, end)
+        ap_routes.append(line)
+        differences.append(("added", None, None, line))
+
+    # Blocks between streets, split into parcels, some with a building
+    setback = 4.0
+    parcels = []
+    buildings = []
+    block_outlines = []
+    for x0, x1 in zip(xs, xs[1:]):
+        for y0, y1 in zip(ys, ys[1:]):
+            bx0, by0, bx1, by1 = x0 + setback, y0 + setback, x1 - setback, y1 - setback
+            block_outlines.append(_rectangle(bx0, by0, bx1, by1))
+            nx = max(1, round((bx1 - bx0) / parcel_size))
+            ny = max(1, round((by1 - by0) / parcel_size))
+            step_x, step_y = (bx1 - bx0) / nx, (by1 - by0) / ny
+            for i in range(nx):
+                for j in range(ny):
+                    px0, py0 = bx0 + i * step_x, by0 + j * step_y
+                    parcels.append([_rectangle(px0, py0, px0 + step_x, py0 + step_y)])
+                    if rng.random() < building_density:
+                        margin_x = rng.uniform(1, step_x / 4)
+                        margin_y = rng.uniform(1, step_y / 4)
+                        buildings.append([_rectangle(
+                            px0 + margin_x, py0 + margin_y, px0 + step_x - margin_x, py0 + step_y - margin_y
+                        )])
+
+    layers = {
+        AVANT_FOLDER: {
+            "Arc_itineraire": av_routes,
+            "Cadastre,_Polygone": parcels,
+            "Cadastre,_Polyligne": block_outlines,
+        },
+        APRES_FOLDER: {
+            "Arc_itineraire": ap_routes,
+            "BD_PARCELLAIRE_batiment": buildings,
+            "BD_PARCELLAIRE_parcelle": parcels,
+        },
+    }
+
+    return {
+        "config": config,
+        "layers": layers,
+        "labels": label_cells(av_routes, differences, grid_size, distance_threshold) if with_labels else [],
+    }
+
+
+def label_cells(av_routes, differences, grid_size, distance_threshold=DISTANCE_THRESHOLD_METERS):
+    """
+    Expected category of every cell of the grid GridGenerator builds over the AV routes
+
+    :param av_routes: AV polylines (the grid covers their extent)
+    :param differences: (kind, offset, av line, ap line) per route
+    :param grid_size: Grid cell size, in meters
+    :param distance_threshold: Threshold separating please_check from cartography_error
+    :return: list of (grid_index, xmin, ymin, xmax, ymax, category, kinds, min_offset)
+    """
+    if not av_routes:
+        return []
+
+    # Same origin and extent rules as GridGenerator.generate_grid
+    all_x = [x for line in av_routes for x, _ in line]
+    all_y = [y for line in av_routes for _, y in line]
+    columns = list(range(int(min(all_x)), int(max(all_x)), grid_size))
+    rows = list(range(int(min(all_y)), int(max(all_y)), grid_size))
+    if not columns or not rows:
+        return []
+    x_start, y_start = columns[0], rows[0]
+
+    kinds = {}
+    offsets = {}
+    for kind, offset, av_line, ap_line in differences:
+        for line in (av_line, ap_line):
+            if line is None:
+                continue
+            for p0, p1 in zip(line, line[1:]):
+                c0 = max(int((min(p0[0], p1[0]) - x_start) // grid_size), 0)
+                c1 = min(int((max(p0[0], p1[0]) - x_start) // grid_size), len(columns) - 1)
+                r0 = max(int((min(p0[1], p1[1]) - y_start) // grid_size), 0)
+                r1 = min(int((max(p0[1], p1[1]) - y_start) // grid_size), len(rows) - 1)
+                for column in range(c0, c1 + 1):
+                    for row in range(r0, r1 + 1):
+                        x, y = columns[column], rows[row]
+                        if segment_intersects_rect(p0, p1, x, y, x + grid_size, y + grid_size):
+                            kinds.setdefault((column, row), set()).add(kind)
+                            if offset is not None:
+                                offsets[(column, row)] = min(offsets.get((column, row), offset), offset)
+
+    labels = []
+    for column, x in enumerate(columns):
+        for row, y in enumerate(rows):
+            cell_kinds = kinds.get((column, row), set())
+            min_offset = offsets.get((column, row))
+            labels.append((
+                column * len(rows) + row,  # Feature order of GridGenerator
+                x, y, x + grid_size, y + grid_size,
+                expected_category(cell_kinds, min_offset, distance_threshold),
+                "|".join(sorted(cell_kinds)),
+                round(min_offset, 3) if min_offset is not None else None,
+            ))
+    return labels
+
+
+def write_labels(labels, path):
+    """Write the cell labels as CSV (join them to the manifest on xmin/ymin)."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["grid_index", "xmin", "ymin", "xmax", "ymax", "category", "kinds", "min_offset_m"])
+        writer.writerows(labels)
+
+
+def build_memory_layer(name, geometries, crs=DEFAULT_CRS):
+    """
+    Memory layer with the schema of one of the input shapefiles
+
+    :param name: File stem, a key of LAYER_SPECS
+    :param geometries: Polylines (lists of points) or polygons (lists of rings)
+    :param crs: CRS auth id
+    :return: QgsVectorLayer
+    """
+    from PyQt5.QtCore import QVariant
+    from qgis.core import QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsVectorLayer
+
+    geometry_type, schema = LAYER_SPECS[name]
+    layer = QgsVectorLayer(f"{geometry_type}?crs={crs}", name, "memory")
+    provider = layer.dataProvider()
+
+    fields = []
+    for field_name, field_type, length, precision in schema:
+        if field_type == "C":
+            fields.append(QgsField(field_name, QVariant.String, len=length))
+        elif field_type == "D":
+            fields.append(QgsField(field_name, QVariant.Date))
+        elif field_type == "F" or precision:
+            fields.append(QgsField(field_name, QVariant.Double, len=length, prec=precision))
+        else:
+            fields.append(QgsField(field_name, QVariant.LongLong if length > 9 else QVariant.Int, len=length))
+    provider.addAttributes(fields)
+    layer.updateFields()
+
+    features = []
+    for object_id, geometry in enumerate(geometries, start=1):
+        feature = QgsFeature(layer.fields())
+        if geometry_type == "LineString":
+            feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in geometry]))
+        else:
+            feature.setGeometry(QgsGeometry.fromPolygonXY([[QgsPointXY(x, y) for x, y in ring] for ring in geometry]))
+        feature.setAttributes(_attributes(schema, object_id, geometry_type, geometry))
+        features.append(feature)
+    provider.addFeatures(features)
+    return layer
+
+
+def write_dataset(dataset, output_folder, crs=DEFAULT_CRS):
+    """
+    Write a generated zone: both input folders, ground_truth.csv and dataset.json
+
+    :param dataset: Result of generate_dataset()
+    :param output_folder: Zone folder to create
+    :param crs: CRS auth id
+    """
+    from qgis.core import QgsCoordinateTransformContext, QgsVectorFileWriter
+
+    for folder_name, layers in dataset["layers"].items():
+        folder_path = os.path.join(output_folder, folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+        for name, geometries in layers.items():
+            layer = build_memory_layer(name, geometries, crs)
+            options = QgsVectorFileWriter.SaveVectorOptions()
+            options.driverName = "ESRI Shapefile"
+            options.fileEncoding = "UTF-8"
+            error, error_message = QgsVectorFileWriter.writeAsVectorFormatV3(
+                layer, os.path.join(folder_path, f"{name}.shp"), QgsCoordinateTransformContext(), options
+            )[:2]
+            if error != QgsVectorFileWriter.NoError:
+                raise IOError(f"Could not write {name} in {folder_path}: {error_message}")
+            print(f"Wrote {len(geometries)} features to {folder_path}/{name}.shp")
+
+    write_labels(dataset["labels"], os.path.join(output_folder, "ground_truth.csv"))
+    with open(os.path.join(output_folder, "dataset.json"), "w") as f:
+        json.dump({"config": dataset["config"], "counts": dataset_counts(dataset)}, f, indent=4)
+
+
+def dataset_counts(dataset):
+    """Number of features per layer and of cells per expected category."""
+    counts = {
+        f"{folder_name}/{name}": len(geometries)
+        for folder_name, layers in dataset["layers"].items()
+        for name, geometries in layers.items()
+    }
+    for label in dataset["labels"]:
+        key = f"cells/{label[5]}"
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic zone with known mismatches.")
+    parser.add_argument("--output", required=True, help="Zone folder to create")
+    parser.add_argument("--scale", type=float, default=1.0, help="Area multiplier of the 1 km x 1 km base zone")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--offset-ratio", type=float, default=0.1)
+    parser.add_argument("--deletion-ratio", type=float, default=0.03)
+    parser.add_argument("--addition-ratio", type=float, default=0.03)
+    parser.add_argument("--qgis-prefix", default=os.environ.get("QGIS_PREFIX_PATH", "/usr"))
+    args = parser.parse_args(argv)
+
+    side = 1000.0 * math.sqrt(args.scale)
+    dataset = generate_dataset(
+        width=side, height=side, seed=args.seed, offset_ratio=args.offset_ratio,
+        deletion_ratio=args.deletion_ratio, addition_ratio=args.addition_ratio,
+    )
+
+    from .batch import init_headless_qgis
+    init_headless_qgis(args.qgis_prefix)
+    write_dataset(dataset, args.output)
+    for key, count in dataset_counts(dataset).items():
+        print(f"{key}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Batch command line test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from batch import collect_jobs, find_folder_pair, format_summary, write_summary
+
+
+class BatchTest(unittest.TestCase):
+    """Test zone discovery and the summary table."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+        for zone in ('zone_a', 'zone_b'):
+            os.makedirs(os.path.join(self.folder, zone, 'Sauvegarde avant IA'))
+            os.makedirs(os.path.join(self.folder, zone, 'Sauvegarde après IA'))
+        os.makedirs(os.path.join(self.folder, 'incomplete', 'Sauvegarde avant IA'))
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def test_find_folder_pair(self):
+        """Avant and Apres folders are found with or without accents."""
+        avant, apres = find_folder_pair(os.path.join(self.folder, 'zone_a'))
+        self.assertTrue(avant.endswith('Sauvegarde avant IA'))
+        self.assertTrue(apres.endswith('Sauvegarde après IA'))
+        self.assertIsNone(find_folder_pair(os.path.join(self.folder, 'incomplete')))
+
+    def test_collect_jobs(self):
+        """Zones from globs and explicit pairs get distinct working directories."""
+        zone_a = os.path.join(self.folder, 'zone_a')
+        jobs = collect_jobs(
+            [os.path.join(self.folder, '*')],
+            [(os.path.join(zone_a, 'Sauvegarde avant IA'), os.path.join(zone_a, 'Sauvegarde après IA'))],
+        )
+        self.assertEqual([job['zone'] for job in jobs], ['zone_a', 'zone_b', 'zone_a_2'])
+        self.assertTrue(all(os.path.isabs(job['avant_folder']) for job in jobs))
+
+    def _results(self):
+        return [
+            {'zone': 'zone_a', 'status': 'ok', 'seconds': 12.5,
+             'timings': {'load': 1.0, 'capture': 10.0}, 'counts': {'captured': 42}, 'error': None},
+            {'zone': 'zone_b', 'status': 'failed', 'seconds': 0.5,
+             'timings': {'load': 0.5}, 'counts': {}, 'error': 'boom'},
+        ]
+
+    def test_format_summary(self):
+        """The table has a header, a rule and one line per zone."""
+        lines = format_summary(self._results()).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn('capture s', lines[0])
+        self.assertIn('42', lines[2])
+        self.assertTrue(lines[3].startswith('zone_b'))
+
+    def test_write_summary(self):
+        """summary.csv has the stage timings and the counts of each zone."""
+        write_summary(self._results(), self.folder)
+        with open(os.path.join(self.folder, 'summary.csv'), newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f, delimiter=';'))
+        self.assertEqual([row['zone'] for row in rows], ['zone_a', 'zone_b'])
+        self.assertEqual(rows[0]['capture s'], '10.0')
+        self.assertEqual(rows[0]['captured'], '42')
+        self.assertEqual(rows[1]['load s'], '0.5')
+        self.assertEqual(rows[1]['capture s'], '')
+        self.assertEqual(rows[1]['error'], 'boom')
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BatchTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
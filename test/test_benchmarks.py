@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Benchmark harness test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.harness import (
+    accuracy, append_history, compare_to_baseline, confusion_matrix, format_confusion, format_results,
+    load_baseline, save_baseline,
+)
+
+
+def _result(benchmark, size, wall_seconds, peak_rss_mb):
+    return {"benchmark": benchmark, "size": size, "wall_seconds": wall_seconds,
+            "peak_rss_mb": peak_rss_mb, "counts": {"cells": size}}
+
+
+class BenchmarkHarnessTest(unittest.TestCase):
+    """Test the history file and the baseline comparison."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def test_compare_to_baseline(self):
+        """Slower or bigger cases are flagged, unknown ones are new."""
+        baseline = {"grid/1000": {"wall_seconds": 1.0, "peak_rss_mb": 100.0},
+                    "grid/10000": {"wall_seconds": 10.0, "peak_rss_mb": 200.0}}
+        results = [_result("grid", 1000, 1.1, 100.0), _result("grid", 10000, 10.0, 300.0),
+                   _result("select", 100, 0.5, 90.0)]
+        statuses = [status for _, status in compare_to_baseline(results, baseline, tolerance=0.2)]
+        self.assertEqual(statuses[0], "ok")
+        self.assertTrue(statuses[1].startswith("regression"))
+        self.assertIn("peak_rss_mb", statuses[1])
+        self.assertEqual(statuses[2], "new")
+
+    def test_history_and_baseline(self):
+        """Results are appended as JSON lines and stored as the baseline."""
+        history = os.path.join(self.folder, "results", "history.jsonl")
+        baseline_path = os.path.join(self.folder, "baseline.json")
+        results = [_result("grid", 1000, 1.0, 100.0)]
+
+        append_history(results, history)
+        append_history(results, history)
+        with open(history) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 2)
+        self.assertIn("timestamp", lines[0])
+
+        save_baseline(results, baseline_path)
+        self.assertEqual(load_baseline(baseline_path), {"grid/1000": {"wall_seconds": 1.0, "peak_rss_mb": 100.0}})
+        table = format_results(compare_to_baseline(results, load_baseline(baseline_path)))
+        self.assertIn("grid/1000", table)
+        self.assertIn("cells=1000", table)
+
+    def test_confusion_matrix(self):
+        """Rows are the known categories, unreadable tiles go to the none column."""
+        categories = ["please_check", "random"]
+        matrix = confusion_matrix(["please_check", "please_check", "random", "random"],
+                                  ["please_check", "random", "random", None], categories)
+        self.assertEqual(matrix["please_check"], {"please_check": 1, "random": 1, "none": 0})
+        self.assertEqual(matrix["random"], {"please_check": 0, "random": 1, "none": 1})
+        self.assertEqual(accuracy(matrix), 0.5)
+        self.assertEqual(len(format_confusion(matrix).splitlines()), 3)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BenchmarkHarnessTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,66 @@
+# coding=utf-8
+"""Capture manifest test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import shutil
+import tempfile
+import unittest
+
+from capture_manifest import CaptureManifest, manifest_path_for
+
+
+class CaptureManifestTest(unittest.TestCase):
+    """Test the capture manifest stores run constants and cell rows."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+        self.path = manifest_path_for(self.folder)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def test_run_constants_round_trip(self):
+        """Run-level constants are stored once and read back."""
+        with CaptureManifest(self.path) as manifest:
+            manifest.set_run_constants(crs='EPSG:27572', layers=['grid', 'ROI'])
+
+        with CaptureManifest(self.path) as manifest:
+            constants = manifest.run_constants()
+        self.assertEqual(constants['crs'], 'EPSG:27572')
+        self.assertEqual(constants['layers'], ['grid', 'ROI'])
+
+    def test_cells_are_batched_and_updated(self):
+        """Cell rows are committed in batches and later updated in place."""
+        with CaptureManifest(self.path, batch_size=3) as manifest:
+            for grid_id in range(5):
+                manifest.add_cell(grid_id, xmin=0.0, ymin=0.0, xmax=20.0, ymax=20.0,
+                                  image_path='cell_%d.png' % grid_id, pixels_per_meter=100.0)
+            # The first batch is already committed, the rest is pending
+            self.assertEqual(manifest.count_cells(), 3)
+            manifest.flush()
+            self.assertEqual(manifest.count_cells(), 5)
+
+            manifest.update_cell(2, category='please_check', min_distance_m=0.2)
+            manifest.flush()
+            self.assertEqual(manifest.get_cell(2)['category'], 'please_check')
+            self.assertEqual(manifest.count_cells('category IS NULL'), 4)
+            self.assertEqual([cell['grid_id'] for cell in manifest.iter_cells(fetch_size=2)],
+                             [0, 1, 2, 3, 4])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(CaptureManifestTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,90 @@
+# coding=utf-8
+"""Feature store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import shutil
+import tempfile
+import unittest
+
+from feature_store import FeatureStore, decide_categories
+
+
+def _features(green_edges, red_edges, min_distance):
+    return {
+        "pixels_per_meter": 100.0, "green_pixels": green_edges, "red_pixels": red_edges, "white_pixels": 0,
+        "green_edge_pixels": green_edges, "red_edge_pixels": red_edges,
+        "green_contours": int(green_edges > 0), "red_contours": int(red_edges > 0),
+        "min_distance_m": min_distance, "median_distance_m": min_distance, "max_distance_m": min_distance,
+    }
+
+
+class FeatureStoreTest(unittest.TestCase):
+    """Test the columnar store and the vectorized category rules."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def test_decide_categories(self):
+        """Same rules as MismatchIdentifier.classify_image."""
+        store = FeatureStore(self.folder)
+        store.add(1, _features(10, 10, 0.2))
+        store.add(2, _features(10, 10, 2.0))
+        store.add(3, _features(10, 0, None))
+        store.add(4, _features(0, 10, None))
+        store.add(5, _features(10, 10, None))
+        store.save()
+
+        features = store.load()
+        self.assertEqual(
+            decide_categories(features, 0.5).tolist(),
+            ["please_check", "cartography_error", "no_cartography_error", "random", "cartography_error"],
+        )
+        # A looser threshold turns the second cell into please_check
+        self.assertEqual(decide_categories(features, 3.0)[1], "please_check")
+        self.assertEqual(decide_categories(_features(10, 10, 0.2), 0.5)[0], "please_check")
+
+    def test_decide_categories_morphology(self):
+        """Morphology rows use the pixel counts and the median red pixel distance."""
+        near = dict(_features(0, 0, 0.0), engine=1, green_pixels=50, red_pixels=50, median_distance_m=0.4)
+        far = dict(near, median_distance_m=0.8)
+        green_only = dict(near, red_pixels=0, min_distance_m=None, median_distance_m=None)
+        features = {name: [row[name] for row in (near, far, green_only)] for name in near}
+        self.assertEqual(decide_categories(features, 0.5).tolist(),
+                         ["please_check", "cartography_error", "no_cartography_error"])
+
+    def test_save_merges_rows(self):
+        """Rows extracted again replace the stored ones, rows stay sorted by grid id."""
+        store = FeatureStore(self.folder)
+        store.add(3, _features(10, 0, None))
+        store.add(1, _features(10, 10, 0.2))
+        self.assertEqual(store.save(), 2)
+
+        store.add(3, _features(10, 10, 4.0))
+        store.add(2, _features(0, 0, None))
+        store.save()
+
+        features = FeatureStore(self.folder).load()
+        self.assertEqual(features["grid_id"].tolist(), [1, 2, 3])
+        self.assertEqual(features["red_edge_pixels"].tolist(), [10, 0, 10])
+        self.assertEqual(features["min_distance_m"][2], 4.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(FeatureStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,93 @@
+# coding=utf-8
+"""Grid filter test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+from .utilities import get_qgis_app
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import unittest
+
+from qgis.core import QgsFeature, QgsGeometry, QgsProject, QgsVectorLayer
+
+from ..grid_filter import GridFilter
+
+QGIS_APP = get_qgis_app()
+
+
+def _memory_layer(geometry_type, name, wkts):
+    layer = QgsVectorLayer(f"{geometry_type}?crs=EPSG:2154", name, "memory")
+    features = []
+    for wkt in wkts:
+        feature = QgsFeature()
+        feature.setGeometry(QgsGeometry.fromWkt(wkt))
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+class GridFilterTest(unittest.TestCase):
+    """Test the buffer selection and the grid filter."""
+
+    def setUp(self):
+        """Runs before each test."""
+        project = QgsProject.instance()
+        project.addMapLayer(_memory_layer("LineString", "Arc_itineraire_AV", [
+            "LINESTRING(0 0, 100 0)",
+            "LINESTRING(0 200, 100 200)",
+        ]))
+        self.parcels = _memory_layer("Polygon", "BD_PARCELLAIRE_parcelle", [
+            "POLYGON((10 2, 20 2, 20 12, 10 12, 10 2))",  # 2 m from the first route
+            "POLYGON((10 50, 20 50, 20 60, 10 60, 10 50))",  # Far from both routes
+            "POLYGON((50 196, 60 196, 60 204, 50 204, 50 196))",  # Across the second route
+        ])
+        project.addMapLayer(self.parcels)
+
+    def tearDown(self):
+        """Runs after each test."""
+        QgsProject.instance().clear()
+
+    def test_select_within_buffer(self):
+        """Only the target features within the buffer of a reference feature are selected."""
+        grid_filter = GridFilter("Arc_itineraire_AV", buffer_distance=5)
+        grid_filter.select_layers_within_buffer()
+
+        self.assertEqual(len(grid_filter.selection_results), 1)
+        selected_ids = sorted(feature.id() for feature in grid_filter.selection_results[0]["features"])
+        self.assertEqual(selected_ids, [1, 3])
+        self.assertEqual(sorted(self.parcels.selectedFeatureIds()), [1, 3])
+        self.assertEqual(len(grid_filter.selected_features), 2)
+
+    def test_compute_selection_cancelled(self):
+        """A cancelled selection returns None and keeps the previous results."""
+        grid_filter = GridFilter("Arc_itineraire_AV", buffer_distance=5)
+        prepared = grid_filter.prepare_selection()
+        self.assertIsNone(grid_filter.compute_selection(prepared, is_canceled=lambda: True))
+        self.assertEqual(grid_filter.selection_results, [])
+
+    def test_filter_grid_by_selection(self):
+        """Only the grid cells crossing a selected feature are kept."""
+        grid_filter = GridFilter("Arc_itineraire_AV", buffer_distance=5)
+        grid_filter.select_layers_within_buffer()
+        grid = _memory_layer("Polygon", "Grid", [
+            "POLYGON((0 0, 20 0, 20 20, 0 20, 0 0))",
+            "POLYGON((0 40, 20 40, 20 60, 0 60, 0 40))",
+            "POLYGON((40 180, 60 180, 60 200, 40 200, 40 180))",
+            "POLYGON((80 80, 100 80, 100 100, 80 100, 80 80))",
+        ])
+
+        filtered = grid_filter.filter_grid_by_selection(grid)
+        self.assertEqual(filtered.featureCount(), 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(GridFilterTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
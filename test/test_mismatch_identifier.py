@@ -0,0 +1,251 @@
+# coding=utf-8
+"""Mismatch identifier test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from capture_manifest import CaptureManifest, manifest_path_for
+from feature_store import FeatureStore, feature_store_path_for
+from mismatch_identifier import MismatchIdentifier
+from tile_stack import TileStack, tile_reference, tile_stack_path_for
+
+PIXELS_PER_METER = 40.0
+TILE_SIZE = 400  # 10 m
+
+# BGR colors of the AV/AP route styles
+GREEN = (0, 200, 0)
+RED = (0, 0, 255)
+
+# Layout -> expected category, as in bench_classifier.LAYOUTS
+LAYOUTS = {
+    "blank": "random",
+    "green_only": "no_cartography_error",
+    "red_only": "random",
+    "near": "please_check",
+    "far": "cartography_error",
+}
+
+
+def draw_tile(layout):
+    """Blank, green_only, red_only, near (0.2 m apart) or far (2 m apart) tile, as in bench_classifier.LAYOUTS."""
+    image = np.full((TILE_SIZE, TILE_SIZE, 3), 255, dtype=np.uint8)
+    width = 4  # 0.1 m
+    y = TILE_SIZE // 2
+    if layout in ("green_only", "near", "far"):
+        cv2.line(image, (0, y), (TILE_SIZE - 1, y), GREEN, width)
+    if layout == "red_only":
+        cv2.line(image, (0, y), (TILE_SIZE - 1, y), RED, width)
+    elif layout in ("near", "far"):
+        offset = int((0.2 if layout == "near" else 2.0) * PIXELS_PER_METER)
+        cv2.line(image, (0, y + offset), (TILE_SIZE - 1, y + offset), RED, width)
+    return image
+
+
+class InterruptedIdentifier(MismatchIdentifier):
+    """Fails on cell_6.png, like a run stopped halfway."""
+
+    def _classify_loaded(self, image_path, *args):
+        if image_path.endswith("cell_6.png"):
+            raise RuntimeError("Interrupted")
+        return super()._classify_loaded(image_path, *args)
+
+
+class MismatchIdentifierTest(unittest.TestCase):
+    """Test the feature extraction and the classification of drawn tiles."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def _classifier(self, **options):
+        return MismatchIdentifier(input_folder=self.folder, output_folder=os.path.join(self.folder, "classified"),
+                                  pixels_per_meter=PIXELS_PER_METER, **options)
+
+    def _write_tile(self, name, layout):
+        image_path = os.path.join(self.folder, name)
+        cv2.imwrite(image_path, draw_tile(layout))
+        return image_path
+
+    def test_classify_layouts(self):
+        """Each layout gets its category, with both engines."""
+        for engine in ("contours", "morphology"):
+            classifier = self._classifier(engine=engine)
+            for layout, expected in LAYOUTS.items():
+                image_path = self._write_tile(f"{layout}.png", layout)
+                self.assertEqual(classifier.classify_image(image_path), expected, (engine, layout))
+            self.assertEqual(classifier.shortcut_counts["both_colors"], 2)
+
+    def _cell(self, grid_id, layout):
+        return {"grid_id": grid_id, "image_path": self._write_tile(f"cell_{grid_id}.png", layout),
+                "pixels_per_meter": PIXELS_PER_METER}
+
+    def test_exact_dedup(self):
+        """Identical tiles are classified once; evicted tiles are classified again."""
+        classifier = self._classifier(dedup="exact")
+        results = [classifier.classify_cell(self._cell(grid_id, "far")) for grid_id in (1, 2)]
+        self.assertEqual(classifier.dedup_counts, {"classified": 1, "duplicates": 1})
+        self.assertEqual([result["category"] for result in results], ["cartography_error"] * 2)
+        self.assertEqual(results[0]["min_distance_m"], results[1]["min_distance_m"])
+        self.assertTrue(os.path.exists(results[1]["image_path"]))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "cell_2.png")))
+
+        classifier = self._classifier(dedup="exact", dedup_cache_size=1)
+        for grid_id, layout in enumerate(("far", "near", "far")):
+            classifier.classify_cell(self._cell(grid_id, layout))
+        self.assertEqual(classifier.dedup_counts, {"classified": 3, "duplicates": 0})
+
+    def test_downsampled_dedup(self):
+        """Tiles differing only by a few pixels share a result; other drawings don't."""
+        classifier = self._classifier(dedup="downsampled")
+        far, near = self._cell(1, "far"), self._cell(3, "near")
+        noisy = draw_tile("far")
+        noisy[0, 0] = (250, 250, 250)
+        noisy_path = os.path.join(self.folder, "cell_2.png")
+        cv2.imwrite(noisy_path, noisy)
+        noisy_far = {"grid_id": 2, "image_path": noisy_path, "pixels_per_meter": PIXELS_PER_METER}
+
+        results = [classifier.classify_cell(cell) for cell in (far, noisy_far, near)]
+        self.assertEqual([result["category"] for result in results],
+                         ["cartography_error", "cartography_error", "please_check"])
+        self.assertEqual(classifier.dedup_counts, {"classified": 2, "duplicates": 1})
+
+        # Exact hashing tells the noisy tile apart
+        classifier = self._classifier(dedup="exact")
+        classifier.classify_cell(self._cell(4, "far"))
+        cv2.imwrite(noisy_path, noisy)
+        classifier.classify_cell(noisy_far)
+        self.assertEqual(classifier.dedup_counts, {"classified": 2, "duplicates": 0})
+
+    def test_process_images(self):
+        """
+        Every cell of the manifest is classified and moved, and recorded only once moved
+
+        A cell whose move fails stays unclassified in the manifest, to be
+        classified again by the next run; its features are stored anyway.
+        """
+        layouts = list(LAYOUTS) * 2
+        self._add_cells(layouts)
+
+        classifier = self._classifier(dedup=None)
+        # The "random" tiles can't be moved: their cells must stay unclassified
+        shutil.rmtree(os.path.join(classifier.output_folder, "random"))
+        classifier.process_images(prefetch_workers=2, prefetch_depth=3, move_batch_size=2)
+
+        with CaptureManifest(manifest_path_for(self.folder)) as manifest:
+            cells = list(manifest.iter_cells())
+        self.assertEqual(len(cells), len(layouts))
+        for cell, layout in zip(cells, layouts):
+            source = os.path.join(self.folder, f"cell_{cell['grid_id']}.png")
+            if LAYOUTS[layout] == "random":
+                self.assertIsNone(cell["category"], layout)
+                self.assertEqual(cell["image_path"], source)
+                self.assertTrue(os.path.exists(source))
+            else:
+                self.assertEqual(cell["category"], LAYOUTS[layout])
+                self.assertEqual(os.path.dirname(cell["image_path"]),
+                                 os.path.abspath(os.path.join(classifier.output_folder, LAYOUTS[layout])))
+                self.assertTrue(os.path.exists(cell["image_path"]))
+                self.assertFalse(os.path.exists(source))
+
+        features = FeatureStore(feature_store_path_for(self.folder)).load()
+        self.assertEqual(features["grid_id"].tolist(), list(range(len(layouts))))
+
+    def _add_cells(self, layouts):
+        with CaptureManifest(manifest_path_for(self.folder)) as manifest:
+            for grid_id, layout in enumerate(layouts):
+                cell = self._cell(grid_id, layout)
+                manifest.add_cell(cell.pop("grid_id"), **cell)
+
+    def test_interrupted_run_keeps_features(self):
+        """Cells classified before a failure keep their features, and reclassify reports those without."""
+        self._add_cells(list(LAYOUTS) * 2)
+        classifier = InterruptedIdentifier(input_folder=self.folder,
+                                           output_folder=os.path.join(self.folder, "classified"),
+                                           pixels_per_meter=PIXELS_PER_METER)
+        with self.assertRaises(RuntimeError):
+            classifier.process_images(prefetch_workers=2, prefetch_depth=3)
+
+        with CaptureManifest(manifest_path_for(self.folder)) as manifest:
+            classified = [cell["grid_id"] for cell in manifest.iter_cells("category IS NOT NULL")]
+        self.assertEqual(classified, list(range(6)))
+        features = FeatureStore(feature_store_path_for(self.folder)).load()
+        self.assertEqual(features["grid_id"].tolist(), classified)
+        self.assertEqual(classifier.reclassify(move_files=False)["missing_features"], 0)
+
+        with CaptureManifest(manifest_path_for(self.folder)) as manifest:
+            manifest.update_cell(8, category="random")
+        counts = self._classifier().reclassify(move_files=False)
+        self.assertEqual(counts["missing_features"], 1)
+        self.assertEqual(sum(counts[category] for category in classifier.categories), 6)
+
+    def test_extract_features_batch(self):
+        """Batch features equal the features of each tile, with both engines."""
+        tiles = np.stack([draw_tile(layout) for layout in LAYOUTS])
+        for engine in ("contours", "morphology"):
+            classifier = self._classifier(engine=engine)
+            batch_features = classifier.extract_features_batch(tiles, [PIXELS_PER_METER] * len(tiles))
+            for tile, features, layout in zip(tiles, batch_features, LAYOUTS):
+                self.assertEqual(features, classifier.extract_features(tile, PIXELS_PER_METER), (engine, layout))
+
+    def test_process_stacked_images(self):
+        """Stacked tiles are classified in batches and keep their stack reference."""
+        layouts = list(LAYOUTS) * 2
+        stack_folder = tile_stack_path_for(self.folder)
+        stack = TileStack.create(stack_folder, len(layouts), (TILE_SIZE, TILE_SIZE, 3))
+        with CaptureManifest(manifest_path_for(self.folder)) as manifest:
+            for grid_id, layout in enumerate(layouts):
+                stack.put(grid_id, draw_tile(layout))
+                manifest.add_cell(grid_id, image_path=tile_reference(stack_folder, grid_id),
+                                  pixels_per_meter=PIXELS_PER_METER)
+        stack.close()
+
+        classifier = self._classifier()
+        classifier.process_images(stack_batch_size=3)
+
+        with CaptureManifest(manifest_path_for(self.folder)) as manifest:
+            cells = list(manifest.iter_cells())
+        self.assertEqual([cell["category"] for cell in cells], [LAYOUTS[layout] for layout in layouts])
+        self.assertEqual([cell["image_path"] for cell in cells],
+                         [tile_reference(stack_folder, grid_id) for grid_id in range(len(layouts))])
+        self.assertEqual(classifier.dedup_counts["classified"], len(layouts))
+        features = FeatureStore(feature_store_path_for(self.folder)).load()
+        self.assertEqual(features["grid_id"].tolist(), list(range(len(layouts))))
+
+    def test_extract_features_without_pair(self):
+        """Tiles missing a color have no distances, whatever the engine."""
+        for engine in ("contours", "morphology"):
+            classifier = self._classifier(engine=engine)
+            for layout in ("blank", "green_only"):
+                features = classifier.extract_features(draw_tile(layout), PIXELS_PER_METER)
+                self.assertIsNone(features["min_distance_m"], (engine, layout))
+                self.assertIsNone(features["median_distance_m"], (engine, layout))
+                self.assertIsNone(features["max_distance_m"], (engine, layout))
+            self.assertEqual(classifier.decide_category(features), "no_cartography_error")
+            self.assertEqual(classifier.shortcut_counts["empty"], 1)
+            self.assertEqual(classifier.shortcut_counts["no_red"], 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(MismatchIdentifierTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,84 @@
+# coding=utf-8
+"""Profiling spans test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import profiling
+
+
+@profiling.timed(category='classify')
+def classify():
+    return 'random'
+
+
+class ProfilingTest(unittest.TestCase):
+    """Test spans, the Chrome trace and the per-stage summary."""
+
+    def setUp(self):
+        """Runs before each test."""
+        profiling.profiler.reset()
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        profiling.disable()
+        profiling.profiler.reset()
+        shutil.rmtree(self.folder)
+
+    def test_disabled(self):
+        """Nothing is recorded while disabled."""
+        profiling.disable()
+        with profiling.span('render', 'capture'):
+            pass
+        self.assertEqual(classify(), 'random')
+        self.assertEqual(profiling.profiler.events, [])
+
+    def test_summary(self):
+        """Spans and decorated calls are summarized per stage."""
+        profiling.enable()
+        for _ in range(3):
+            with profiling.span('render', 'capture', cell=1):
+                pass
+        self.assertEqual(classify(), 'random')
+
+        summary = profiling.profiler.summary()
+        self.assertEqual(summary['capture']['render']['count'], 3)
+        self.assertEqual(summary['classify']['classify']['count'], 1)
+
+    def test_chrome_trace(self):
+        """The trace holds one complete event per span and thread names."""
+        profiling.enable()
+        with profiling.span('canny', 'classify'):
+            pass
+
+        trace_path = os.path.join(self.folder, 'trace.json')
+        summary_path = profiling.profiler.write_chrome_trace(trace_path)
+        with open(trace_path) as f:
+            trace = json.load(f)
+
+        complete = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual([event['name'] for event in complete], ['canny'])
+        self.assertGreaterEqual(complete[0]['dur'], 0)
+        self.assertTrue(any(event['ph'] == 'M' for event in trace['traceEvents']))
+        self.assertTrue(os.path.exists(summary_path))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ProfilingTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
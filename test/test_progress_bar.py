@@ -0,0 +1,95 @@
+# coding=utf-8
+"""Progress bar manager test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import threading
+import unittest
+
+from progressBar import ProgressBarManager, StageCounter
+
+
+class FakeProgressBar(object):
+    """Records the calls a QProgressBar would receive."""
+
+    def __init__(self):
+        self.values = []
+
+    def setValue(self, value):
+        self.values.append(value)
+
+    def setFormat(self, text):
+        pass
+
+
+class ProgressBarManagerTest(unittest.TestCase):
+    """Test stage counters, throttling and headless use."""
+
+    def test_headless_stages(self):
+        """Counters work without a progress bar."""
+        manager = ProgressBarManager(None)
+        manager.start_stage('capture', 10)
+        for _ in range(10):
+            manager.update_progress()
+        manager.start_stage('classify', 4)
+        manager.update_progress(2)
+        manager.complete()
+
+        stats = {stage['stage']: stage for stage in manager.stats()}
+        self.assertEqual(stats['capture']['processed'], 10)
+        self.assertEqual(stats['classify']['processed'], 2)
+        self.assertEqual(manager.percentage(), 50)
+
+    def test_updates_are_throttled(self):
+        """Thousands of updates only refresh the bar a few times."""
+        bar = FakeProgressBar()
+        manager = ProgressBarManager(bar, update_interval=60)
+        manager.set_total(5000)
+        for _ in range(5000):
+            manager.update_progress()
+        manager.complete()
+        self.assertLess(len(bar.values), 5)
+        self.assertEqual(bar.values[-1], 100)
+
+    def test_worker_threads_only_count(self):
+        """Updates from worker threads are counted but never touch the bar."""
+        bar = FakeProgressBar()
+        manager = ProgressBarManager(bar, update_interval=0)
+        manager.set_total(400)
+        bar.values = []
+
+        workers = [
+            threading.Thread(target=lambda: [manager.update_progress() for _ in range(100)])
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(bar.values, [])
+        self.assertEqual(manager.current_progress, 400)
+        manager.flush()
+        self.assertEqual(bar.values, [100])
+
+    def test_eta_from_rate(self):
+        """The ETA follows the measured throughput."""
+        stage = StageCounter('render', total=100)
+        stage.add(10, stage.started + 1.0)
+        self.assertAlmostEqual(stage.throughput(), 10.0)
+        self.assertAlmostEqual(stage.eta(), 9.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ProgressBarManagerTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
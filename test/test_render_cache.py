@@ -0,0 +1,71 @@
+# coding=utf-8
+"""Render cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from render_cache import RenderCache
+
+
+class RenderCacheTest(unittest.TestCase):
+    """Test cache hits and LRU eviction of rendered tiles."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+        self.cache = RenderCache(os.path.join(self.folder, 'cache'), max_bytes=250)
+
+    def tearDown(self):
+        """Runs after each test."""
+        self.cache.close()
+        shutil.rmtree(self.folder)
+
+    def _tile(self, name, size=100):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_hit_restores_tile(self):
+        """A cached tile is restored byte for byte."""
+        source = self._tile('cell_1.png')
+        self.cache.put('a' * 40, source)
+
+        destination = os.path.join(self.folder, 'restored.png')
+        self.assertTrue(self.cache.get('a' * 40, destination))
+        self.assertFalse(self.cache.get('b' * 40, destination))
+        with open(source, 'rb') as expected, open(destination, 'rb') as restored:
+            self.assertEqual(expected.read(), restored.read())
+
+    def test_least_recently_used_is_evicted(self):
+        """Going over budget evicts the tile that was used least recently."""
+        self.cache.put('a' * 40, self._tile('cell_1.png'))
+        self.cache.put('b' * 40, self._tile('cell_2.png'))
+        # Touch the first tile so the second one becomes the oldest
+        self.cache.get('a' * 40, os.path.join(self.folder, 'restored.png'))
+        self.cache.put('c' * 40, self._tile('cell_3.png'))
+
+        destination = os.path.join(self.folder, 'check.png')
+        self.assertTrue(self.cache.get('a' * 40, destination))
+        self.assertFalse(self.cache.get('b' * 40, destination))
+        self.assertTrue(self.cache.get('c' * 40, destination))
+        self.assertLessEqual(self.cache.total_bytes, 250)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RenderCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,53 @@
+# coding=utf-8
+"""Report statistics test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import unittest
+
+from report_stats import REPORT_CATEGORIES, CategoryStats, RunningStats
+
+
+class ReportStatsTest(unittest.TestCase):
+    """Test the per-category counts and distance statistics of the report."""
+
+    def test_running_stats(self):
+        """Welford statistics match the batch formulas."""
+        stats = RunningStats()
+        self.assertEqual(stats.as_dict()["mean"], None)
+        for value in (1.0, 2.0, 4.0):
+            stats.add(value)
+        self.assertEqual(stats.as_dict(), {"count": 3, "min": 1.0, "max": 4.0, "mean": 2.333, "std": 1.247})
+
+    def test_category_stats(self):
+        """Every category is reported, including unknown ones and those without any distance."""
+        stats = CategoryStats()
+        stats.add("cartography_error", 1.5)
+        stats.add("cartography_error", 2.5)
+        stats.add("random", None)
+        stats.add("unexpected", None)
+
+        summary = stats.as_dict()
+        self.assertEqual(list(summary), REPORT_CATEGORIES + ["unexpected"])
+        self.assertEqual(stats.total(), 4)
+        self.assertEqual(summary["cartography_error"]["count"], 2)
+        self.assertEqual(summary["cartography_error"]["min_distance_m"]["mean"], 2.0)
+        self.assertEqual(summary["random"], {"count": 1, "min_distance_m": RunningStats().as_dict()})
+        self.assertEqual(summary["unexpected"]["count"], 1)
+        self.assertEqual(summary["unexpected"]["min_distance_m"]["count"], 0)
+        self.assertEqual(summary["please_check"]["count"], 0)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ReportStatsTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
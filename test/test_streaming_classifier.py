@@ -0,0 +1,94 @@
+# coding=utf-8
+"""Streaming classifier test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from capture_manifest import CaptureManifest, manifest_path_for
+from feature_store import FeatureStore, feature_store_path_for
+from mismatch_identifier import MismatchIdentifier
+from streaming_classifier import StreamingClassifier
+
+PIXELS_PER_METER = 40.0
+TILE_SIZE = 400  # 10 m
+
+# Red line offset from the green one (meters) -> expected category
+OFFSETS = {0.2: "please_check", 2.0: "cartography_error"}
+
+
+def draw_tile(offset_m):
+    """Green line with a red line offset_m below it."""
+    image = np.full((TILE_SIZE, TILE_SIZE, 3), 255, dtype=np.uint8)
+    y = TILE_SIZE // 2
+    cv2.line(image, (0, y), (TILE_SIZE - 1, y), (0, 200, 0), 4)
+    y += int(offset_m * PIXELS_PER_METER)
+    cv2.line(image, (0, y), (TILE_SIZE - 1, y), (0, 0, 255), 4)
+    return image
+
+
+class StreamingClassifierTest(unittest.TestCase):
+    """Test classifying captured cells on the worker thread."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+        self.manifest_path = manifest_path_for(self.folder)
+        self.expected = {}
+        with CaptureManifest(self.manifest_path) as manifest:
+            for grid_id in range(6):
+                offset_m = list(OFFSETS)[grid_id % 2]
+                image_path = os.path.join(self.folder, f"cell_{grid_id}.png")
+                cv2.imwrite(image_path, draw_tile(offset_m))
+                manifest.add_cell(grid_id, image_path=image_path, pixels_per_meter=PIXELS_PER_METER)
+                self.expected[grid_id] = OFFSETS[offset_m]
+            # Captured, but its tile is missing
+            manifest.add_cell(6, image_path=os.path.join(self.folder, "cell_6.png"), pixels_per_meter=PIXELS_PER_METER)
+        with CaptureManifest(self.manifest_path) as manifest:
+            self.cells = list(manifest.iter_cells())
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def test_submit_close(self):
+        """Submitted cells are classified, and recorded in the manifest and the feature store on close."""
+        classifier = MismatchIdentifier(input_folder=self.folder, output_folder=os.path.join(self.folder, "classified"),
+                                        pixels_per_meter=PIXELS_PER_METER)
+        stream = StreamingClassifier(classifier, max_queue_size=2)
+        for cell in self.cells:
+            stream.submit(cell)
+        self.assertEqual(stream.close(self.manifest_path), 6)
+        self.assertEqual(stream.errors, [])
+
+        with CaptureManifest(self.manifest_path) as manifest:
+            cells = {cell["grid_id"]: cell for cell in manifest.iter_cells()}
+        self.assertEqual({grid_id: cells[grid_id]["category"] for grid_id in self.expected}, self.expected)
+        self.assertIsNone(cells[6]["category"])
+        for grid_id, category in self.expected.items():
+            self.assertTrue(cells[grid_id]["image_path"].endswith(os.path.join(category, f"cell_{grid_id}.png")))
+            self.assertTrue(os.path.exists(cells[grid_id]["image_path"]))
+
+        features = FeatureStore(feature_store_path_for(self.folder)).load()
+        self.assertEqual(features["grid_id"].tolist(), list(self.expected))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(StreamingClassifierTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,77 @@
+# coding=utf-8
+"""Synthetic dataset generator test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import unittest
+
+from synthetic_dataset import (
+    APRES_FOLDER,
+    AVANT_FOLDER,
+    expected_category,
+    generate_dataset,
+    segment_intersects_rect,
+)
+
+
+class SyntheticDatasetTest(unittest.TestCase):
+    """Test determinism, layers and ground-truth labels."""
+
+    def test_same_seed_same_dataset(self):
+        """A seed always produces the same zone."""
+        first = generate_dataset(width=400, height=400, seed=3)
+        second = generate_dataset(width=400, height=400, seed=3)
+        other = generate_dataset(width=400, height=400, seed=4)
+        self.assertEqual(first['layers'], second['layers'])
+        self.assertEqual(first['labels'], second['labels'])
+        self.assertNotEqual(first['layers'], other['layers'])
+
+    def test_layers(self):
+        """Both folders hold the files FileLoader loads."""
+        dataset = generate_dataset(width=400, height=400, seed=1)
+        self.assertEqual(
+            sorted(dataset['layers'][AVANT_FOLDER]),
+            ['Arc_itineraire', 'Cadastre,_Polygone', 'Cadastre,_Polyligne'])
+        self.assertEqual(
+            sorted(dataset['layers'][APRES_FOLDER]),
+            ['Arc_itineraire', 'BD_PARCELLAIRE_batiment', 'BD_PARCELLAIRE_parcelle'])
+        self.assertTrue(dataset['layers'][AVANT_FOLDER]['Arc_itineraire'])
+
+    def test_labels(self):
+        """Every mismatch kind shows up in the labels of a large enough zone."""
+        dataset = generate_dataset(
+            width=800, height=800, seed=2, offset_ratio=0.3, deletion_ratio=0.1, addition_ratio=0.1)
+        categories = {label[5] for label in dataset['labels']}
+        self.assertEqual(
+            categories, {'random', 'no_cartography_error', 'please_check', 'cartography_error'})
+        indexes = [label[0] for label in dataset['labels']]
+        self.assertEqual(indexes, list(range(len(indexes))))
+
+    def test_expected_category(self):
+        """Offsets below the threshold need checking, larger ones are errors."""
+        self.assertEqual(expected_category(set(), None), 'random')
+        self.assertEqual(expected_category({'same'}, None), 'no_cartography_error')
+        self.assertEqual(expected_category({'same', 'offset'}, 0.2, 0.5), 'please_check')
+        self.assertEqual(expected_category({'offset'}, 2.0, 0.5), 'cartography_error')
+        self.assertEqual(expected_category({'same', 'deleted'}, None), 'cartography_error')
+
+    def test_segment_intersects_rect(self):
+        """Segments crossing, missing or only touching a corner of a cell."""
+        self.assertTrue(segment_intersects_rect((-5, 5), (15, 5), 0, 0, 10, 10))
+        self.assertFalse(segment_intersects_rect((-5, 15), (15, 15), 0, 0, 10, 10))
+        self.assertFalse(segment_intersects_rect((-5, 5), (0, 10), 0, 10, 10, 20))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(SyntheticDatasetTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
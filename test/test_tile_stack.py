@@ -0,0 +1,128 @@
+# coding=utf-8
+"""Tile stack test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'sayehomar03@gmail.com'
+__date__ = '2025-03-24'
+__copyright__ = 'Copyright 2025, ESSAYEH Omar / AMARIS CONSULTING '
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from tile_stack import (
+    TileStack, is_tile_reference, parse_tile_reference, read_stacked_tile, tile_reference, tile_stack_path_for,
+)
+
+TILE_SHAPE = (4, 6, 3)
+
+
+def _tile(value):
+    return np.full(TILE_SHAPE, value, dtype=np.uint8)
+
+
+class TileStackTest(unittest.TestCase):
+    """Test writing, reading and batching stacked tiles."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+        self.stack_folder = tile_stack_path_for(self.folder)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder)
+
+    def test_references(self):
+        """Only "<tile_stack folder>#<grid id>" is a reference."""
+        reference = tile_reference(self.stack_folder, 42)
+        self.assertEqual(parse_tile_reference(reference), (os.path.abspath(self.stack_folder), 42))
+        self.assertTrue(is_tile_reference(reference))
+        self.assertFalse(is_tile_reference(os.path.join(self.folder, "cell_42.png")))
+        self.assertFalse(is_tile_reference(os.path.join(self.folder, "other#42")))
+        self.assertFalse(is_tile_reference(None))
+
+    def test_put_get(self):
+        """Tiles are read back by grid id, from another handle too."""
+        stack = TileStack.create(self.stack_folder, 3, TILE_SHAPE)
+        stack.put(10, _tile(1))
+        stack.put(20, _tile(2))
+        stack.put(10, _tile(3))  # Written again: same slot
+        stack.flush()
+
+        self.assertEqual(len(stack), 2)
+        self.assertIn(20, stack)
+        self.assertNotIn(30, stack)
+        self.assertEqual(stack.slot(10), 0)
+        self.assertEqual(stack.get(10)[0, 0, 0], 3)
+        self.assertIsNone(stack.get(30))
+
+        reader = TileStack(self.stack_folder)
+        self.assertEqual(reader.get(20)[0, 0, 0], 2)
+        stack.put(30, _tile(4))
+        stack.flush()
+        self.assertEqual(reader.get(30)[0, 0, 0], 4)
+        self.assertEqual(read_stacked_tile(tile_reference(self.stack_folder, 30))[0, 0, 0], 4)
+
+        with self.assertRaises(ValueError):
+            stack.put(40, _tile(5))  # Full
+        with self.assertRaises(ValueError):
+            stack.put(10, np.zeros((2, 2, 3), dtype=np.uint8))
+        reader.close()
+        stack.close()
+
+    def test_open_or_create(self):
+        """An existing stack is reopened, unless it can't hold the tiles."""
+        TileStack.create(self.stack_folder, 4, TILE_SHAPE).put(7, _tile(7))
+        stack = TileStack.open_or_create(self.stack_folder, 4, TILE_SHAPE)
+        self.assertEqual(stack.get(7)[0, 0, 0], 7)
+        stack.close()
+
+        with self.assertRaises(ValueError):
+            TileStack.open_or_create(self.stack_folder, 5, TILE_SHAPE)
+        with self.assertRaises(ValueError):
+            TileStack.open_or_create(self.stack_folder, 4, (8, 8, 3))
+
+    def test_read_recreated_stack(self):
+        """read_stacked_tile() does not keep reading a deleted stack."""
+        reference = tile_reference(self.stack_folder, 1)
+        stack = TileStack.create(self.stack_folder, 2, TILE_SHAPE)
+        stack.put(1, _tile(1))
+        stack.close()
+        self.assertEqual(read_stacked_tile(reference)[0, 0, 0], 1)
+
+        shutil.rmtree(self.stack_folder)
+        self.assertIsNone(read_stacked_tile(reference))
+
+        stack = TileStack.create(self.stack_folder, 2, TILE_SHAPE)
+        stack.put(1, _tile(2))
+        stack.close()
+        self.assertEqual(read_stacked_tile(reference)[0, 0, 0], 2)
+
+    def test_batches(self):
+        """Batches are runs of consecutive slots, at most batch_size long."""
+        stack = TileStack.create(self.stack_folder, 6, TILE_SHAPE)
+        for grid_id in range(6):
+            stack.put(grid_id + 100, _tile(grid_id))
+
+        batches = list(stack.batches([105, 100, 101, 102, 104, 999], batch_size=2))
+        self.assertEqual([grid_ids for grid_ids, _ in batches], [[100, 101], [102], [104, 105]])
+        grid_ids, tiles = batches[2]
+        self.assertEqual(tiles.shape, (2,) + TILE_SHAPE)
+        self.assertEqual(tiles[:, 0, 0, 0].tolist(), [4, 5])
+        stack.close()
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TileStackTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
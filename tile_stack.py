@@ -0,0 +1,236 @@
+"""
+Memory-mapped stack of captured tiles.
+
+Instead of one image file per cell, GridCapture can write every tile of a run
+into a single N x H x W x 3 BGR array (tiles.npy), with the grid id of each
+slot in grid_ids.npy. Both are .npy files opened with memory maps: a tile is
+written or read in O(1) without decoding, and MismatchIdentifier classifies
+runs of consecutive slots as zero-copy batches.
+
+The manifest refers to a stacked tile as "<stack folder>#<grid id>", which
+read_tile() in mismatch_identifier understands.
+"""
+import os
+import threading
+
+import numpy as np
+
+TILE_STACK_FOLDERNAME = "tile_stack"
+TILES_FILENAME = "tiles.npy"
+GRID_IDS_FILENAME = "grid_ids.npy"
+REFERENCE_SEPARATOR = "#"
+FREE_SLOT = -1
+
+# Read-only stacks opened by read_stacked_tile(): folder -> (file identity, stack)
+_readers = {}
+
+
+def tile_stack_path_for(folder):
+    """
+    Path of the tile stack of a capture output folder
+
+    :param folder: GridCapture output folder
+    :return: Folder holding tiles.npy and grid_ids.npy
+    """
+    return os.path.join(folder, TILE_STACK_FOLDERNAME)
+
+
+def tile_reference(stack_folder, grid_id):
+    """Manifest image_path of a stacked tile."""
+    return f"{os.path.abspath(stack_folder)}{REFERENCE_SEPARATOR}{grid_id}"
+
+
+def parse_tile_reference(image_path):
+    """
+    Split a stacked tile reference
+
+    :return: (stack folder, grid id), or None for a regular image path
+    """
+    if not image_path:
+        return None
+    folder, separator, grid_id = image_path.rpartition(REFERENCE_SEPARATOR)
+    if not separator or not grid_id.isdigit() or os.path.basename(folder) != TILE_STACK_FOLDERNAME:
+        return None
+    return folder, int(grid_id)
+
+
+def is_tile_reference(image_path):
+    return parse_tile_reference(image_path) is not None
+
+
+def read_stacked_tile(image_path):
+    """
+    Tile of a stacked tile reference, as a read-only view of the memory map
+
+    :return: H x W x 3 BGR array, or None if the stack or the tile does not exist
+    """
+    folder, grid_id = parse_tile_reference(image_path)
+    identity = TileStack.identity(folder)
+    identity_and_stack = _readers.get(folder)
+    if identity_and_stack is not None and identity_and_stack[0] != identity:
+        # The stack was deleted or recreated since it was opened
+        _readers.pop(folder)[1].close()
+        identity_and_stack = None
+    if identity is None:
+        return None
+    if identity_and_stack is None:
+        identity_and_stack = _readers.setdefault(folder, (identity, TileStack(folder)))
+    return identity_and_stack[1].get(grid_id)
+
+
+class TileStack:
+    def __init__(self, folder, writable=False):
+        """
+        Open an existing tile stack (see create() and open_or_create())
+
+        :param folder: Stack folder, see tile_stack_path_for()
+        :param writable: Open for put(); readers see the tiles written by other handles
+        """
+        self.folder = folder
+        self.writable = writable
+        mode = "r+" if writable else "r"
+        self.tiles = np.load(os.path.join(folder, TILES_FILENAME), mmap_mode=mode)
+        self.grid_ids = np.load(os.path.join(folder, GRID_IDS_FILENAME), mmap_mode=mode)
+        self._lock = threading.Lock()
+        self._refresh_index()
+
+    @staticmethod
+    def exists(folder):
+        return os.path.exists(os.path.join(folder, GRID_IDS_FILENAME))
+
+    @staticmethod
+    def identity(folder):
+        """Identity of the files of a stack (inode and modification time), None if it does not exist."""
+        try:
+            tiles = os.stat(os.path.join(folder, TILES_FILENAME))
+            grid_ids = os.stat(os.path.join(folder, GRID_IDS_FILENAME))
+        except OSError:
+            return None
+        return tiles.st_ino, tiles.st_mtime_ns, grid_ids.st_ino, grid_ids.st_mtime_ns
+
+    @classmethod
+    def create(cls, folder, capacity, tile_shape):
+        """
+        Create an empty stack; the files are sparse, so unused slots take no disk space
+
+        :param capacity: Number of tiles
+        :param tile_shape: (height, width, 3)
+        """
+        os.makedirs(folder, exist_ok=True)
+        tiles = np.lib.format.open_memmap(
+            os.path.join(folder, TILES_FILENAME), mode="w+", dtype=np.uint8, shape=(capacity,) + tuple(tile_shape)
+        )
+        del tiles
+        grid_ids = np.lib.format.open_memmap(
+            os.path.join(folder, GRID_IDS_FILENAME), mode="w+", dtype=np.int64, shape=(capacity,)
+        )
+        grid_ids[:] = FREE_SLOT
+        grid_ids.flush()
+        del grid_ids
+        return cls(folder, writable=True)
+
+    @classmethod
+    def open_or_create(cls, folder, capacity, tile_shape):
+        """
+        Open a stack for writing, creating it if needed
+
+        :raises ValueError: If an existing stack has another tile shape or fewer slots
+        """
+        if not cls.exists(folder):
+            return cls.create(folder, capacity, tile_shape)
+
+        stack = cls(folder, writable=True)
+        stored_capacity, stored_shape = stack.capacity, stack.tile_shape
+        if stored_shape != tuple(tile_shape) or stored_capacity < capacity:
+            stack.close()
+            raise ValueError(
+                f"Tile stack {folder} holds {stored_capacity} tiles of {stored_shape}, "
+                f"{capacity} tiles of {tuple(tile_shape)} are needed; delete it to start a new one"
+            )
+        return stack
+
+    @property
+    def capacity(self):
+        return len(self.grid_ids)
+
+    @property
+    def tile_shape(self):
+        return tuple(self.tiles.shape[1:])
+
+    def _refresh_index(self):
+        grid_ids = np.asarray(self.grid_ids)
+        used = np.flatnonzero(grid_ids != FREE_SLOT)
+        with self._lock:
+            self._slots = dict(zip(grid_ids[used].tolist(), used.tolist()))
+            self._next_slot = int(used[-1]) + 1 if len(used) else 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, grid_id):
+        return self.slot(grid_id) is not None
+
+    def slot(self, grid_id):
+        """Slot of a cell; the index is reloaded once if another handle may have added it."""
+        slot = self._slots.get(grid_id)
+        if slot is None and not self.writable:
+            self._refresh_index()
+            slot = self._slots.get(grid_id)
+        return slot
+
+    def put(self, grid_id, image):
+        """
+        Write a tile; a cell written again keeps its slot
+
+        :param image: H x W x 3 BGR array
+        :return: Slot index
+        """
+        if tuple(image.shape) != self.tile_shape:
+            raise ValueError(f"Tile of Cell {grid_id} is {tuple(image.shape)}, the stack holds {self.tile_shape}")
+        with self._lock:
+            slot = self._slots.get(grid_id)
+            if slot is None:
+                if self._next_slot >= self.capacity:
+                    raise ValueError(f"Tile stack {self.folder} is full ({self.capacity} tiles)")
+                slot = self._next_slot
+                self._next_slot += 1
+            self.tiles[slot] = image
+            # Id last, so a reader never finds a slot before its pixels
+            self.grid_ids[slot] = grid_id
+            self._slots[grid_id] = slot
+        return slot
+
+    def get(self, grid_id):
+        """Tile of a cell as a view of the memory map (no copy), or None."""
+        slot = self.slot(grid_id)
+        return None if slot is None else self.tiles[slot]
+
+    def batches(self, grid_ids, batch_size=16):
+        """
+        Group cells into batches of consecutive slots
+
+        :param grid_ids: Cells to read; cells missing from the stack are skipped
+        :param batch_size: Maximum number of tiles per batch
+        :return: Iterator of (grid ids, tiles); tiles is a B x H x W x 3 view of the memory map
+        """
+        self._refresh_index()
+        slots = sorted(slot for slot in map(self._slots.get, grid_ids) if slot is not None)
+        start = 0
+        while start < len(slots):
+            end = start + 1
+            while end < len(slots) and end - start < batch_size and slots[end] == slots[end - 1] + 1:
+                end += 1
+            first, last = slots[start], slots[end - 1] + 1
+            yield self.grid_ids[first:last].tolist(), self.tiles[first:last]
+            start = end
+
+    def flush(self):
+        if self.writable:
+            self.tiles.flush()
+            self.grid_ids.flush()
+
+    def close(self):
+        """Flush and release the memory maps."""
+        self.flush()
+        self.tiles = None
+        self.grid_ids = None
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtGui import QImage
+from .profiling import span
+from .tile_stack import parse_tile_reference
+
+# Supported output formats and their file extensions
+TILE_FORMATS = {
+    "png": ".png",
+    "webp": ".webp",  # Written lossless
+    "npy": ".npy",  # Raw BGR array, loads without decoding
+    "stack": "",  # Raw BGR slot of a TileStack, the path is a tile reference
+}
+
+
+class TileWriter:
+    def __init__(self, image_format="png", compression_level=1, max_queue_size=8, on_written=None, tile_stack=None):
+        """
+        Encode and write rendered tiles on a background thread
+
+        The render loop hands over the rendered QImage and moves on; encoding
+        and disk I/O happen here. The queue is bounded, so a slow disk slows
+        rendering down (backpressure) instead of piling up images in memory.
+
+        :param image_format: One of TILE_FORMATS
+        :param compression_level: PNG zlib level, 0 (none) to 9 (smallest)
+        :param max_queue_size: Number of rendered tiles allowed to wait for encoding
+        :param on_written: Called from the writer thread as on_written(path, context)
+        :param tile_stack: TileStack receiving the tiles of the "stack" format
+        """
+        if image_format not in TILE_FORMATS:
+            raise ValueError(f"Unsupported tile format '{image_format}', expected one of {list(TILE_FORMATS)}")
+        if image_format == "stack" and tile_stack is None:
+            raise ValueError("The 'stack' tile format needs a TileStack")
+
+        self.image_format = image_format
+        self.compression_level = compression_level
+        self.on_written = on_written
+        self.tile_stack = tile_stack
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+        self.tiles_written = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.blocked_submits = 0
+        self.errors = []
+
+        self._thread = threading.Thread(target=self._run, name="TileWriter", daemon=True)
+        self._thread.start()
+
+    @property
+    def extension(self):
+        """File extension of the tiles written."""
+        return TILE_FORMATS[self.image_format]
+
+    def submit(self, image, path, context=None):
+        """
+        Queue a rendered image for writing; blocks while the queue is full
+
+        :param image: Rendered QImage
+        :param path: Destination path
+        :param context: Passed back to on_written
+        """
+        if self.queue.full():
+            self.blocked_submits += 1
+        start = time.perf_counter()
+        self.queue.put((image, path, context))
+        self.blocked_seconds += time.perf_counter() - start
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            image, path, context = item
+            try:
+                start = time.perf_counter()
+                with span("encode", "capture", format=self.image_format):
+                    self.bytes_written += self._write(image, path)
+                self.encode_seconds += time.perf_counter() - start
+                self.tiles_written += 1
+            except Exception as e:
+                self.errors.append((path, str(e)))
+                print(f"Failed to write tile {path}: {str(e)}")
+                continue
+
+            if self.on_written is not None:
+                self.on_written(path, context)
+
+    @staticmethod
+    def _to_bgr(image):
+        """BGR array of a QImage, like cv2.imread, so the classifier can use it as is."""
+        image = image.convertToFormat(QImage.Format_RGB888)
+        width, height = image.width(), image.height()
+        bits = image.constBits()
+        bits.setsize(image.bytesPerLine() * height)
+        rgb = np.frombuffer(bits, np.uint8).reshape(height, image.bytesPerLine())[:, :width * 3]
+        return np.ascontiguousarray(rgb.reshape(height, width, 3)[:, :, ::-1])
+
+    def _write(self, image, path):
+        """Write one tile; returns the number of bytes written."""
+        if self.image_format == "stack":
+            bgr = self._to_bgr(image)
+            self.tile_stack.put(parse_tile_reference(path)[1], bgr)
+            return bgr.nbytes
+
+        # Write under a temporary name so a crash never leaves a truncated tile
+        temporary_path = path + ".part"
+
+        if self.image_format == "npy":
+            with open(temporary_path, "wb") as f:
+                np.save(f, self._to_bgr(image))
+        else:
+            # Rendered tiles are opaque, drop the alpha channel
+            image = image.convertToFormat(QImage.Format_RGB32)
+            if self.image_format == "png":
+                # Qt maps quality 100..0 onto zlib levels 0..9
+                quality = 100 - 11 * self.compression_level
+            else:
+                quality = 100  # Lossless WebP
+            if not image.save(temporary_path, self.image_format.upper(), quality):
+                raise IOError(f"Qt could not encode {self.image_format}")
+
+        os.replace(temporary_path, path)
+        return os.path.getsize(path)
+
+    def close(self):
+        """Wait for every queued tile to be written."""
+        self.queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        """
+        Writer counters for reporting
+
+        :return: dict of counters
+        """
+        return {
+            "tiles_written": self.tiles_written,
+            "bytes_written": self.bytes_written,
+            "encode_seconds": round(self.encode_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "blocked_submits": self.blocked_submits,
+            "errors": len(self.errors),
+        }
@@ -0,0 +1,117 @@
+import glob
+import hashlib
+import os
+from qgis.core import QgsCoordinateTransformContext, QgsVectorFileWriter, QgsVectorLayer
+
+# "gpkg": local GeoPackage copy with an R-tree index
+# "qix": build a QGIS/OGR .qix spatial index next to the shapefile
+WORKING_COPY_MODES = ("gpkg", "qix")
+
+
+def source_signature(layer_path):
+    """
+    Signature of a shapefile's components (mtime and size of each)
+
+    :param layer_path: Path to the .shp file
+    :return: str that changes whenever the source data changes
+    """
+    base = os.path.splitext(layer_path)[0]
+    parts = []
+    for extension in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+        path = base + extension
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{extension}:{stat.st_mtime_ns}:{stat.st_size}")
+    return "|".join(parts)
+
+
+class WorkingCopyCache:
+    def __init__(self, cache_folder="Working_Copies", mode="gpkg"):
+        """
+        Indexed working copies of the input shapefiles
+
+        ESRI .sbn/.sbx indexes shipped with the inputs are ignored by OGR, so
+        without this every spatial filter scans the whole layer.
+
+        :param cache_folder: Folder holding the GeoPackage copies
+        :param mode: One of WORKING_COPY_MODES
+        """
+        if mode not in WORKING_COPY_MODES:
+            raise ValueError(f"Unsupported working copy mode '{mode}', expected one of {list(WORKING_COPY_MODES)}")
+        self.cache_folder = cache_folder
+        self.mode = mode
+
+    def _copy_prefix(self, layer_path):
+        # Avant and Apres folders hold files with the same name
+        stem = os.path.splitext(os.path.basename(layer_path))[0]
+        path_hash = hashlib.sha1(os.path.abspath(layer_path).encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.cache_folder, f"{stem}_{path_hash}")
+
+    def working_copy_path(self, layer_path):
+        """
+        GeoPackage path of the working copy for the current state of a source
+
+        :param layer_path: Path to the .shp file
+        :return: Path to the .gpkg file
+        """
+        signature_hash = hashlib.sha1(source_signature(layer_path).encode("utf-8")).hexdigest()[:12]
+        return f"{self._copy_prefix(layer_path)}_{signature_hash}.gpkg"
+
+    def prepare(self, layer_path):
+        """
+        Make sure an indexed version of a source exists and return the path to open
+
+        :param layer_path: Path to the .shp file
+        :return: Path of the data source to load
+        """
+        if self.mode == "qix":
+            return self._ensure_qix(layer_path)
+        return self._ensure_gpkg(layer_path)
+
+    def _ensure_qix(self, layer_path):
+        qix_path = os.path.splitext(layer_path)[0] + ".qix"
+        if os.path.exists(qix_path) and os.path.getmtime(qix_path) >= os.path.getmtime(layer_path):
+            return layer_path
+
+        layer = QgsVectorLayer(layer_path, "index", "ogr")
+        if layer.isValid() and layer.dataProvider().createSpatialIndex():
+            print(f"Built spatial index {qix_path}")
+        else:
+            # Read-only shares: keep going without an index
+            print(f"Could not build a spatial index for {layer_path}")
+        return layer_path
+
+    def _ensure_gpkg(self, layer_path):
+        copy_path = self.working_copy_path(layer_path)
+        if os.path.exists(copy_path):
+            print(f"Reusing working copy {copy_path}")
+            return copy_path
+
+        os.makedirs(self.cache_folder, exist_ok=True)
+        source = QgsVectorLayer(layer_path, "source", "ogr")
+        if not source.isValid():
+            return layer_path
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.fileEncoding = "UTF-8"
+        options.layerName = os.path.splitext(os.path.basename(layer_path))[0]
+        options.layerOptions = ["SPATIAL_INDEX=YES"]
+
+        # Write next to the final name and rename, so a crash never leaves a partial copy
+        temporary_path = copy_path[:-len(".gpkg")] + "_tmp.gpkg"
+        result = QgsVectorFileWriter.writeAsVectorFormatV3(
+            source, temporary_path, QgsCoordinateTransformContext(), options
+        )
+        if result[0] != QgsVectorFileWriter.NoError:
+            print(f"Could not create a working copy of {layer_path}: {result[1]}")
+            return layer_path
+        os.replace(temporary_path, copy_path)
+
+        # Drop copies made from older versions of the same source
+        for stale_path in glob.glob(f"{glob.escape(self._copy_prefix(layer_path))}_*.gpkg"):
+            if stale_path != copy_path:
+                os.remove(stale_path)
+
+        print(f"Created working copy {copy_path}")
+        return copy_path